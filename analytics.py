@@ -0,0 +1,348 @@
+"""
+Агрегация логов цен в бары (OHLC по mid, средний спред, доля наличия bid/ask).
+
+Агрегация векторизована на NumPy, рынки обрабатываются параллельно в пуле
+процессов. Результат дописывается в `{out_dir}/{slug}_{period}.jsonl`, а
+позиция обработки сохраняется в `{slug}_{period}.checkpoint` - повторный
+запуск обрабатывает только новые данные. Если процесс прервался между
+дозаписью баров и сохранением позиции, позиция восстанавливается по
+последнему полному бару в файле (недописанная строка отбрасывается), так что
+бары не дублируются.
+
+Использование:
+    python analytics.py bars logs/ --out bars/ --periods 1m,1h --workers 4
+
+Требует numpy (pip install numpy).
+"""
+import os
+import re
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterable, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - опциональная зависимость
+    np = None
+
+from storage import PathLike, iter_log_files, iter_log_records
+
+PERIOD_RE = re.compile(r"^(?P<value>\d+)(?P<unit>s|m|min|h)$")
+UNIT_SECONDS = {'s': 1, 'm': 60, 'min': 60, 'h': 3600}
+
+US_PER_SECOND = 1_000_000
+SECONDS_PER_DAY = 24 * 3600
+
+
+def parse_period(period: str) -> int:
+    """
+    Период бара ("30s", "1m", "5min", "1h") в секундах.
+
+    Сутки должны делиться на период без остатка: файлы обрабатываются по дням,
+    и бар, переходящий через полночь, потерял бы записи следующего дня.
+    """
+    match = PERIOD_RE.match(period.strip())
+    if not match:
+        raise ValueError(f"Неверный период: {period}")
+    seconds = int(match.group('value')) * UNIT_SECONDS[match.group('unit')]
+    if seconds <= 0 or SECONDS_PER_DAY % seconds:
+        raise ValueError(f"Период {period} не делит сутки без остатка (например 1m, 5m, 15m, 1h, 24h)")
+    return seconds
+
+
+def records_to_arrays(records: Iterable[Dict[str, Any]]) -> Dict[str, "np.ndarray"]:
+    """
+    Записи лога -> массивы: ts (int64, мкс), bid/ask/mid (float64, NaN вместо пропусков).
+
+    Записи без timestamp или с неразбираемым временем пропускаются (как в query).
+    """
+    timestamps: List[datetime] = []
+    columns: Dict[str, List[float]] = {'bid': [], 'ask': [], 'mid': []}
+    for record in records:
+        try:
+            ts = datetime.fromisoformat(record['timestamp'])
+        except (ValueError, KeyError, TypeError):
+            continue
+        # Время с поясом приводится к UTC - шкала колонки ts без пояса
+        timestamps.append(ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts)
+        for name, values in columns.items():
+            value = record.get(name)
+            values.append(np.nan if value is None else value)
+
+    arrays = {'ts': np.array(timestamps, dtype='datetime64[us]').astype(np.int64)}
+    for name, values in columns.items():
+        arrays[name] = np.array(values, dtype=np.float64)
+    return arrays
+
+
+def resample(arrays: Dict[str, "np.ndarray"], period_seconds: int) -> Dict[str, "np.ndarray"]:
+    """
+    Векторизованная агрегация в бары.
+
+    Returns:
+        dict массивов по барам: start (int64, мкс), open/high/low/close (mid),
+        spread_avg, bid_ratio, ask_ratio, count
+    """
+    ts = arrays['ts']
+    if ts.size == 0:
+        return {}
+
+    order = np.argsort(ts, kind='stable')
+    ts = ts[order]
+    bid = arrays['bid'][order]
+    ask = arrays['ask'][order]
+    mid = arrays['mid'][order]
+
+    period_us = period_seconds * US_PER_SECOND
+    buckets = ts // period_us
+    starts_idx = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends_idx = np.r_[starts_idx[1:], ts.size]
+    counts = ends_idx - starts_idx
+
+    # OHLC по mid без учета пропусков
+    has_mid = ~np.isnan(mid)
+    mid_counts = np.add.reduceat(has_mid.astype(np.int64), starts_idx)
+    high = np.maximum.reduceat(np.where(has_mid, mid, -np.inf), starts_idx)
+    low = np.minimum.reduceat(np.where(has_mid, mid, np.inf), starts_idx)
+
+    positions = np.arange(ts.size)
+    first_pos = np.minimum.reduceat(np.where(has_mid, positions, ts.size), starts_idx)
+    last_pos = np.maximum.reduceat(np.where(has_mid, positions, -1), starts_idx)
+    safe_mid = np.r_[mid, np.nan]
+    open_ = safe_mid[first_pos]
+    close = safe_mid[np.where(last_pos >= 0, last_pos, ts.size)]
+
+    empty = mid_counts == 0
+    high[empty] = np.nan
+    low[empty] = np.nan
+
+    # Средний спред по записям, где есть обе стороны
+    spread = ask - bid
+    has_spread = ~np.isnan(spread)
+    spread_sum = np.add.reduceat(np.where(has_spread, spread, 0.0), starts_idx)
+    spread_count = np.add.reduceat(has_spread.astype(np.int64), starts_idx)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        spread_avg = np.where(spread_count > 0, spread_sum / np.maximum(spread_count, 1), np.nan)
+
+    bid_ratio = np.add.reduceat((~np.isnan(bid)).astype(np.int64), starts_idx) / counts
+    ask_ratio = np.add.reduceat((~np.isnan(ask)).astype(np.int64), starts_idx) / counts
+
+    return {
+        'start': buckets[starts_idx] * period_us,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'spread_avg': spread_avg,
+        'bid_ratio': bid_ratio,
+        'ask_ratio': ask_ratio,
+        'count': counts,
+    }
+
+
+def _bar_rows(bars: Dict[str, "np.ndarray"], limit: Optional[int] = None) -> Iterable[Dict[str, Any]]:
+    n = len(bars['start']) if limit is None else limit
+    starts = bars['start'][:n].astype('datetime64[us]').astype(str)
+    for i in range(n):
+        row: Dict[str, Any] = {'start': starts[i]}
+        for name in ('open', 'high', 'low', 'close', 'spread_avg', 'bid_ratio', 'ask_ratio'):
+            value = float(bars[name][i])
+            row[name] = None if np.isnan(value) else round(value, 6)
+        row['count'] = int(bars['count'][i])
+        yield row
+
+
+class Checkpoint:
+    """Позиция обработки рынка для периода: время (мкс) конца последнего записанного бара"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self) -> Optional[int]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return int(json.load(f)['processed_until_us'])
+        except (OSError, ValueError, KeyError, json.JSONDecodeError):
+            return None
+
+    def save(self, processed_until_us: int) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'processed_until_us': processed_until_us,
+                       'processed_until': str(np.datetime64(processed_until_us, 'us'))}, f)
+        os.replace(tmp, self.path)
+
+
+def last_bar_end(path: Path, period_seconds: int) -> Optional[int]:
+    """
+    Время (мкс) конца последнего полного бара в файле баров или None.
+
+    Недописанная последняя строка (прерванная запись) обрезается.
+    """
+    try:
+        f = open(path, 'r+b')
+    except FileNotFoundError:
+        return None
+
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        # Чтение с конца блоками до начала последней полной строки
+        tail = b""
+        position = size
+        while position > 0 and tail.count(b"\n") < 2:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+
+        complete, _, partial = tail.rpartition(b"\n")
+        if partial:
+            f.truncate(size - len(partial))
+        if not complete:
+            return None
+
+        line = complete.rsplit(b"\n", 1)[-1]
+        start = np.datetime64(json.loads(line)['start'], 'us').astype(np.int64)
+        return int(start) + period_seconds * US_PER_SECOND
+
+
+def process_slug(slug: str, files: List[Tuple[str, str]], out_dir: str, periods: List[str]) -> Dict[str, int]:
+    """
+    Агрегация одного рынка (выполняется в процессе пула).
+
+    Файлы обрабатываются по дням; последний бар текущего дня не записывается,
+    пока день не закрыт (он может быть неполным).
+
+    Returns:
+        dict: период -> количество записанных баров
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    today = date.today().isoformat()
+
+    period_state = []
+    for period in periods:
+        period_seconds = parse_period(period)
+        checkpoint = Checkpoint(out / f"{slug}_{period}.checkpoint")
+        processed_until = checkpoint.load()
+        # Бары могли быть дописаны без сохранения позиции (прерванный запуск)
+        bars_end = last_bar_end(out / f"{slug}_{period}.jsonl", period_seconds)
+        if bars_end is not None and (processed_until is None or bars_end > processed_until):
+            processed_until = bars_end
+            checkpoint.save(processed_until)
+        period_state.append((period, period_seconds, checkpoint, processed_until))
+
+    written = {period: 0 for period in periods}
+    min_checkpoint = min((cp for _, _, _, cp in period_state if cp is not None), default=None)
+    if any(cp is None for _, _, _, cp in period_state):
+        min_checkpoint = None
+
+    for date_str, path_str in files:
+        if min_checkpoint is not None:
+            day_end = (np.datetime64(date_str, 'D') + 1).astype('datetime64[us]').astype(np.int64)
+            if day_end <= min_checkpoint:
+                continue
+
+        arrays = records_to_arrays(iter_log_records(path_str))
+        if arrays['ts'].size == 0:
+            continue
+
+        for i, (period, period_seconds, checkpoint, processed_until) in enumerate(period_state):
+            if processed_until is not None:
+                mask = arrays['ts'] >= processed_until
+                if not mask.any():
+                    continue
+                day_arrays = {name: values[mask] for name, values in arrays.items()}
+            else:
+                day_arrays = arrays
+
+            bars = resample(day_arrays, period_seconds)
+            if not bars:
+                continue
+
+            n = len(bars['start'])
+            if date_str >= today:
+                n -= 1
+            if n <= 0:
+                continue
+
+            with open(out / f"{slug}_{period}.jsonl", 'a', encoding='utf-8') as f:
+                for row in _bar_rows(bars, n):
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+            processed_until = int(bars['start'][n - 1]) + period_seconds * US_PER_SECOND
+            checkpoint.save(processed_until)
+            period_state[i] = (period, period_seconds, checkpoint, processed_until)
+            written[period] += n
+
+    return written
+
+
+def build_bars(output_dir: PathLike, out_dir: PathLike, periods: List[str],
+               slugs: Optional[List[str]] = None, workers: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Агрегация всех рынков из директории логов в пуле процессов.
+
+    Returns:
+        dict: slug -> {период: количество записанных баров}
+    """
+    if np is None:
+        raise RuntimeError("Для агрегации требуется numpy: pip install numpy")
+
+    for period in periods:
+        parse_period(period)
+
+    files_by_slug: Dict[str, List[Tuple[str, str]]] = {}
+    for slug, date_str, path in iter_log_files(output_dir):
+        if slugs and slug not in slugs:
+            continue
+        files_by_slug.setdefault(slug, []).append((date_str, str(path)))
+
+    results: Dict[str, Dict[str, int]] = {}
+    if not files_by_slug:
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_slug, slug, files, str(out_dir), periods): slug
+                   for slug, files in files_by_slug.items()}
+        for future in as_completed(futures):
+            slug = futures[future]
+            try:
+                results[slug] = future.result()
+                print(f"[Analytics] {slug}: {results[slug]}")
+            except Exception as e:
+                print(f"[Analytics] Ошибка обработки {slug}: {e}")
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Агрегация логов цен в бары")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_bars = sub.add_parser('bars', help="Построение баров (инкрементально)")
+    p_bars.add_argument('output_dir', help="Директория с логами")
+    p_bars.add_argument('--out', default="bars", help="Директория для баров")
+    p_bars.add_argument('--periods', default="1m,1h", help="Периоды через запятую (например 1m,5m,1h)")
+    p_bars.add_argument('--slug', action='append', help="Рынок (можно указать несколько раз)")
+    p_bars.add_argument('--workers', type=int, default=None, help="Количество процессов")
+
+    args = parser.parse_args(argv)
+
+    try:
+        results = build_bars(args.output_dir, args.out, args.periods.split(','), args.slug, args.workers)
+        total = sum(sum(r.values()) for r in results.values())
+        print(f"[Analytics] Рынков: {len(results)}, баров записано: {total}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,482 @@
 import requests
-from typing import Optional, Dict, Any, List, Union
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, List, Tuple, Union
+from threading import Lock
+from urllib.parse import urlparse
 import json
+import random
+import time
+
+from metrics import get_metrics
 
 # API endpoints
 GAMMA_API_BASE = "https://gamma-api.polymarket.com"
 CLOB_API_BASE = "https://clob.polymarket.com"
 
-def get_market_details(market_id: str) -> Optional[Dict[str, Any]]:
+# Максимальное количество токенов в одном запросе к /prices
+DEFAULT_PRICE_BATCH_SIZE = 100
+
+# Коды ответа, при которых запрос повторяется с задержкой
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
     """
-    Получает детали рынка через Gamma API.
+    Ограничитель частоты запросов (token bucket).
 
-    Args:
-        market_id: Slug рынка (например, "will-joo-cotrim-figueiredo-win-the-2026-portugal-presidential-election-643")
+    `rate` токенов в секунду, не более `capacity` накопленных токенов.
+    Потокобезопасен: один экземпляр разделяется всеми потоками мониторов.
+    Запрос больше `capacity` токенов никогда не был бы выполнен - ValueError.
+    """
 
-    Returns:
-        dict: Данные рынка или None при ошибке
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def _check(self, tokens: float) -> None:
+        if tokens > self.capacity:
+            raise ValueError(f"Запрошено токенов больше емкости ограничителя: {tokens:g} > {self.capacity:g}")
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Неблокирующая попытка получить токены"""
+        if self.rate <= 0:
+            return True
+        self._check(tokens)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Блокирует до получения токенов. Возвращает время ожидания в секундах."""
+        if self.rate <= 0:
+            return 0.0
+        self._check(tokens)
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+
+                delay = (tokens - self._tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+class PolymarketClient:
+    """
+    Общий HTTP клиент для Gamma и CLOB API.
+
+    - Пул соединений с keep-alive (requests.Session + HTTPAdapter)
+    - Повтор запросов при 429/5xx и сетевых ошибках с экспоненциальной задержкой и jitter
+    - Ограничение частоты запросов отдельно для каждого хоста API
     """
-    try:
-        # Получаем по slug
-        url = f"{GAMMA_API_BASE}/markets"
-        params = {"slug": market_id}
 
-        # Use a timeout for network operations
-        response = requests.get(url, params=params, timeout=10)
+    def __init__(self,
+                 gamma_base: Optional[str] = None,
+                 clob_base: Optional[str] = None,
+                 pool_size: int = 20,
+                 max_retries: int = 3,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 10.0,
+                 gamma_rate_limit: float = 20.0,
+                 clob_rate_limit: float = 50.0,
+                 timeout: float = 10.0):
+        self.gamma_base = gamma_base or GAMMA_API_BASE
+        self.clob_base = clob_base or CLOB_API_BASE
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, int(pool_size)), max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.rate_limiters: Dict[str, TokenBucket] = {
+            urlparse(self.gamma_base).netloc: TokenBucket(gamma_rate_limit),
+            urlparse(self.clob_base).netloc: TokenBucket(clob_rate_limit),
+        }
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "PolymarketClient":
+        """Создание клиента по разделу `settings` конфигурации"""
+        settings = settings or {}
+        return cls(
+            gamma_base=settings.get('gamma_api_base'),
+            clob_base=settings.get('clob_api_base'),
+            pool_size=settings.get('http_pool_size', 20),
+            max_retries=settings.get('http_max_retries', 3),
+            backoff_base=settings.get('http_backoff_base_seconds', 0.5),
+            backoff_max=settings.get('http_backoff_max_seconds', 10.0),
+            gamma_rate_limit=settings.get('gamma_rate_limit_per_second', 20.0),
+            clob_rate_limit=settings.get('clob_rate_limit_per_second', 50.0),
+            timeout=settings.get('http_timeout_seconds', 10.0),
+        )
+
+    def _backoff_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(self.backoff_max, float(retry_after))
+                except ValueError:
+                    pass
+        # Full jitter: случайная задержка в пределах экспоненциального окна
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Выполнение HTTP запроса с ограничением частоты и повторами.
+
+        После исчерпания попыток возвращает последний ответ (или пробрасывает
+        последнее сетевое исключение) - обработка статуса остается за вызывающим.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        parsed = urlparse(url)
+        limiter = self.rate_limiters.get(parsed.netloc)
+        metrics = get_metrics()
+
+        attempt = 0
+        while True:
+            if limiter is not None:
+                limiter.acquire()
+
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.http_latency.labels(parsed.path).observe(time.perf_counter() - started)
+                metrics.http_requests.labels(parsed.path, "error").inc()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                print(f"Сетевая ошибка ({e.__class__.__name__}), повтор через {delay:.1f}с")
+            else:
+                metrics.http_latency.labels(parsed.path).observe(time.perf_counter() - started)
+                metrics.http_requests.labels(parsed.path, response.status_code).inc()
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                delay = self._backoff_delay(attempt, response)
+                print(f"Ошибка API {response.status_code} ({parsed.path}), повтор через {delay:.1f}с")
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        """Закрытие пула соединений"""
+        self.session.close()
+
+    def get_market_details(self, market_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Получает детали рынка через Gamma API.
+
+        Args:
+            market_id: Slug рынка (например, "will-joo-cotrim-figueiredo-win-the-2026-portugal-presidential-election-643")
 
-        if response.status_code == 200:
+        Returns:
+            dict: Данные рынка или None при ошибке
+        """
+        try:
+            # Получаем по slug
+            url = f"{self.gamma_base}/markets"
+            params = {"slug": market_id}
+
+            response = self.request("GET", url, params=params)
+
+            if response.status_code == 200:
+                data = response.json()
+                # API возвращает массив, берем первый элемент
+                if isinstance(data, list) and len(data) > 0:
+                    return data[0]
+                print(f"Ошибка: рынок '{market_id}' не найден")
+                return None
+            else:
+                print(f"Ошибка API (get_market_details): {response.status_code}")
+                return None
+
+        except Exception as e:
+            print(f"Ошибка при получении деталей рынка: {e}")
+            return None
+
+    def list_markets(self, params: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Страница списка рынков Gamma API (GET /markets с фильтрами limit, offset, active, closed, tag_id...).
+
+        Returns:
+            list: Рынки страницы или None при ошибке
+        """
+        return self._get_list(f"{self.gamma_base}/markets", params, "list_markets")
+
+    def list_events(self, params: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Список событий Gamma API (GET /events); каждое событие содержит свои рынки в поле `markets`.
+
+        Returns:
+            list: События или None при ошибке
+        """
+        return self._get_list(f"{self.gamma_base}/events", params, "list_events")
+
+    def _get_list(self, url: str, params: Optional[Dict[str, Any]], name: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            response = self.request("GET", url, params=params)
+            if response.status_code != 200:
+                print(f"Ошибка API ({name}): {response.status_code}")
+                return None
             data = response.json()
-            # API возвращает массив, берем первый элемент
-            if isinstance(data, list) and len(data) > 0:
-                return data[0]
-            print(f"Ошибка: рынок '{market_id}' не найден")
+            if not isinstance(data, list):
+                print(f"Ошибка API ({name}): неожиданный формат ответа")
+                return None
+            return data
+        except Exception as e:
+            print(f"Ошибка при запросе списка ({name}): {e}")
             return None
-        else:
-            print(f"Ошибка API (get_market_details): {response.status_code}")
+
+    def get_current_price(self, token_id: str) -> Optional[Dict[str, Optional[float]]]:
+        """
+        Получает текущие цены для токена через CLOB API.
+
+        Args:
+            token_id: ID токена
+
+        Returns:
+            dict: Данные цен (bid, ask, mid) или None при ошибке
+        """
+        try:
+            url = f"{self.clob_base}/price"
+
+            # Получаем bid (цена покупки)
+            response_buy = self.request("GET", url, params={"token_id": token_id, "side": "buy"})
+            # Получаем ask (цена продажи)
+            response_sell = self.request("GET", url, params={"token_id": token_id, "side": "sell"})
+
+            if response_buy.status_code == 200 and response_sell.status_code == 200:
+                bid_data = response_buy.json()
+                ask_data = response_sell.json()
+
+                # Получаем цены
+                bid = float(bid_data.get('price', 0)) if bid_data.get('price') else None
+                ask = float(ask_data.get('price', 0)) if ask_data.get('price') else None
+
+                # Вычисляем mid
+                mid = None
+                if bid is not None and ask is not None:
+                    mid = (bid + ask) / 2
+
+                return {
+                    'bid': bid,
+                    'ask': ask,
+                    'mid': mid
+                }
+            else:
+                print(f"Ошибка API цен: buy={response_buy.status_code}, sell={response_sell.status_code}")
+                return None
+
+        except Exception as e:
+            print(f"Ошибка при получении цен: {e}")
             return None
 
-    except Exception as e:
-        print(f"Ошибка при получении деталей рынка: {e}")
-        return None
+    def get_current_prices(self, token_ids: List[str],
+                           batch_size: int = DEFAULT_PRICE_BATCH_SIZE) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Получает текущие цены для нескольких токенов пакетными запросами к CLOB API (POST /prices).
+
+        Один запрос возвращает обе стороны (buy/sell) для `batch_size` токенов,
+        вместо двух запросов на каждый токен в get_current_price.
+
+        Args:
+            token_ids: Список ID токенов
+            batch_size: Максимальное количество токенов в одном запросе
+
+        Returns:
+            dict: token_id -> данные цен (bid, ask, mid). Токены, для которых
+            не удалось получить цены, отсутствуют в результате.
+        """
+        results: Dict[str, Dict[str, Optional[float]]] = {}
+        unique_ids = list(dict.fromkeys(t for t in token_ids if t))
+        batch_size = max(1, int(batch_size))
+
+        url = f"{self.clob_base}/prices"
+
+        for start in range(0, len(unique_ids), batch_size):
+            chunk = unique_ids[start:start + batch_size]
+            body = []
+            for token_id in chunk:
+                body.append({"token_id": token_id, "side": "BUY"})
+                body.append({"token_id": token_id, "side": "SELL"})
+
+            try:
+                response = self.request("POST", url, json=body)
+
+                if response.status_code != 200:
+                    print(f"Ошибка API цен (get_current_prices): {response.status_code}")
+                    continue
+
+                data = response.json()
+                if not isinstance(data, dict):
+                    print("Ошибка API цен (get_current_prices): неожиданный формат ответа")
+                    continue
+
+                for token_id in chunk:
+                    side_data = data.get(token_id)
+                    if not isinstance(side_data, dict):
+                        continue
+
+                    # Получаем цены
+                    bid = _price_from_side(side_data, 'BUY')
+                    ask = _price_from_side(side_data, 'SELL')
+
+                    # Вычисляем mid
+                    mid = None
+                    if bid is not None and ask is not None:
+                        mid = (bid + ask) / 2
+
+                    results[token_id] = {
+                        'bid': bid,
+                        'ask': ask,
+                        'mid': mid
+                    }
+
+            except Exception as e:
+                print(f"Ошибка при пакетном получении цен: {e}")
+
+        return results
+
+    def get_order_books(self, token_ids: List[str],
+                        batch_size: int = DEFAULT_PRICE_BATCH_SIZE) -> Dict[str, Dict[str, Any]]:
+        """
+        Получает книги заявок для нескольких токенов пакетными запросами к CLOB API (POST /books).
+
+        Args:
+            token_ids: Список ID токенов
+            batch_size: Максимальное количество токенов в одном запросе
+
+        Returns:
+            dict: token_id -> {'bids': [(price, size), ...], 'asks': [...]}; bids отсортированы
+            по убыванию цены, asks - по возрастанию (лучший уровень первый)
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        unique_ids = list(dict.fromkeys(t for t in token_ids if t))
+        batch_size = max(1, int(batch_size))
+
+        url = f"{self.clob_base}/books"
+
+        for start in range(0, len(unique_ids), batch_size):
+            chunk = unique_ids[start:start + batch_size]
+
+            try:
+                response = self.request("POST", url, json=[{"token_id": t} for t in chunk])
+
+                if response.status_code != 200:
+                    print(f"Ошибка API книги заявок (get_order_books): {response.status_code}")
+                    continue
+
+                data = response.json()
+                if not isinstance(data, list):
+                    print("Ошибка API книги заявок (get_order_books): неожиданный формат ответа")
+                    continue
+
+                for book in data:
+                    if isinstance(book, dict) and book.get('asset_id'):
+                        results[book['asset_id']] = parse_order_book(book)
+
+            except Exception as e:
+                print(f"Ошибка при пакетном получении книг заявок: {e}")
+
+        return results
+
+    def get_price_history(self, token_id: str, start_ts: int, end_ts: int,
+                          fidelity: int = 1) -> Optional[List[Tuple[int, float]]]:
+        """
+        Получает историю цены токена через CLOB API (GET /prices-history).
+
+        Args:
+            token_id: ID токена
+            start_ts: Начало интервала (unix время, секунды)
+            end_ts: Конец интервала (unix время, секунды)
+            fidelity: Шаг точек в минутах
+
+        Returns:
+            list: Точки (unix время, цена) по возрастанию времени или None при ошибке
+        """
+        try:
+            url = f"{self.clob_base}/prices-history"
+            params = {"market": token_id, "startTs": int(start_ts), "endTs": int(end_ts), "fidelity": int(fidelity)}
+
+            response = self.request("GET", url, params=params)
+
+            if response.status_code != 200:
+                print(f"Ошибка API истории цен (get_price_history): {response.status_code}")
+                return None
+
+            data = response.json()
+            history = data.get('history') if isinstance(data, dict) else None
+            if not isinstance(history, list):
+                print("Ошибка API истории цен (get_price_history): неожиданный формат ответа")
+                return None
+
+            points = [(int(point['t']), float(point['p'])) for point in history
+                      if isinstance(point, dict) and 't' in point and 'p' in point]
+            points.sort()
+            return points
+
+        except Exception as e:
+            print(f"Ошибка при получении истории цен: {e}")
+            return None
+
+
+# Общий клиент, разделяемый всеми потоками
+_default_client: Optional[PolymarketClient] = None
+_default_client_lock = Lock()
+
+
+def get_client() -> PolymarketClient:
+    """Возвращает общий клиент (создается при первом обращении)"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = PolymarketClient()
+        return _default_client
+
+
+def configure_client(settings: Optional[Dict[str, Any]] = None) -> PolymarketClient:
+    """Пересоздание общего клиента с параметрами из раздела `settings` конфигурации"""
+    global _default_client
+    client = PolymarketClient.from_settings(settings)
+    with _default_client_lock:
+        previous, _default_client = _default_client, client
+    if previous is not None:
+        previous.close()
+    return client
+
+
+def get_market_details(market_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Получает детали рынка через Gamma API.
+
+    Args:
+        market_id: Slug рынка (например, "will-joo-cotrim-figueiredo-win-the-2026-portugal-presidential-election-643")
+
+    Returns:
+        dict: Данные рынка или None при ошибке
+    """
+    return get_client().get_market_details(market_id)
 
 def get_current_price(token_id: str) -> Optional[Dict[str, Optional[float]]]:
     """
@@ -49,42 +488,50 @@ def get_current_price(token_id: str) -> Optional[Dict[str, Optional[float]]]:
     Returns:
         dict: Данные цен (bid, ask, mid) или None при ошибке
     """
-    try:
-        url = f"{CLOB_API_BASE}/price"
-        
-        # We can use a session here for efficiency if we were making many calls rapidly,
-        # but for this frequency, simple requests are fine.
-        
-        # Получаем bid (цена покупки)
-        response_buy = requests.get(url, params={"token_id": token_id, "side": "buy"}, timeout=10)
-        # Получаем ask (цена продажи)
-        response_sell = requests.get(url, params={"token_id": token_id, "side": "sell"}, timeout=10)
-
-        if response_buy.status_code == 200 and response_sell.status_code == 200:
-            bid_data = response_buy.json()
-            ask_data = response_sell.json()
-
-            # Получаем цены
-            bid = float(bid_data.get('price', 0)) if bid_data.get('price') else None
-            ask = float(ask_data.get('price', 0)) if ask_data.get('price') else None
-
-            # Вычисляем mid
-            mid = None
-            if bid is not None and ask is not None:
-                mid = (bid + ask) / 2
-
-            return {
-                'bid': bid,
-                'ask': ask,
-                'mid': mid
-            }
-        else:
-            print(f"Ошибка API цен: buy={response_buy.status_code}, sell={response_sell.status_code}")
-            return None
+    return get_client().get_current_price(token_id)
 
-    except Exception as e:
-        print(f"Ошибка при получении цен: {e}")
-        return None
+def _price_from_side(side_data: Dict[str, Any], side: str) -> Optional[float]:
+    value = side_data.get(side) or side_data.get(side.lower())
+    return float(value) if value else None
+
+def get_current_prices(token_ids: List[str], batch_size: int = DEFAULT_PRICE_BATCH_SIZE) -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    Получает текущие цены для нескольких токенов пакетными запросами к CLOB API (POST /prices).
+
+    Args:
+        token_ids: Список ID токенов
+        batch_size: Максимальное количество токенов в одном запросе
+
+    Returns:
+        dict: token_id -> данные цен (bid, ask, mid)
+    """
+    return get_client().get_current_prices(token_ids, batch_size=batch_size)
+
+def get_order_books(token_ids: List[str], batch_size: int = DEFAULT_PRICE_BATCH_SIZE) -> Dict[str, Dict[str, Any]]:
+    """
+    Получает книги заявок для нескольких токенов пакетными запросами к CLOB API (POST /books).
+
+    Returns:
+        dict: token_id -> {'bids': [(price, size), ...], 'asks': [...]}
+    """
+    return get_client().get_order_books(token_ids, batch_size=batch_size)
+
+def get_price_history(token_id: str, start_ts: int, end_ts: int, fidelity: int = 1) -> Optional[List[Tuple[int, float]]]:
+    """
+    Получает историю цены токена через CLOB API (GET /prices-history).
+
+    Returns:
+        list: Точки (unix время, цена) или None при ошибке
+    """
+    return get_client().get_price_history(token_id, start_ts, end_ts, fidelity=fidelity)
+
+def parse_order_book(book: Dict[str, Any]) -> Dict[str, List[Tuple[float, float]]]:
+    """Уровни книги заявок из ответа CLOB: лучший уровень каждой стороны первый"""
+    def levels(side: str, best_first_desc: bool) -> List[Tuple[float, float]]:
+        parsed = [(float(level['price']), float(level['size'])) for level in book.get(side) or []]
+        return sorted((level for level in parsed if level[1] > 0), reverse=best_first_desc)
+
+    return {'bids': levels('bids', True), 'asks': levels('asks', False)}
 
 def extract_token_id(market_details: Dict[str, Any]) -> Optional[str]:
     """
@@ -100,5 +547,16 @@ def extract_token_id(market_details: Dict[str, Any]) -> Optional[str]:
 
     # Берем первый токен (YES)
     token_id = token_ids[0] if isinstance(token_ids, list) and len(token_ids) > 0 else None
-    
+
     return token_id
+
+def extract_token_ids(market_details: Dict[str, Any]) -> List[str]:
+    """
+    Extracts all outcome token IDs (YES, NO) from market details.
+    """
+    clob_token_ids = market_details.get('clobTokenIds')
+    if not clob_token_ids:
+        return []
+
+    token_ids = json.loads(clob_token_ids) if isinstance(clob_token_ids, str) else clob_token_ids
+    return [t for t in token_ids if t] if isinstance(token_ids, list) else []
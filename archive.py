@@ -0,0 +1,304 @@
+"""
+Архивация дневных логов в колоночный формат Parquet.
+
+Закрытые дни (дата < сегодня) переносятся из `output_directory` в
+`{archive_dir}/slug={slug}/date={date}/part-0.parquet`:
+- timestamp хранится как timestamp[us], bid/ask/mid - как float64
+- market_slug, market_name и token_id - словарное кодирование (без повторов строк в каждой строке)
+- остальные поля записи (`keyframe`, `backfill` и др.) - JSON в колонке extra, как в sqlite_storage
+
+Использование:
+    python archive.py compact logs/ --archive-dir archive/ [--delete-source]
+    python archive.py read archive/ --slug my-market --start 2026-01-18T14:00 --end 2026-01-18T15:00
+
+Требует pyarrow (pip install pyarrow).
+"""
+import sys
+import json
+import argparse
+from datetime import datetime, date, timezone
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple, Iterable
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - опциональная зависимость
+    pa = None
+
+from storage import PathLike, iter_log_files, iter_log_records
+
+PART_FILENAME = "part-0.parquet"
+
+STRING_COLUMNS = ('market_slug', 'market_name', 'token_id')
+PRICE_COLUMNS = ('bid', 'ask', 'mid')
+EXTRA_COLUMN = 'extra'
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Для архивации требуется pyarrow: pip install pyarrow")
+
+
+def archive_schema() -> "pa.Schema":
+    """Схема архивных файлов"""
+    _require_pyarrow()
+    return pa.schema(
+        [pa.field('timestamp', pa.timestamp('us'))]
+        + [pa.field(name, pa.dictionary(pa.int32(), pa.string())) for name in STRING_COLUMNS]
+        + [pa.field(name, pa.float64()) for name in PRICE_COLUMNS]
+        + [pa.field(EXTRA_COLUMN, pa.string())]
+    )
+
+
+def _timestamp_key(value: str) -> datetime:
+    """Время записи в шкале колонки timestamp (время с поясом приводится к UTC)"""
+    ts = datetime.fromisoformat(value)
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def _extra(record: Dict[str, Any]) -> Optional[str]:
+    """Поля записи, не попадающие в типизированные колонки, в виде JSON (None - таких нет)"""
+    extra = {k: v for k, v in record.items()
+             if k != 'timestamp' and k not in STRING_COLUMNS and k not in PRICE_COLUMNS}
+    for name in PRICE_COLUMNS:
+        value = record.get(name)
+        if value is not None and not isinstance(value, (int, float)):
+            # Массивы цен событий не помещаются в числовые колонки
+            extra[name] = value
+    return json.dumps(extra, ensure_ascii=False, separators=(',', ':')) if extra else None
+
+
+def _price(value: Any) -> Optional[float]:
+    return value if value is None or isinstance(value, (int, float)) else None
+
+
+def records_to_table(records: List[Dict[str, Any]], slug: str) -> "pa.Table":
+    """Преобразование записей лога в таблицу Arrow с типизированными колонками"""
+    _require_pyarrow()
+
+    timestamps = [_timestamp_key(r['timestamp']) for r in records]
+    columns: Dict[str, Any] = {'timestamp': pa.array(timestamps, type=pa.timestamp('us'))}
+
+    # Логи polymarket_price_logger используют market_id вместо market_slug
+    slugs = [r.get('market_slug') or r.get('market_id') or slug for r in records]
+    columns['market_slug'] = pa.array(slugs, type=pa.string()).dictionary_encode()
+    for name in ('market_name', 'token_id'):
+        columns[name] = pa.array([r.get(name) for r in records], type=pa.string()).dictionary_encode()
+
+    for name in PRICE_COLUMNS:
+        columns[name] = pa.array([_price(r.get(name)) for r in records], type=pa.float64())
+    columns[EXTRA_COLUMN] = pa.array([_extra(r) for r in records], type=pa.string())
+
+    return pa.table(columns).cast(archive_schema())
+
+
+def partition_path(archive_dir: PathLike, slug: str, date_str: str) -> Path:
+    return Path(archive_dir) / f"slug={slug}" / f"date={date_str}" / PART_FILENAME
+
+
+def read_partition_records(path: PathLike) -> List[Dict[str, Any]]:
+    """
+    Записи уже заархивированной партиции в формате лога (timestamp - строка ISO).
+
+    Поля из extra возвращаются на место; пустые market_name и token_id
+    (сжатые строки режима изменений) не добавляются.
+    """
+    _require_pyarrow()
+    records = []
+    for row in pq.read_table(path).to_pylist():
+        record: Dict[str, Any] = {'timestamp': row['timestamp'].isoformat(), 'market_slug': row['market_slug']}
+        for name in ('market_name', 'token_id'):
+            if row.get(name) is not None:
+                record[name] = row[name]
+        record.update({name: row[name] for name in PRICE_COLUMNS})
+        # Архивы прежних версий не содержат колонки extra
+        if row.get(EXTRA_COLUMN):
+            record.update(json.loads(row[EXTRA_COLUMN]))
+        records.append(record)
+    return records
+
+
+def merge_records(sources: Iterable[Iterable[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Записи рынка за день из нескольких источников (уже заархивированная
+    партиция, `.json` и `.jsonl` после смены бэкенда) в порядке времени,
+    повторы по timestamp отбрасываются (сохраняется запись первого источника).
+    """
+    records: List[Dict[str, Any]] = []
+    seen = set()
+    for source in sources:
+        for record in source:
+            key = _timestamp_key(record['timestamp'])
+            if key in seen:
+                continue
+            seen.add(key)
+            records.append(record)
+    records.sort(key=lambda record: _timestamp_key(record['timestamp']))
+    return records
+
+
+def compact_file(paths: List[PathLike], slug: str, date_str: str, archive_dir: PathLike,
+                 delete_source: bool = False, compression: str = "zstd") -> int:
+    """
+    Архивация дневных файлов рынка в одну партицию. Возвращает количество строк.
+
+    Все файлы рынка за день объединяются (см. merge_records). Если партиция
+    уже существует (например, день дописан бэкфиллом после архивации), ее
+    строки объединяются с новыми, а не перезаписываются. Записанный файл
+    читается обратно: набор его timestamp должен совпасть с объединением
+    timestamp всех источников, иначе партиция и исходные файлы не трогаются.
+    """
+    paths = [Path(path) for path in paths]
+    target = partition_path(archive_dir, slug, date_str)
+
+    sources: List[Tuple[str, List[Dict[str, Any]]]] = []
+    if target.exists():
+        sources.append((str(target), read_partition_records(target)))
+    sources.extend((path.name, list(iter_log_records(path))) for path in paths)
+
+    expected = set()
+    for _, source in sources:
+        expected.update(_timestamp_key(record['timestamp']) for record in source)
+    counts = ", ".join(f"{name}: {len(source)}" for name, source in sources)
+
+    records = merge_records(source for _, source in sources)
+    table = records_to_table(records, slug)
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp, compression=compression)
+
+    written = pq.read_table(tmp, columns=['timestamp']).column('timestamp').to_pylist()
+    if len(written) != len(expected) or set(written) != expected:
+        tmp.unlink()
+        raise RuntimeError(f"{target}: записано {len(written)} строк, ожидалось {len(expected)} "
+                           f"уникальных timestamp ({counts})")
+
+    tmp.replace(target)
+
+    if delete_source:
+        for path in paths:
+            path.unlink()
+
+    return len(written)
+
+
+def compact_logs(output_dir: PathLike, archive_dir: PathLike, delete_source: bool = False,
+                 before: Optional[date] = None, compression: str = "zstd") -> Dict[str, int]:
+    """
+    Архивация всех закрытых дней (по умолчанию - все дни до сегодняшнего).
+
+    Returns:
+        dict: путь партиции -> количество строк
+    """
+    _require_pyarrow()
+    before = before or date.today()
+    result: Dict[str, int] = {}
+
+    # Файлы одного рынка за один день (.json и .jsonl) пишутся в одну партицию
+    sources: Dict[Tuple[str, str], List[Path]] = {}
+    for slug, date_str, path in iter_log_files(output_dir):
+        if date.fromisoformat(date_str) < before:
+            sources.setdefault((slug, date_str), []).append(path)
+
+    for (slug, date_str), paths in sources.items():
+        names = ", ".join(path.name for path in paths)
+        try:
+            rows = compact_file(paths, slug, date_str, archive_dir, delete_source, compression)
+            result[str(partition_path(archive_dir, slug, date_str))] = rows
+            print(f"[Archive] {names} -> {rows} строк{' (исходные файлы удалены)' if delete_source else ''}")
+        except Exception as e:
+            print(f"[Archive] Ошибка архивации {names}: {e}")
+
+    return result
+
+
+def read_archive(archive_dir: PathLike,
+                 slugs: Optional[List[str]] = None,
+                 start: Optional[datetime] = None,
+                 end: Optional[datetime] = None,
+                 columns: Optional[List[str]] = None) -> "pa.Table":
+    """
+    Чтение архива с проекцией колонок и фильтрами.
+
+    Фильтр по slug отсекает партиции целиком, фильтр по времени дополнительно
+    отсекает партиции по дате и передается в Parquet (статистика row group).
+
+    Args:
+        archive_dir: Директория архива
+        slugs: Список рынков (None - все)
+        start: Начало интервала (включительно)
+        end: Конец интервала (не включительно)
+        columns: Список колонок (None - все)
+    """
+    _require_pyarrow()
+
+    dataset = ds.dataset(str(archive_dir), format="parquet", partitioning="hive",
+                         schema=archive_schema().append(pa.field('slug', pa.string()))
+                         .append(pa.field('date', pa.string())))
+
+    expr = None
+
+    def _and(e):
+        return e if expr is None else expr & e
+
+    if slugs:
+        expr = _and(ds.field('slug').isin(list(slugs)))
+    if start is not None:
+        expr = _and(ds.field('date') >= start.date().isoformat())
+        expr = _and(ds.field('timestamp') >= pa.scalar(start, type=pa.timestamp('us')))
+    if end is not None:
+        expr = _and(ds.field('date') <= end.date().isoformat())
+        expr = _and(ds.field('timestamp') < pa.scalar(end, type=pa.timestamp('us')))
+
+    table = dataset.to_table(columns=columns, filter=expr)
+    if columns is None or 'timestamp' in columns:
+        table = table.sort_by('timestamp')
+    return table
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Архивация логов цен в Parquet")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_compact = sub.add_parser('compact', help="Архивация закрытых дней")
+    p_compact.add_argument('output_dir', help="Директория с логами")
+    p_compact.add_argument('--archive-dir', default="archive", help="Директория архива")
+    p_compact.add_argument('--delete-source', action='store_true', help="Удалить исходные файлы после проверки")
+    p_compact.add_argument('--before', help="Архивировать дни до указанной даты (YYYY-MM-DD), по умолчанию - до сегодня")
+
+    p_read = sub.add_parser('read', help="Чтение архива")
+    p_read.add_argument('archive_dir', help="Директория архива")
+    p_read.add_argument('--slug', action='append', help="Рынок (можно указать несколько раз)")
+    p_read.add_argument('--start', help="Начало интервала (ISO формат)")
+    p_read.add_argument('--end', help="Конец интервала (ISO формат)")
+    p_read.add_argument('--columns', help="Колонки через запятую")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'compact':
+            before = date.fromisoformat(args.before) if args.before else None
+            result = compact_logs(args.output_dir, args.archive_dir, args.delete_source, before)
+            print(f"[Archive] Партиций: {len(result)}, строк: {sum(result.values())}")
+        elif args.command == 'read':
+            table = read_archive(
+                args.archive_dir,
+                slugs=args.slug,
+                start=datetime.fromisoformat(args.start) if args.start else None,
+                end=datetime.fromisoformat(args.end) if args.end else None,
+                columns=args.columns.split(',') if args.columns else None,
+            )
+            print(table)
+            print(f"Строк: {table.num_rows}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
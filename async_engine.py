@@ -0,0 +1,566 @@
+"""
+Движок мониторинга на asyncio: один цикл событий вместо потока на каждый рынок.
+
+Запуск:
+    python price_monitor_service.py --engine asyncio
+
+Требует aiohttp (pip install aiohttp). Формат и расположение файлов логов,
+а также семантика горячей перезагрузки config.json совпадают с потоковым движком.
+"""
+import asyncio
+import random
+import time
+from threading import Thread
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Sequence
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - опциональная зависимость
+    aiohttp = None
+
+import api_client
+from api_client import extract_token_id, extract_token_ids, configure_client, RETRY_STATUS_CODES, DEFAULT_PRICE_BATCH_SIZE
+from price_monitor_service import MarketMonitor, ServiceManager, RECORDER_SETTINGS
+from storage import create_storage
+from market_cache import MarketCache, is_market_closed
+from writer import LogWriter
+from recording import ChangeRecorder
+from metrics import get_metrics, configure_metrics, start_metrics_server
+from discovery import MarketDiscovery
+from backfill import Backfiller
+from config_watcher import ConfigWatcher, diff_markets
+from startup import WarmState
+
+
+class AsyncTokenBucket:
+    """Асинхронный вариант api_client.TokenBucket"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        if tokens > self.capacity:
+            raise ValueError(f"Запрошено токенов больше емкости ограничителя: {tokens:g} > {self.capacity:g}")
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class AsyncPolymarketClient:
+    """
+    Асинхронный HTTP клиент для Gamma и CLOB API.
+
+    Повторяет поведение api_client.PolymarketClient (повторы при 429/5xx,
+    лимит частоты на хост) и ограничивает число одновременных запросов.
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        if aiohttp is None:
+            raise RuntimeError("Для движка asyncio требуется aiohttp: pip install aiohttp")
+
+        settings = settings or {}
+        self.gamma_base = settings.get('gamma_api_base') or api_client.GAMMA_API_BASE
+        self.clob_base = settings.get('clob_api_base') or api_client.CLOB_API_BASE
+        self.max_retries = max(0, int(settings.get('http_max_retries', 3)))
+        self.backoff_base = settings.get('http_backoff_base_seconds', 0.5)
+        self.backoff_max = settings.get('http_backoff_max_seconds', 10.0)
+        self.timeout = settings.get('http_timeout_seconds', 10.0)
+        self.max_concurrency = max(1, int(settings.get('async_max_concurrency', 100)))
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._limiters = {
+            self.gamma_base: AsyncTokenBucket(settings.get('gamma_rate_limit_per_second', 20.0)),
+            self.clob_base: AsyncTokenBucket(settings.get('clob_rate_limit_per_second', 50.0)),
+        }
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def close(self):
+        await self.session.close()
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def request_json(self, method: str, base: str, path: str, **kwargs) -> Optional[Any]:
+        """Запрос с повторами. Возвращает JSON ответа или None при ошибке."""
+        limiter = self._limiters.get(base)
+        url = f"{base}{path}"
+        metrics = get_metrics()
+
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                await limiter.acquire()
+
+            delay = self._backoff_delay(attempt)
+            try:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    async with self.session.request(method, url, **kwargs) as response:
+                        metrics.http_latency.labels(path).observe(time.perf_counter() - started)
+                        metrics.http_requests.labels(path, response.status).inc()
+                        if response.status == 200:
+                            return await response.json(content_type=None)
+                        if response.status not in RETRY_STATUS_CODES:
+                            print(f"Ошибка API {response.status} ({path})")
+                            return None
+                        retry_after = response.headers.get('Retry-After')
+                        if retry_after:
+                            try:
+                                delay = min(self.backoff_max, float(retry_after))
+                            except ValueError:
+                                pass
+                        print(f"Ошибка API {response.status} ({path}), повтор через {delay:.1f}с")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.http_requests.labels(path, "error").inc()
+                print(f"Сетевая ошибка ({e.__class__.__name__}) ({path}), повтор через {delay:.1f}с")
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+
+        return None
+
+    async def get_market_details(self, market_id: str) -> Optional[Dict[str, Any]]:
+        data = await self.request_json("GET", self.gamma_base, "/markets", params={"slug": market_id})
+        if isinstance(data, list) and len(data) > 0:
+            return data[0]
+        if data is not None:
+            print(f"Ошибка: рынок '{market_id}' не найден")
+        return None
+
+    async def get_current_price(self, token_id: str) -> Optional[Dict[str, Optional[float]]]:
+        bid_data, ask_data = await asyncio.gather(
+            self.request_json("GET", self.clob_base, "/price", params={"token_id": token_id, "side": "buy"}),
+            self.request_json("GET", self.clob_base, "/price", params={"token_id": token_id, "side": "sell"}),
+        )
+        if bid_data is None or ask_data is None:
+            return None
+
+        bid = float(bid_data['price']) if bid_data.get('price') else None
+        ask = float(ask_data['price']) if ask_data.get('price') else None
+        mid = (bid + ask) / 2 if bid is not None and ask is not None else None
+        return {'bid': bid, 'ask': ask, 'mid': mid}
+
+    async def get_current_prices(self, token_ids: List[str],
+                                 batch_size: int = DEFAULT_PRICE_BATCH_SIZE) -> Dict[str, Dict[str, Optional[float]]]:
+        unique_ids = list(dict.fromkeys(t for t in token_ids if t))
+        batch_size = max(1, int(batch_size))
+        chunks = [unique_ids[i:i + batch_size] for i in range(0, len(unique_ids), batch_size)]
+
+        async def fetch_chunk(chunk: List[str]) -> Optional[Any]:
+            body = [{"token_id": t, "side": side} for t in chunk for side in ("BUY", "SELL")]
+            return await self.request_json("POST", self.clob_base, "/prices", json=body)
+
+        results: Dict[str, Dict[str, Optional[float]]] = {}
+        for chunk, data in zip(chunks, await asyncio.gather(*(fetch_chunk(c) for c in chunks))):
+            if not isinstance(data, dict):
+                continue
+            for token_id in chunk:
+                side_data = data.get(token_id)
+                if not isinstance(side_data, dict):
+                    continue
+                bid = api_client._price_from_side(side_data, 'BUY')
+                ask = api_client._price_from_side(side_data, 'SELL')
+                mid = (bid + ask) / 2 if bid is not None and ask is not None else None
+                results[token_id] = {'bid': bid, 'ask': ask, 'mid': mid}
+
+        return results
+
+
+class AsyncServiceManager(ServiceManager):
+    """
+    Сервис мониторинга на asyncio.
+
+    Использует те же MarketMonitor (формат записи, имена файлов) и ту же
+    логику чтения config.json, что и ServiceManager, но вместо потоков
+    каждый рынок - это задача в одном цикле событий.
+    """
+
+    def __init__(self, config_file: str = "config.json"):
+        super().__init__(config_file)
+        self.client: Optional[AsyncPolymarketClient] = None
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.monitors: Dict[str, MarketMonitor] = {}
+
+    async def initialize_monitor(self, monitor: MarketMonitor) -> bool:
+        """Асинхронный аналог MarketMonitor.initialize"""
+        if monitor.token_id and monitor.market_details:
+            print(f"[{monitor.name}] Инициализация из снимка")
+            return True
+
+        monitor.market_details = self.market_cache.get(monitor.slug)
+        if monitor.market_details is None:
+            monitor.market_details = await self.client.get_market_details(monitor.slug)
+            if monitor.market_details:
+                self.market_cache.put(monitor.slug, monitor.market_details)
+        if not monitor.market_details:
+            print(f"[{monitor.name}] Ошибка: не удалось получить детали рынка")
+            return False
+        if is_market_closed(monitor.market_details):
+            monitor.retire()
+            return False
+
+        monitor.token_id = extract_token_id(monitor.market_details)
+        if not monitor.token_id:
+            print(f"[{monitor.name}] Ошибка: не удалось извлечь token_id")
+            return False
+        monitor.token_ids = extract_token_ids(monitor.market_details)
+
+        print(f"[{monitor.name}] Инициализация завершена")
+        return True
+
+    async def monitor_task(self, monitor: MarketMonitor):
+        """Задача одного рынка: инициализация и, вне пакетного режима, собственный цикл опроса"""
+        print(f"[{monitor.name}] Запуск мониторинга...")
+
+        try:
+            # Неудачная инициализация повторяется в фоне, задача рынка не завершается
+            delay = monitor.init_retry
+            while not await self.initialize_monitor(monitor):
+                if monitor.should_stop:
+                    return
+                print(f"[{monitor.name}] Повторная попытка инициализации через {delay:g}с")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, monitor.init_retry_max)
+
+            if self.batch_mode:
+                # Цены запрашивает общий цикл price_fetcher_task
+                return
+
+            last_started: Optional[float] = None
+
+            while not monitor.should_stop:
+                started = time.monotonic()
+                if last_started is not None:
+                    get_metrics().poll_drift.labels("monitor").observe(
+                        max(0.0, started - last_started - self.get_poll_interval()))
+                last_started = started
+
+                try:
+                    # Запись (или ожидание места в очереди LogWriter) - в пуле потоков, не в цикле событий
+                    price = await self.client.get_current_price(monitor.token_id)
+                    await asyncio.to_thread(monitor.handle_price, price)
+                except Exception as e:
+                    print(f"[{monitor.name}] Ошибка в цикле мониторинга: {e}")
+
+                await asyncio.sleep(self.get_poll_interval())
+
+        except asyncio.CancelledError:
+            pass
+
+        print(f"[{monitor.name}] Мониторинг остановлен (записано {monitor.iteration} записей)")
+
+    def get_active_monitors(self):
+        return list(self.monitors.values())
+
+    def is_monitored(self, slug: str) -> bool:
+        return slug in self.monitors
+
+    def get_poll_interval(self) -> int:
+        if not self.current_config:
+            return 60
+        return self.current_config.get('settings', {}).get('poll_interval_seconds', 60)
+
+    async def fetch_prices_once_async(self, only_new: bool = False) -> int:
+        """Асинхронный аналог ServiceManager.fetch_prices_once"""
+        monitors = [m for m in self.monitors.values()
+                    if m.token_id and not m.should_stop and not (only_new and m.last_fetch_time is not None)]
+        if not monitors:
+            return 0
+
+        batch_size = (self.current_config or {}).get('settings', {}).get('price_batch_size', DEFAULT_PRICE_BATCH_SIZE)
+        prices = await self.client.get_current_prices([m.token_id for m in monitors], batch_size=batch_size)
+
+        fetch_time = time.time()
+        for monitor in monitors:
+            monitor.last_fetch_time = fetch_time
+        # Обработка цен пишет в хранилище синхронно, поэтому вся пачка выполняется в пуле потоков
+        deadline = self.writer.tick_deadline() if self.writer else None
+        await asyncio.to_thread(self.handle_prices, monitors, prices, deadline)
+
+        return len(monitors)
+
+    @staticmethod
+    def handle_prices(monitors: List[MarketMonitor], prices: Dict[str, Any],
+                      deadline: Optional[float] = None) -> None:
+        """Обработка полученных цен мониторами (вызывается вне цикла событий)"""
+        for monitor in monitors:
+            try:
+                monitor.handle_price(prices.get(monitor.token_id), deadline)
+            except Exception as e:
+                print(f"[{monitor.name}] Ошибка обработки цен: {e}")
+
+    async def price_fetcher_task(self):
+        """Пакетный цикл получения цен (аналог ServiceManager.price_fetcher_loop)"""
+        print(f"[Price Fetcher] Запущен")
+
+        next_tick = time.monotonic()
+        while not self.should_stop:
+            get_metrics().poll_drift.labels("batch").observe(max(0.0, time.monotonic() - next_tick))
+            try:
+                await self.fetch_prices_once_async()
+            except Exception as e:
+                print(f"[Price Fetcher] Ошибка: {e}")
+
+            next_tick = max(next_tick + self.get_poll_interval(), time.monotonic())
+            while not self.should_stop and time.monotonic() < next_tick:
+                await asyncio.sleep(max(0.0, min(1.0, next_tick - time.monotonic())))
+                try:
+                    await self.fetch_prices_once_async(only_new=True)
+                except Exception as e:
+                    print(f"[Price Fetcher] Ошибка: {e}")
+
+    def update_monitors(self, changed_settings: Sequence[str] = ()) -> Dict[str, List[str]]:
+        """Обновление задач мониторов на основе конфигурации (аналог ServiceManager.update_monitors)"""
+        if not self.current_config:
+            return {'added': [], 'removed': [], 'changed': []}
+
+        new_markets_map = self.monitored_markets(self.current_config)
+
+        removed = sorted(slug for slug in self.tasks if slug not in new_markets_map)
+        added = sorted(slug for slug in new_markets_map if slug not in self.tasks)
+        _, _, changed = diff_markets(self.active_markets, new_markets_map)
+        changed = [slug for slug in changed if slug in self.tasks]
+
+        # Отмена задачи не ждет ее завершения
+        for slug in removed:
+            print(f"[Service] Остановка монитора: {slug}")
+            self.monitors.pop(slug).stop()
+            self.tasks.pop(slug).cancel()
+
+        settings = self.current_config.get('settings', {})
+        output_dir = settings.get('output_directory', 'logs')
+        poll_interval = settings.get('poll_interval_seconds', 60)
+
+        # Интервал опроса задачи читают из конфигурации на каждой итерации,
+        # остальные настройки передаются работающим мониторам
+        recorder_changed = bool(RECORDER_SETTINGS.intersection(changed_settings))
+        if 'output_directory' in changed_settings:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+        if recorder_changed or 'output_directory' in changed_settings:
+            reconfigure = list(self.monitors)
+        else:
+            reconfigure = changed
+
+        for slug in reconfigure:
+            monitor = self.monitors[slug]
+            monitor.reconfigure(new_markets_map[slug].get('name', slug), output_dir, poll_interval)
+            if recorder_changed:
+                monitor.recorder = ChangeRecorder.from_settings(settings)
+
+        for slug in added:
+            market = new_markets_map[slug]
+            print(f"[Service] Запуск нового монитора: {market.get('name', slug)}")
+            monitor = MarketMonitor(
+                slug=slug,
+                name=market.get('name', slug),
+                output_dir=output_dir,
+                storage=self.storage,
+                market_cache=self.market_cache,
+                writer=self.writer,
+                recorder=ChangeRecorder.from_settings(settings)
+            )
+            self.prepare_monitor(monitor)
+            self.monitors[slug] = monitor
+            self.tasks[slug] = asyncio.create_task(self.monitor_task(monitor))
+            if self.backfiller:
+                self.backfill_queue.put(slug)
+
+        self.active_markets = new_markets_map
+        return {'added': added, 'removed': removed, 'changed': changed}
+
+    async def discovery_task(self):
+        """Периодический поиск рынков (запросы Gamma выполняются в отдельном потоке)"""
+        print(f"[Discovery] Запущен")
+
+        while not self.should_stop:
+            interval = (self.current_config or {}).get('settings', {}).get('discovery_interval_seconds', 300)
+            await asyncio.sleep(interval)
+            try:
+                if await asyncio.to_thread(self.discover_markets):
+                    self.update_monitors()
+            except Exception as e:
+                print(f"[Discovery] Ошибка: {e}")
+
+    async def market_refresh_task(self):
+        """Обновление деталей рынков (аналог ServiceManager.market_refresh_loop, запросы Gamma - в отдельном потоке)"""
+        print(f"[Market Refresh] Запущен")
+
+        next_refresh = time.monotonic()
+        while not self.should_stop:
+            interval = (self.current_config or {}).get('settings', {}).get('market_refresh_interval_seconds', 3600)
+            if interval > 0 and time.monotonic() >= next_refresh:
+                try:
+                    await asyncio.to_thread(self.refresh_markets)
+                except Exception as e:
+                    print(f"[Market Refresh] Ошибка: {e}")
+                next_refresh = time.monotonic() + interval
+
+            try:
+                self.retire_closed_monitors()
+            except Exception as e:
+                print(f"[Market Refresh] Ошибка: {e}")
+            await asyncio.sleep(1)
+
+    async def warm_state_task(self):
+        """Периодическое сохранение снимка состояния (на случай аварийного завершения)"""
+        while not self.should_stop:
+            interval = (self.current_config or {}).get('settings', {}).get('warm_state_interval_seconds', 300)
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.save_warm_state)
+            except Exception as e:
+                print(f"[Warm State] Ошибка: {e}")
+
+    async def config_reloader_task(self):
+        """Цикл перезагрузки конфигурации (аналог ServiceManager.config_reloader_loop)"""
+        print(f"[Config Reloader] Запущен ({self.watcher.mode})")
+
+        while not self.should_stop:
+            try:
+                # Ожидание событий файла блокирующее, поэтому выполняется в отдельном потоке
+                if await asyncio.to_thread(self.watcher.wait, 1.0):
+                    print(f"[Config Reloader] Обнаружены изменения в конфигурации")
+                    if self.reload_config():
+                        print(f"[Config Reloader] Конфигурация обновлена")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Config Reloader] Ошибка: {e}")
+                await asyncio.sleep(1)
+
+    async def run_async(self):
+        self.current_config = self.load_config()
+        if not self.current_config:
+            print("Ошибка: не удалось загрузить конфигурацию")
+            return
+
+        self.last_config_mtime = self.get_config_mtime()
+
+        settings = self.current_config.get('settings', {})
+        self.watcher = ConfigWatcher.from_settings(self.config_file, settings)
+        output_dir = settings.get('output_directory', 'logs')
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+        metrics = configure_metrics(settings)
+        metrics.active_monitors.set_function(lambda: len(self.tasks))
+        self.metrics_server = start_metrics_server(settings)
+
+        try:
+            self.storage = create_storage(settings)
+            self.market_cache = MarketCache.from_settings(settings)
+            self.client = AsyncPolymarketClient(settings)
+        except (ValueError, RuntimeError) as e:
+            print(f"Ошибка: {e}")
+            return
+        metrics.track_market_cache(self.market_cache)
+
+        self.recover_storage(settings)
+
+        # Снимок прошлого запуска: мониторы из него стартуют без запросов к Gamma
+        self.warm_state = WarmState.from_settings(settings)
+        if self.warm_state:
+            self.warm_state.load()
+
+        # Запись на диск в отдельном потоке, чтобы не блокировать цикл событий
+        if settings.get('writer_enabled', True):
+            self.writer = LogWriter.from_settings(self.storage, settings).start()
+
+        if settings.get('discovery_enabled', False):
+            configure_client(settings)
+            self.discovery = MarketDiscovery.from_settings(settings)
+            await asyncio.to_thread(self.discover_markets)
+
+        # Дозаполнение истории выполняет отдельный поток на синхронном клиенте (как в движке threads)
+        if settings.get('backfill_enabled', False):
+            configure_client(settings)
+            self.backfiller = Backfiller.from_settings(settings, storage=self.storage, market_cache=self.market_cache)
+
+        self.batch_mode = self.is_batch_mode()
+        if settings.get('ingestion_mode', 'poll') == 'stream':
+            print("[Service] ingestion_mode=stream поддерживается только движком threads, используется опрос")
+        if settings.get('adaptive_polling', False):
+            print("[Service] adaptive_polling поддерживается только движком threads, интервал опроса фиксированный")
+        if settings.get('depth_capture', False):
+            print("[Service] depth_capture поддерживается только движком threads, глубина не записывается")
+        if self.current_config.get('events'):
+            print("[Service] events поддерживается только движком threads, события не записываются")
+        self.update_monitors()
+
+        print()
+        print(f"Движок: asyncio (до {self.client.max_concurrency} одновременных запросов)")
+        print(f"Запущено мониторов: {len(self.tasks)}")
+        print(f"Директория для логов: {output_dir}")
+        print(f"Формат хранения: {self.storage.name}")
+        if self.metrics_server:
+            print(f"Метрики: {self.metrics_server.address}")
+        print(f"Файл конфигурации: {self.config_file} (отслеживание: {self.watcher.mode})")
+        print()
+        print("Для остановки нажмите Ctrl+C")
+        print("=" * 60)
+        print()
+
+        # Детали рынков обновляются пачками синхронным клиентом в отдельном потоке
+        configure_client(settings)
+        background = [asyncio.create_task(self.config_reloader_task()),
+                      asyncio.create_task(self.market_refresh_task())]
+        if self.batch_mode:
+            background.append(asyncio.create_task(self.price_fetcher_task()))
+        if self.discovery:
+            background.append(asyncio.create_task(self.discovery_task()))
+        if self.warm_state:
+            background.append(asyncio.create_task(self.warm_state_task()))
+        if self.backfiller:
+            Thread(target=self.backfill_loop, daemon=True).start()
+
+        try:
+            while not self.should_stop:
+                await asyncio.sleep(1)
+        finally:
+            self.should_stop = True
+            for monitor in self.monitors.values():
+                monitor.stop()
+            pending = background + list(self.tasks.values())
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            self.save_warm_state()
+            await self.client.close()
+            self.watcher.close()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            self.close_writer()
+            self.storage.close()
+            self.market_cache.close()
+            print(f"Кэш рынков: {self.market_cache.stats()}")
+
+    def run(self):
+        """Главный цикл сервиса"""
+        self.setup_console()
+
+        print("=" * 60)
+        print("Polymarket Price Monitor Service")
+        print("=" * 60)
+        print()
+
+        try:
+            asyncio.run(self.run_async())
+        except KeyboardInterrupt:
+            print("\n\nОстановка сервиса...")
+
+        print("Сервис остановлен")
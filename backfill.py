@@ -0,0 +1,347 @@
+"""
+Дозаполнение истории цен через CLOB `/prices-history`.
+
+Для рынка находятся пропуски в уже записанных логах (интервалы без записей
+дольше `gap_seconds`), и только они запрашиваются у API. Пропуск делится на
+части по `chunk_seconds`, части запрашиваются параллельно (не больше
+`concurrency` одновременно, в пределах общего лимита частоты запросов
+клиента). Точки вставляются в те же дневные файлы `{slug}_{date}`, что пишет
+MarketMonitor, с дедупликацией по timestamp.
+
+Обработанные части сохраняются в `{output_dir}/.backfill/{slug}.json`:
+прерванное дозаполнение продолжается с места остановки, а интервалы, за
+которые у API нет данных (например, до создания рынка), повторно не
+запрашиваются.
+
+История содержит одну цену на точку, она записывается в `mid`
+(bid/ask - None) с пометкой `"backfill": true`.
+
+Использование:
+    python backfill.py market-slug --hours 48
+    python backfill.py --config config.json --start 2026-01-18T00:00 --end 2026-01-19T00:00
+"""
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+from api_client import PolymarketClient, get_client, configure_client, extract_token_id
+from storage import LogStorage, PathLike, create_storage, safe_slug, atomic_write_text
+from market_cache import MarketCache
+from query import INDEX_SUFFIX
+from recording import RECORD_ALL, RECORD_CHANGES
+
+CHECKPOINT_DIR = ".backfill"
+
+Interval = Tuple[float, float]
+
+
+def _union(intervals: List[Interval]) -> List[Interval]:
+    merged: List[List[float]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+class BackfillCheckpoint:
+    """
+    Обработанные интервалы рынка (unix время).
+
+    Привязаны к token_id и шагу истории: при их смене история запрашивается заново.
+    """
+
+    def __init__(self, path: Path, token_id: str, fidelity: int):
+        self.path = path
+        self.token_id = token_id
+        self.fidelity = fidelity
+        self.done: List[Interval] = []
+
+    def load(self) -> "BackfillCheckpoint":
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return self
+        if data.get('token_id') == self.token_id and data.get('fidelity') == self.fidelity:
+            self.done = [(float(s), float(e)) for s, e in data.get('done', [])]
+        return self
+
+    def covered(self, start: float, end: float) -> bool:
+        return any(s <= start and end <= e for s, e in self.done)
+
+    def mark(self, start: float, end: float) -> None:
+        self.done = _union(self.done + [(start, end)])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(self.path, json.dumps({
+            'token_id': self.token_id,
+            'fidelity': self.fidelity,
+            'done': self.done,
+        }), fsync=False)
+
+
+class Backfiller:
+    """
+    Дозаполнение пропусков в логах рынков.
+
+    Args:
+        output_dir: Директория логов
+        storage: Бэкенд хранения (в сервисе - общий с потоком записи)
+        client: HTTP клиент (по умолчанию общий)
+        market_cache: Кэш метаданных рынков
+        fidelity: Шаг точек истории в минутах
+        gap_seconds: Интервал без записей, считающийся пропуском
+        chunk_seconds: Длина части интервала в одном запросе
+        concurrency: Количество одновременных запросов
+        busy_seconds: Не изменять файлы, в которые писали за последние N секунд
+            (другим процессом; None - без проверки)
+    """
+
+    def __init__(self,
+                 output_dir: PathLike,
+                 storage: Optional[LogStorage] = None,
+                 client: Optional[PolymarketClient] = None,
+                 market_cache: Optional[MarketCache] = None,
+                 fidelity: int = 1,
+                 gap_seconds: float = 180,
+                 chunk_seconds: float = 6 * 3600,
+                 concurrency: int = 4,
+                 busy_seconds: Optional[float] = None):
+        self.output_dir = Path(output_dir)
+        self.storage = storage or create_storage()
+        self.client = client
+        self.market_cache = market_cache or MarketCache()
+        self.fidelity = max(1, int(fidelity))
+        # Пропуск не может быть короче шага истории
+        self.gap_seconds = max(float(gap_seconds), 2 * self.fidelity * 60)
+        self.chunk_seconds = max(float(chunk_seconds), self.fidelity * 60)
+        self.concurrency = max(1, int(concurrency))
+        self.busy_seconds = busy_seconds
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None,
+                      storage: Optional[LogStorage] = None,
+                      market_cache: Optional[MarketCache] = None,
+                      busy_seconds: Optional[float] = None) -> "Backfiller":
+        """Создание по разделу `settings` конфигурации (ключи backfill_*)"""
+        settings = settings or {}
+        gap_seconds = settings.get('backfill_gap_seconds', 3 * settings.get('poll_interval_seconds', 60))
+        if settings.get('record_mode', RECORD_ALL) == RECORD_CHANGES:
+            # В режиме изменений тихий рынок пишет только ключевые кадры: пропуск - это
+            # пропущенный ключевой кадр (тот же порог, что в recording.expand_to_grid)
+            gap_seconds = max(gap_seconds, 1.5 * settings.get('keyframe_interval_seconds', 300))
+        return cls(
+            output_dir=settings.get('output_directory', 'logs'),
+            storage=storage,
+            market_cache=market_cache,
+            fidelity=settings.get('backfill_fidelity_minutes', 1),
+            gap_seconds=gap_seconds,
+            chunk_seconds=settings.get('backfill_chunk_hours', 6) * 3600,
+            concurrency=settings.get('backfill_concurrency', 4),
+            busy_seconds=busy_seconds,
+        )
+
+    def _client(self) -> PolymarketClient:
+        return self.client or get_client()
+
+    def _days(self, start: float, end: float) -> List[str]:
+        day = datetime.fromtimestamp(start).date()
+        last = datetime.fromtimestamp(end).date()
+        days = []
+        while day <= last:
+            days.append(day.isoformat())
+            day += timedelta(days=1)
+        return days
+
+    def find_gaps(self, slug: str, start: float, end: float) -> List[Interval]:
+        """Интервалы внутри [start, end] без записей дольше gap_seconds"""
+        timestamps: List[float] = []
+        for day in self._days(start, end):
+            path = self.storage.log_path(self.output_dir, slug, day)
+            for record in self.storage.iter_records(path):
+                try:
+                    ts = datetime.fromisoformat(record['timestamp']).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if start <= ts <= end:
+                    timestamps.append(ts)
+        timestamps.sort()
+
+        gaps: List[Interval] = []
+        previous = start
+        for ts in timestamps + [end]:
+            if ts - previous > self.gap_seconds:
+                gaps.append((previous, ts))
+            previous = ts
+        return gaps
+
+    def _chunks(self, gaps: List[Interval]) -> List[Interval]:
+        chunks = []
+        for gap_start, gap_end in gaps:
+            chunk_start = gap_start
+            while chunk_start < gap_end:
+                chunk_end = min(gap_end, chunk_start + self.chunk_seconds)
+                chunks.append((chunk_start, chunk_end))
+                chunk_start = chunk_end
+        return chunks
+
+    def _is_busy(self, path: Path) -> bool:
+        if self.busy_seconds is None or not path.exists():
+            return False
+        return time.time() - path.stat().st_mtime < self.busy_seconds
+
+    def _write(self, slug: str, name: str, token_id: str,
+               points: List[Tuple[int, float]]) -> Tuple[int, int]:
+        """Вставка точек в дневные файлы. Returns: (добавлено, пропущено из-за занятых файлов)"""
+        by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for ts, price in points:
+            moment = datetime.fromtimestamp(ts)
+            by_day.setdefault(moment.date().isoformat(), []).append({
+                "timestamp": moment.isoformat(),
+                "market_slug": slug,
+                "market_name": name,
+                "token_id": token_id,
+                "bid": None,
+                "ask": None,
+                "mid": price,
+                "backfill": True,
+            })
+
+        added = 0
+        busy = 0
+        for day, entries in by_day.items():
+            path = self.storage.log_path(self.output_dir, slug, day)
+            if self._is_busy(path):
+                print(f"[Backfill] {path.name} записывается другим процессом, пропущено {len(entries)} точек")
+                busy += len(entries)
+                continue
+            count = self.storage.merge(path, entries)
+            if count:
+                # Индекс query.py построен по старым смещениям
+                path.with_name(path.name + INDEX_SUFFIX).unlink(missing_ok=True)
+            added += count
+        return added, busy
+
+    def backfill(self, slug: str, start: float, end: float, name: Optional[str] = None) -> Dict[str, int]:
+        """
+        Дозаполнение пропусков рынка в интервале [start, end] (unix время).
+
+        Returns:
+            dict: статистика (gaps, chunks, resumed, fetched, added, failed)
+        """
+        stats = {'gaps': 0, 'chunks': 0, 'resumed': 0, 'fetched': 0, 'added': 0, 'failed': 0}
+
+        details = self.market_cache.get_details(slug)
+        token_id = extract_token_id(details) if details else None
+        if not token_id:
+            print(f"[Backfill] {slug}: не удалось получить token_id")
+            stats['failed'] = 1
+            return stats
+        name = name or details.get('question') or slug
+
+        checkpoint = BackfillCheckpoint(
+            self.output_dir / CHECKPOINT_DIR / f"{safe_slug(slug)}.json", token_id, self.fidelity).load()
+
+        gaps = self.find_gaps(slug, start, end)
+        chunks = self._chunks(gaps)
+        pending = [c for c in chunks if not checkpoint.covered(*c)]
+        stats.update(gaps=len(gaps), chunks=len(chunks), resumed=len(chunks) - len(pending))
+        if not pending:
+            return stats
+
+        # Недавние данные API могут появиться позже - такие части не отмечаются как обработанные
+        settled = time.time() - self.gap_seconds
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backfill") as pool:
+            futures = {pool.submit(self._client().get_price_history, token_id, int(s), int(e) + 1, self.fidelity): (s, e)
+                       for s, e in pending}
+            # Запись и отметки выполняются последовательно по мере готовности частей
+            for future in as_completed(futures):
+                chunk_start, chunk_end = futures[future]
+                points = future.result()
+                if points is None:
+                    stats['failed'] += 1
+                    continue
+                # Только внутри пропуска, чтобы не перемешивать с записанными данными
+                points = [(t, p) for t, p in points if chunk_start <= t < chunk_end]
+                stats['fetched'] += len(points)
+                added, busy = self._write(slug, name, token_id, points)
+                stats['added'] += added
+                if busy:
+                    stats['failed'] += 1
+                elif chunk_end <= settled:
+                    checkpoint.mark(chunk_start, chunk_end)
+
+        return stats
+
+
+def format_stats(stats: Dict[str, int]) -> str:
+    return (f"пропусков {stats['gaps']}, частей {stats['chunks']} (из контрольной точки {stats['resumed']}), "
+            f"получено точек {stats['fetched']}, добавлено {stats['added']}, ошибок {stats['failed']}")
+
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Дозаполнение истории цен через CLOB /prices-history")
+    parser.add_argument('slugs', nargs='*', help="Slug рынков (по умолчанию - включенные рынки из конфигурации)")
+    parser.add_argument('--config', default="config.json", help="Файл конфигурации (раздел settings и рынки)")
+    parser.add_argument('--hours', type=float, default=24, help="Глубина истории в часах (если не задан --start)")
+    parser.add_argument('--start', help="Начало интервала (ISO, локальное время)")
+    parser.add_argument('--end', help="Конец интервала (ISO, по умолчанию - сейчас)")
+    parser.add_argument('--force', action='store_true',
+                        help="Изменять файлы, в которые недавно писал другой процесс (только при остановленном сервисе)")
+    args = parser.parse_args(argv)
+
+    config: Dict[str, Any] = {}
+    if Path(args.config).exists():
+        try:
+            with open(args.config, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ошибка загрузки конфигурации: {e}")
+            return 1
+    settings = config.get('settings', {})
+
+    slugs = args.slugs or [m['slug'] for m in config.get('markets', []) if m.get('enabled', True)]
+    if not slugs:
+        print("Ошибка: не указаны рынки")
+        return 1
+
+    try:
+        end = _parse_time(args.end) if args.end else time.time()
+        start = _parse_time(args.start) if args.start else end - args.hours * 3600
+        storage = create_storage(settings)
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    configure_client(settings)
+    # Работающий сервис держит открытыми файлы текущего дня - их заполняет сам сервис (backfill_enabled)
+    busy_seconds = None if args.force else max(300, 2 * settings.get('poll_interval_seconds', 60))
+    backfiller = Backfiller.from_settings(settings, storage=storage,
+                                          market_cache=MarketCache.from_settings(settings),
+                                          busy_seconds=busy_seconds)
+
+    failed = 0
+    try:
+        for slug in slugs:
+            stats = backfiller.backfill(slug, start, end)
+            failed += stats['failed']
+            print(f"[Backfill] {slug}: {format_stats(stats)}")
+    finally:
+        storage.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
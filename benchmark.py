@@ -0,0 +1,585 @@
+"""
+Нагрузочный тест сервиса на локальной имитации Polymarket API.
+
+Имитация Gamma (`/markets`) и CLOB (`/price`, `/prices`, `/books`) запускается
+в отдельном процессе с настраиваемой задержкой и долей ошибок. Сервис
+(ServiceManager, движок threads или asyncio) или log_market_prices запускается
+в текущем процессе для N синтетических рынков, после чего измеряются:
+запросы в секунду, отставание опроса (перцентили по интервалам между записями
+в логах), процессорное время, пиковый RSS и объем записанных данных.
+
+Результаты сохраняются в JSON для сравнения между версиями.
+
+Использование:
+    python benchmark.py run --markets 10,100,1000 --duration 60 --poll-interval 5 --latency-ms 50
+    python benchmark.py run --target logger --markets 100 --error-rate 0.05
+    python benchmark.py run --markets 1000 --set storage_backend=\\"jsonl\\" --set adaptive_polling=true
+    python benchmark.py compare benchmarks/old.json benchmarks/new.json
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from threading import Thread, Lock
+from typing import Dict, Any, Optional, List
+from urllib.parse import urlparse, parse_qs
+from urllib.request import urlopen
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+from storage import create_storage
+
+STATS_PATH = "/__stats"
+
+TARGET_SERVICE = "service"
+TARGET_SERVICE_ASYNC = "service-async"
+TARGET_LOGGER = "logger"
+TARGETS = (TARGET_SERVICE, TARGET_SERVICE_ASYNC, TARGET_LOGGER)
+
+
+def market_slug(index: int) -> str:
+    return f"bench-market-{index}"
+
+
+class MockPolymarketHandler(BaseHTTPRequestHandler):
+    """Обработчик имитации API: синтетические рынки и цены со случайным блужданием"""
+
+    protocol_version = "HTTP/1.1"
+
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+
+    counts: Dict[str, int] = {}
+    errors = 0
+    prices: Dict[str, float] = {}
+    lock = Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _begin(self, path: str) -> bool:
+        """Учет запроса, задержка и внедрение ошибки. False - ответ уже отправлен."""
+        cls = MockPolymarketHandler
+        if path == STATS_PATH:
+            return True
+
+        with cls.lock:
+            cls.counts[path] = cls.counts.get(path, 0) + 1
+
+        delay = cls.latency + (random.uniform(0, cls.jitter) if cls.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+
+        if cls.error_rate and random.random() < cls.error_rate:
+            with cls.lock:
+                cls.errors += 1
+            self._send({"error": "injected"}, 503)
+            return False
+        return True
+
+    def _price(self, token_id: str) -> float:
+        cls = MockPolymarketHandler
+        with cls.lock:
+            price = cls.prices.get(token_id, 0.5)
+            if random.random() < 0.3:
+                price = min(0.95, max(0.05, price + random.choice((-0.01, 0.01))))
+            cls.prices[token_id] = price
+        return price
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if not self._begin(url.path):
+            return
+
+        if url.path == STATS_PATH:
+            cls = MockPolymarketHandler
+            with cls.lock:
+                self._send({'counts': dict(cls.counts), 'errors': cls.errors})
+        elif url.path == "/markets":
+            self._send([{
+                "slug": slug,
+                "question": f"Benchmark market {slug}?",
+                "clobTokenIds": json.dumps([f"yes-{slug}", f"no-{slug}"]),
+                "active": True,
+                "closed": False,
+            } for slug in query.get('slug', [])])
+        elif url.path == "/price":
+            token_id = query.get('token_id', [''])[0]
+            mid = self._price(token_id)
+            side = query.get('side', ['buy'])[0].lower()
+            self._send({"price": str(round(mid - 0.01 if side == 'buy' else mid + 0.01, 4))})
+        else:
+            self._send({"error": "not found"}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b"[]")
+        if not self._begin(url.path):
+            return
+
+        if url.path == "/prices":
+            result: Dict[str, Dict[str, str]] = {}
+            for item in body:
+                mid = self._price(item['token_id'])
+                price = mid - 0.01 if item['side'].upper() == 'BUY' else mid + 0.01
+                result.setdefault(item['token_id'], {})[item['side']] = str(round(price, 4))
+            self._send(result)
+        elif url.path == "/books":
+            books = []
+            for item in body:
+                mid = self._price(item['token_id'])
+                books.append({
+                    "asset_id": item['token_id'],
+                    "bids": [{"price": str(round(mid - 0.01 * (i + 1), 4)), "size": "100"} for i in range(10)],
+                    "asks": [{"price": str(round(mid + 0.01 * (i + 1), 4)), "size": "100"} for i in range(10)],
+                })
+            self._send(books)
+        else:
+            self._send({"error": "not found"}, 404)
+
+
+def _serve_mock(port_queue, latency: float, jitter: float, error_rate: float) -> None:
+    MockPolymarketHandler.latency = latency
+    MockPolymarketHandler.jitter = jitter
+    MockPolymarketHandler.error_rate = error_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockPolymarketHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class MockPolymarketAPI:
+    """
+    Имитация API в отдельном процессе (чтобы не искажать замеры CPU и RSS сервиса).
+
+    Args:
+        latency_ms: Задержка каждого ответа (мс)
+        jitter_ms: Дополнительная случайная задержка 0..jitter_ms (мс)
+        error_rate: Доля ответов 503
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.process: Optional[multiprocessing.Process] = None
+        self.url: Optional[str] = None
+
+    def start(self) -> "MockPolymarketAPI":
+        port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=_serve_mock, args=(port_queue, self.latency, self.jitter, self.error_rate), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+        return self
+
+    def stats(self) -> Dict[str, Any]:
+        with urlopen(f"{self.url}{STATS_PATH}", timeout=10) as response:
+            return json.loads(response.read())
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(timeout=5)
+            self.process = None
+
+    def __enter__(self) -> "MockPolymarketAPI":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def _current_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        # ru_maxrss: килобайты в Linux, байты в macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    return None
+
+
+class ResourceSampler:
+    """Периодический замер RSS и числа потоков процесса (пиковые значения)"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.peak_rss: Optional[int] = None
+        self.peak_threads = 0
+        self._stop = threading.Event()
+        self._thread = Thread(target=self._run, name="benchmark-sampler", daemon=True)
+
+    def _sample(self) -> None:
+        rss = _current_rss_bytes()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, rss)
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "ResourceSampler":
+        self._sample()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def percentiles(values: List[float], points=(50, 90, 99)) -> Dict[str, Optional[float]]:
+    """Перцентили (ближайший ранг) и максимум"""
+    if not values:
+        return {**{f"p{p}": None for p in points}, 'max': None}
+    ordered = sorted(values)
+    result: Dict[str, Optional[float]] = {}
+    for p in points:
+        rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+        result[f"p{p}"] = round(ordered[rank], 4)
+    result['max'] = round(ordered[-1], 4)
+    return result
+
+
+def run_days(started: datetime, finished: datetime) -> List[str]:
+    """Дни, на которые пришелся прогон (имена дневных логов)"""
+    days = []
+    day = started.date()
+    while day <= finished.date():
+        days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+
+def analyze_logs(output_dir: Path, poll_interval: float, slugs: List[str], days: List[str],
+                 settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Записи, объем и отставание опроса по логам.
+
+    Записи читаются через бэкенд хранения прогона (`LogStorage.iter_records`),
+    поэтому учитываются и файлы json/jsonl, и база sqlite.
+    Отставание - превышение интервала между соседними записями рынка над poll_interval.
+    """
+    records = 0
+    bytes_written = 0
+    lags: List[float] = []
+    markets = 0
+
+    for path in output_dir.rglob('*'):
+        if path.is_file():
+            bytes_written += path.stat().st_size
+
+    storage = create_storage(dict(settings or {}, output_directory=str(output_dir)))
+    try:
+        for slug in slugs:
+            timestamps = sorted(datetime.fromisoformat(r['timestamp']).timestamp()
+                                for day in days
+                                for r in storage.iter_records(storage.log_path(output_dir, slug, day)))
+            records += len(timestamps)
+            markets += 1 if timestamps else 0
+            lags.extend(max(0.0, b - a - poll_interval) for a, b in zip(timestamps, timestamps[1:]))
+    finally:
+        storage.close()
+
+    return {
+        'records_written': records,
+        'markets_with_records': markets,
+        'bytes_written': bytes_written,
+        'poll_lag_seconds': percentiles(lags),
+    }
+
+
+def _run_service(config_file: Path, duration: float, engine: str) -> None:
+    if engine == TARGET_SERVICE_ASYNC:
+        from async_engine import AsyncServiceManager
+        manager = AsyncServiceManager(str(config_file))
+    else:
+        from price_monitor_service import ServiceManager
+        manager = ServiceManager(str(config_file))
+
+    thread = Thread(target=manager.run, name="benchmark-service", daemon=True)
+    thread.start()
+    time.sleep(duration)
+    manager.stop()
+    thread.join(timeout=60)
+
+
+def _run_logger(markets: int, output_dir: Path, duration: float,
+                poll_interval: float, settings: Dict[str, Any]) -> None:
+    from api_client import configure_client
+    from market_cache import MarketCache
+    from storage import create_storage
+    from polymarket_price_logger import log_market_prices
+
+    configure_client(settings)
+    cache = MarketCache.from_settings(settings)
+    storage = create_storage(settings)
+    date_str = datetime.now().strftime("%Y-%m-%d")
+
+    threads = []
+    for i in range(markets):
+        slug = market_slug(i)
+        thread = Thread(target=log_market_prices, daemon=True, kwargs={
+            'market_id': slug,
+            'duration_minutes': duration / 60,
+            'log_file': str(storage.log_path(output_dir, slug, date_str)),
+            'storage': storage,
+            'market_cache': cache,
+            'poll_interval': poll_interval,
+        })
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join(timeout=duration + poll_interval + 60)
+
+
+def run_benchmark(target: str = TARGET_SERVICE,
+                  markets: int = 100,
+                  duration: float = 30,
+                  poll_interval: float = 5,
+                  latency_ms: float = 0,
+                  jitter_ms: float = 0,
+                  error_rate: float = 0.0,
+                  settings: Optional[Dict[str, Any]] = None,
+                  keep_logs: bool = False) -> Dict[str, Any]:
+    """
+    Один прогон: имитация API, N рынков, `duration` секунд работы.
+
+    Returns:
+        dict: параметры прогона и результаты (см. описание модуля)
+    """
+    if target not in TARGETS:
+        raise ValueError(f"Неизвестная цель: {target}. Доступны: {', '.join(TARGETS)}")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="pm-bench-"))
+    output_dir = work_dir / "logs"
+
+    with MockPolymarketAPI(latency_ms, jitter_ms, error_rate) as api:
+        run_settings = {
+            'poll_interval_seconds': poll_interval,
+            'config_reload_interval_seconds': 3600,
+            'output_directory': str(output_dir),
+            'gamma_api_base': api.url,
+            'clob_api_base': api.url,
+            'gamma_rate_limit_per_second': 0,
+            'clob_rate_limit_per_second': 0,
+            'http_pool_size': 100,
+            'storage_backend': 'jsonl',
+        }
+        run_settings.update(settings or {})
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        config_file = work_dir / "config.json"
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump({'markets': [{'slug': market_slug(i), 'name': market_slug(i)} for i in range(markets)],
+                       'settings': run_settings}, f)
+
+        sampler = ResourceSampler().start()
+        cpu_started = time.process_time()
+        started = time.monotonic()
+        started_at = datetime.now()
+
+        # Вывод сервиса (по строке на запись) не нужен и сам искажает замеры
+        with contextlib.redirect_stdout(io.StringIO()):
+            if target == TARGET_LOGGER:
+                _run_logger(markets, output_dir, duration, poll_interval, run_settings)
+            else:
+                _run_service(config_file, duration, target)
+
+        elapsed = time.monotonic() - started
+        cpu_seconds = time.process_time() - cpu_started
+        sampler.stop()
+        api_stats = api.stats()
+
+    results = analyze_logs(output_dir, poll_interval, [market_slug(i) for i in range(markets)],
+                           run_days(started_at, datetime.now()), run_settings)
+    requests_total = sum(api_stats['counts'].values())
+
+    report = {
+        'benchmark': {
+            'target': target,
+            'markets': markets,
+            'duration_seconds': duration,
+            'poll_interval_seconds': poll_interval,
+            'latency_ms': latency_ms,
+            'jitter_ms': jitter_ms,
+            'error_rate': error_rate,
+            'settings': settings or {},
+        },
+        'results': {
+            'elapsed_seconds': round(elapsed, 3),
+            'requests': requests_total,
+            'requests_per_second': round(requests_total / elapsed, 2) if elapsed else None,
+            'requests_by_endpoint': api_stats['counts'],
+            'errors_injected': api_stats['errors'],
+            'records_expected': int(markets * duration // poll_interval),
+            **results,
+            'cpu_seconds': round(cpu_seconds, 3),
+            'cpu_percent': round(100 * cpu_seconds / elapsed, 1) if elapsed else None,
+            'rss_peak_mb': round(sampler.peak_rss / 2 ** 20, 1) if sampler.peak_rss else None,
+            'threads_peak': sampler.peak_threads,
+        },
+    }
+
+    if keep_logs:
+        report['results']['output_directory'] = str(output_dir)
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return report
+
+
+def environment() -> Dict[str, Any]:
+    """Окружение прогона: версия Python, платформа, CPU, коммит git"""
+    commit = None
+    try:
+        head = Path(__file__).resolve().parent / ".git" / "HEAD"
+        ref = head.read_text().strip()
+        if ref.startswith("ref: "):
+            commit = (head.parent / ref[5:]).read_text().strip()
+        else:
+            commit = ref
+    except OSError:
+        pass
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+        'timestamp': datetime.now().isoformat(),
+    }
+
+
+def _parse_setting(item: str) -> Any:
+    key, _, value = item.partition('=')
+    if not key or not _:
+        raise ValueError(f"Ожидается key=value: {item}")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def _summary(report: Dict[str, Any]) -> str:
+    b, r = report['benchmark'], report['results']
+    lag = r['poll_lag_seconds']
+    return (f"{b['target']:>13} | рынков {b['markets']:>5} | {r['requests_per_second']:>8} req/s | "
+            f"записей {r['records_written']}/{r['records_expected']} | "
+            f"лаг p50={lag['p50']} p99={lag['p99']} max={lag['max']} | "
+            f"CPU {r['cpu_percent']}% | RSS {r['rss_peak_mb']} МБ | {r['bytes_written']} байт")
+
+
+def compare_reports(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    """Построчное сравнение прогонов с одинаковыми параметрами (target, markets)"""
+    def key(run: Dict[str, Any]):
+        return run['benchmark']['target'], run['benchmark']['markets']
+
+    old_runs = {key(run): run for run in old.get('runs', [])}
+    lines = []
+    for run in new.get('runs', []):
+        previous = old_runs.get(key(run))
+        if previous is None:
+            continue
+        lines.append(f"{key(run)[0]} / {key(run)[1]} рынков:")
+        for metric in ('requests_per_second', 'records_written', 'cpu_percent', 'rss_peak_mb', 'bytes_written'):
+            a, b = previous['results'].get(metric), run['results'].get(metric)
+            change = f" ({(b - a) / a * 100:+.1f}%)" if a and b is not None else ""
+            lines.append(f"  {metric}: {a} -> {b}{change}")
+        for point in ('p50', 'p99', 'max'):
+            a = previous['results']['poll_lag_seconds'].get(point)
+            b = run['results']['poll_lag_seconds'].get(point)
+            lines.append(f"  poll_lag {point}: {a} -> {b}")
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест на имитации Polymarket API")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_run = sub.add_parser('run', help="Прогон для одного или нескольких количеств рынков")
+    p_run.add_argument('--target', choices=TARGETS, default=TARGET_SERVICE, help="Что нагружать")
+    p_run.add_argument('--markets', default="10,100,1000", help="Количества рынков через запятую")
+    p_run.add_argument('--duration', type=float, default=30, help="Длительность прогона в секундах")
+    p_run.add_argument('--poll-interval', type=float, default=5, help="poll_interval_seconds")
+    p_run.add_argument('--latency-ms', type=float, default=0, help="Задержка ответа API (мс)")
+    p_run.add_argument('--jitter-ms', type=float, default=0, help="Случайная добавка к задержке (мс)")
+    p_run.add_argument('--error-rate', type=float, default=0.0, help="Доля ответов 503")
+    p_run.add_argument('--set', action='append', default=[], metavar="KEY=JSON",
+                       help="Параметр settings (можно указать несколько раз)")
+    p_run.add_argument('--out', help="Файл результатов (по умолчанию benchmarks/{время}.json)")
+    p_run.add_argument('--keep-logs', action='store_true', help="Не удалять логи прогона")
+
+    p_compare = sub.add_parser('compare', help="Сравнение двух файлов результатов")
+    p_compare.add_argument('old', help="Результаты предыдущей версии")
+    p_compare.add_argument('new', help="Результаты новой версии")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'compare':
+            with open(args.old, 'r', encoding='utf-8') as f:
+                old = json.load(f)
+            with open(args.new, 'r', encoding='utf-8') as f:
+                new = json.load(f)
+            for line in compare_reports(old, new):
+                print(line)
+            return 0
+
+        settings = dict(_parse_setting(item) for item in args.set)
+        report: Dict[str, Any] = {'environment': environment(), 'runs': []}
+
+        for markets in [int(m) for m in args.markets.split(',')]:
+            print(f"[Benchmark] {args.target}: {markets} рынков, {args.duration:g}с...")
+            run = run_benchmark(args.target, markets, args.duration, args.poll_interval,
+                                args.latency_ms, args.jitter_ms, args.error_rate, settings, args.keep_logs)
+            report['runs'].append(run)
+            print(f"[Benchmark] {_summary(run)}")
+
+        out = Path(args.out or f"benchmarks/{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[Benchmark] Результаты: {out}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Отслеживание изменений файла конфигурации.
+
+На Linux используется inotify (через ctypes, без внешних зависимостей):
+изменение config.json обнаруживается сразу, без опроса. Отслеживается
+каталог файла, поэтому замечаются и атомарные сохранения редакторов
+(запись во временный файл + rename). На других платформах и при ошибке
+inotify используется опрос mtime/размера с интервалом
+`config_reload_interval_seconds`; в режиме inotify тот же опрос остается
+страховкой для файловых систем, не присылающих событий (NFS, bind mount).
+
+Модуль также содержит сравнение конфигураций: какие рынки добавлены,
+удалены и изменены, и какие ключи `settings` поменялись.
+"""
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+
+MODE_INOTIFY = "inotify"
+MODE_POLLING = "polling"
+
+# Константы из <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+
+def _inotify_init(directory: Path) -> Optional[int]:
+    """Дескриптор inotify, следящий за каталогом (None, если inotify недоступен)"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(str(directory)), _WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+class ConfigWatcher:
+    """
+    Ожидание изменений файла конфигурации.
+
+    Args:
+        path: Путь к файлу конфигурации
+        poll_interval: Интервал проверки mtime/размера (секунды)
+        debounce: Пауза после события, чтобы дождаться окончания записи файла
+        use_inotify: False - только опрос
+    """
+
+    def __init__(self, path: str, poll_interval: float = 30, debounce: float = 0.2,
+                 use_inotify: bool = True):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._fd = _inotify_init(self.path.resolve().parent) if use_inotify else None
+        self._signature = self._stat()
+        self._last_poll = time.monotonic()
+
+    @classmethod
+    def from_settings(cls, path: str, settings: Optional[Dict[str, Any]] = None) -> "ConfigWatcher":
+        """Создание по разделу `settings` конфигурации"""
+        settings = settings or {}
+        return cls(
+            path,
+            poll_interval=settings.get('config_reload_interval_seconds', 30),
+            use_inotify=settings.get('config_watch_inotify', True),
+        )
+
+    @property
+    def mode(self) -> str:
+        return MODE_INOTIFY if self._fd is not None else MODE_POLLING
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _check(self) -> bool:
+        """Изменился ли файл с прошлой проверки"""
+        self._last_poll = time.monotonic()
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        return True
+
+    def _drain(self) -> bool:
+        """Чтение накопленных событий; True, если среди них есть события файла конфигурации"""
+        name = os.fsencode(self.path.name)
+        relevant = False
+        while self._fd is not None:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError:
+                # BlockingIOError - событий больше нет
+                return relevant
+            if not data:
+                return relevant
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                if data[offset:offset + length].rstrip(b'\0') == name:
+                    relevant = True
+                offset += length
+        return relevant
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Ожидание изменения файла не дольше timeout секунд.
+
+        Returns:
+            bool: файл изменился (True возвращается один раз на изменение)
+        """
+        if self._fd is not None:
+            try:
+                readable, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+            except (OSError, ValueError):
+                readable = []
+            if readable and self._drain():
+                # Редактор может писать файл в несколько приемов
+                time.sleep(self.debounce)
+                self._drain()
+                return self._check()
+        elif timeout > 0:
+            time.sleep(timeout)
+
+        if time.monotonic() - self._last_poll >= self.poll_interval:
+            return self._check()
+        return False
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def diff_markets(old: Dict[str, Dict[str, Any]],
+                 new: Dict[str, Dict[str, Any]]) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Сравнение наборов рынков (slug -> запись рынка).
+
+    Returns:
+        (добавленные, удаленные, измененные) slug
+    """
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    changed = sorted(slug for slug in new.keys() & old.keys() if new[slug] != old[slug])
+    return added, removed, changed
+
+
+def diff_settings(old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> List[str]:
+    """Ключи раздела `settings`, значения которых изменились"""
+    old = old or {}
+    new = new or {}
+    return sorted(key for key in old.keys() | new.keys() if old.get(key) != new.get(key))
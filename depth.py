@@ -0,0 +1,419 @@
+"""
+Запись глубины книги заявок в компактном бинарном формате.
+
+Для каждого рынка сохраняются N лучших уровней bid/ask обоих токенов (YES и NO)
+в файл `{slug}_{date}.depth`. Формат:
+
+    заголовок:  magic "PMDEPTH1", levels (uint16), tokens (uint16), резерв (uint32),
+                затем для каждого токена: длина (uint16) + token_id (utf-8)
+    запись:     ts (int64, мкс UTC), flags (uint8), count (uint16),
+                затем count слотов по 8 байт: slot (uint16), price (uint16), size (uint32)
+
+Слот - это (токен, сторона, уровень): slot = (token * 2 + side) * levels + level,
+side 0 - bid, 1 - ask. Цена хранится в десятитысячных (0..10000), объем - в сотых
+долях; пустой уровень - price = 0, size = 0.
+
+Запись с флагом KEYFRAME содержит все слоты, остальные - только слоты,
+изменившиеся относительно предыдущего снимка (дельта). Ключевой кадр пишется
+первым в файле и каждые `keyframe_every` снимков - с него можно начинать
+воспроизведение. Неизменившийся снимок занимает 11 байт.
+
+DepthReader читает файл через mmap без разбора JSON.
+
+Использование:
+    python depth.py dump logs/market-slug_2026-01-18.depth --start 2026-01-18T14:00
+    python depth.py info logs/market-slug_2026-01-18.depth
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Any, Optional, List, Tuple, Iterator, IO
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - опциональная зависимость
+    np = None
+
+from storage import PathLike, safe_slug
+
+DEPTH_EXTENSION = ".depth"
+MAGIC = b"PMDEPTH1"
+
+FILE_HEADER = struct.Struct("<8sHHI")
+TOKEN_LENGTH = struct.Struct("<H")
+RECORD_HEADER = struct.Struct("<qBH")
+SLOT = struct.Struct("<HHI")
+
+FLAG_KEYFRAME = 0x01
+
+PRICE_SCALE = 10000
+SIZE_SCALE = 100
+MAX_SIZE = 0xFFFFFFFF
+
+BID, ASK = 0, 1
+
+# Уровень книги: (цена в десятитысячных, объем в сотых)
+Level = Tuple[int, int]
+Books = Dict[str, Dict[str, List[Tuple[float, float]]]]
+
+
+def depth_path(output_dir: PathLike, slug: str, date_str: Optional[str] = None) -> Path:
+    """Путь файла глубины рынка за день"""
+    date_str = date_str or datetime.now().strftime("%Y-%m-%d")
+    return Path(output_dir) / f"{safe_slug(slug)}_{date_str}{DEPTH_EXTENSION}"
+
+
+def _to_us(timestamp: datetime) -> int:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.astimezone()
+    return int(timestamp.timestamp() * 1_000_000)
+
+
+def _from_us(ts_us: int) -> datetime:
+    return datetime.fromtimestamp(ts_us / 1_000_000, tz=timezone.utc).astimezone()
+
+
+def encode_book(books: Books, token_ids: List[str], levels: int) -> List[Level]:
+    """Книги заявок -> плоский список слотов (цена и объем в целых единицах)"""
+    slots: List[Level] = []
+    for token_id in token_ids:
+        book = books.get(token_id) or {}
+        for side in ('bids', 'asks'):
+            side_levels = (book.get(side) or [])[:levels]
+            for price, size in side_levels:
+                slots.append((int(round(price * PRICE_SCALE)),
+                              min(MAX_SIZE, int(round(size * SIZE_SCALE)))))
+            slots.extend([(0, 0)] * (levels - len(side_levels)))
+    return slots
+
+
+def decode_book(slots: List[Level], token_ids: List[str], levels: int) -> Books:
+    """Плоский список слотов -> книги заявок (пустые уровни отбрасываются)"""
+    books: Books = {}
+    for t, token_id in enumerate(token_ids):
+        book: Dict[str, List[Tuple[float, float]]] = {}
+        for side, name in ((BID, 'bids'), (ASK, 'asks')):
+            base = (t * 2 + side) * levels
+            book[name] = [(price / PRICE_SCALE, size / SIZE_SCALE)
+                          for price, size in slots[base:base + levels] if price or size]
+        books[token_id] = book
+    return books
+
+
+class DepthFile:
+    """Открытый на дозапись файл глубины одного рынка"""
+
+    def __init__(self, path: Path, token_ids: List[str], levels: int):
+        self.path = path
+        self.token_ids = token_ids
+        self.levels = levels
+        self.previous: Optional[List[Level]] = None
+        self.since_keyframe = 0
+        self.handle: IO[bytes] = self._open()
+
+    def _open(self) -> IO[bytes]:
+        if self.path.exists() and self.path.stat().st_size > 0:
+            try:
+                reader = DepthReader(self.path)
+            except ValueError:
+                # Оборванный заголовок или чужой формат - файл откладывается как несовместимый
+                compatible = False
+            else:
+                try:
+                    compatible = reader.levels == self.levels and reader.token_ids == self.token_ids
+                    valid_end = reader.valid_end()
+                finally:
+                    reader.close()
+
+            if compatible:
+                handle = open(self.path, 'r+b')
+                # Недописанная последняя запись (сбой при записи) отбрасывается
+                handle.truncate(valid_end)
+                handle.seek(valid_end)
+                return handle
+
+            # Состав токенов или глубина изменились - старый файл сохраняется под другим именем
+            self.path.replace(self.path.with_name(f"{self.path.stem}.{int(self.path.stat().st_mtime)}{DEPTH_EXTENSION}"))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        handle = open(self.path, 'wb')
+        handle.write(FILE_HEADER.pack(MAGIC, self.levels, len(self.token_ids), 0))
+        for token_id in self.token_ids:
+            encoded = token_id.encode('utf-8')
+            handle.write(TOKEN_LENGTH.pack(len(encoded)) + encoded)
+        return handle
+
+    def write(self, ts_us: int, slots: List[Level], keyframe_every: int) -> int:
+        """Запись снимка (ключевой кадр или дельта). Возвращает размер записи в байтах."""
+        keyframe = self.previous is None or self.since_keyframe >= keyframe_every
+        if keyframe:
+            changed = list(enumerate(slots))
+            self.since_keyframe = 0
+        else:
+            changed = [(i, slot) for i, (slot, old) in enumerate(zip(slots, self.previous)) if slot != old]
+            self.since_keyframe += 1
+
+        parts = [RECORD_HEADER.pack(ts_us, FLAG_KEYFRAME if keyframe else 0, len(changed))]
+        parts.extend(SLOT.pack(i, price, size) for i, (price, size) in changed)
+        data = b"".join(parts)
+
+        self.handle.write(data)
+        self.handle.flush()
+        self.previous = slots
+        return len(data)
+
+    def close(self) -> None:
+        self.handle.close()
+
+
+class DepthRecorder:
+    """
+    Запись снимков глубины для всех рынков.
+
+    Args:
+        output_dir: Директория для файлов глубины
+        levels: Количество уровней на сторону
+        keyframe_every: Ключевой кадр каждые столько снимков
+    """
+
+    def __init__(self, output_dir: PathLike, levels: int = 10, keyframe_every: int = 100):
+        self.output_dir = Path(output_dir)
+        self.levels = max(1, int(levels))
+        self.keyframe_every = max(1, int(keyframe_every))
+        self._files: Dict[str, DepthFile] = {}
+        self._lock = Lock()
+        self.snapshots = 0
+        self.bytes_written = 0
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "DepthRecorder":
+        """Создание записи глубины по разделу `settings` конфигурации"""
+        settings = settings or {}
+        return cls(
+            output_dir=settings.get('output_directory', 'logs'),
+            levels=settings.get('depth_levels', 10),
+            keyframe_every=settings.get('depth_keyframe_every', 100),
+        )
+
+    def record(self, slug: str, token_ids: List[str], books: Books,
+               timestamp: Optional[datetime] = None) -> None:
+        """Запись снимка книг заявок рынка (token_ids - порядок токенов в файле)"""
+        timestamp = timestamp or datetime.now()
+        path = depth_path(self.output_dir, slug, timestamp.strftime("%Y-%m-%d"))
+        slots = encode_book(books, token_ids, self.levels)
+
+        with self._lock:
+            depth_file = self._files.get(slug)
+            if depth_file is None or depth_file.path != path or depth_file.token_ids != token_ids:
+                if depth_file is not None:
+                    depth_file.close()
+                depth_file = DepthFile(path, list(token_ids), self.levels)
+                self._files[slug] = depth_file
+
+            self.bytes_written += depth_file.write(_to_us(timestamp), slots, self.keyframe_every)
+            self.snapshots += 1
+
+    def forget(self, slug: str) -> None:
+        """Закрытие файла рынка (монитор остановлен)"""
+        with self._lock:
+            depth_file = self._files.pop(slug, None)
+            if depth_file is not None:
+                depth_file.close()
+
+    def close(self) -> None:
+        with self._lock:
+            for depth_file in self._files.values():
+                depth_file.close()
+            self._files.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'snapshots': self.snapshots, 'bytes': self.bytes_written, 'files': len(self._files)}
+
+
+class DepthReader:
+    """
+    Чтение файла глубины через mmap.
+
+    Снимки восстанавливаются последовательным применением дельт; для чтения
+    с момента `start` воспроизведение начинается с ближайшего предшествующего
+    ключевого кадра.
+    """
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Пустой файл глубины: {self.path}")
+
+        # Заголовок или список токенов мог оборваться при сбое во время создания файла
+        if len(self._mmap) < FILE_HEADER.size:
+            self.close()
+            raise ValueError(f"Оборванный заголовок файла глубины: {self.path}")
+
+        magic, self.levels, token_count, _ = FILE_HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Неверный формат файла глубины: {self.path}")
+
+        offset = FILE_HEADER.size
+        self.token_ids: List[str] = []
+        for _ in range(token_count):
+            length = None
+            if offset + TOKEN_LENGTH.size <= len(self._mmap):
+                (length,) = TOKEN_LENGTH.unpack_from(self._mmap, offset)
+                offset += TOKEN_LENGTH.size
+            if length is None or offset + length > len(self._mmap):
+                self.close()
+                raise ValueError(f"Оборванный заголовок файла глубины: {self.path}")
+            self.token_ids.append(bytes(self._mmap[offset:offset + length]).decode('utf-8'))
+            offset += length
+
+        self.data_offset = offset
+        self.slot_count = token_count * 2 * self.levels
+        self._keyframes: Optional[List[Tuple[int, int]]] = None
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "DepthReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _iter_raw(self, offset: Optional[int] = None) -> Iterator[Tuple[int, int, int, int, int]]:
+        """(offset, ts_us, flags, count, offset слотов) для каждой полной записи"""
+        buf = self._mmap
+        size = len(buf)
+        offset = self.data_offset if offset is None else offset
+        while offset + RECORD_HEADER.size <= size:
+            ts_us, flags, count = RECORD_HEADER.unpack_from(buf, offset)
+            slots_offset = offset + RECORD_HEADER.size
+            end = slots_offset + count * SLOT.size
+            if end > size:
+                break
+            yield offset, ts_us, flags, count, slots_offset
+            offset = end
+
+    def valid_end(self) -> int:
+        """Смещение конца последней полной записи"""
+        end = self.data_offset
+        for _, _, _, count, slots_offset in self._iter_raw():
+            end = slots_offset + count * SLOT.size
+        return end
+
+    def keyframes(self) -> List[Tuple[int, int]]:
+        """Список (ts_us, offset) ключевых кадров (строится при первом обращении)"""
+        if self._keyframes is None:
+            self._keyframes = [(ts_us, offset) for offset, ts_us, flags, _, _ in self._iter_raw()
+                               if flags & FLAG_KEYFRAME]
+        return self._keyframes
+
+    def iter_slots(self, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None) -> Iterator[Tuple[int, List[Level]]]:
+        """Генератор (ts_us, слоты) для снимков в интервале [start, end)"""
+        start_us = _to_us(start) if start is not None else None
+        end_us = _to_us(end) if end is not None else None
+
+        offset = None
+        if start_us is not None:
+            for ts_us, keyframe_offset in self.keyframes():
+                if ts_us > start_us:
+                    break
+                offset = keyframe_offset
+
+        buf = self._mmap
+        slots: Optional[List[Level]] = None
+        for _, ts_us, flags, count, slots_offset in self._iter_raw(offset):
+            if end_us is not None and ts_us >= end_us:
+                break
+            if flags & FLAG_KEYFRAME:
+                slots = [(0, 0)] * self.slot_count
+            elif slots is None:
+                continue
+            for i in range(count):
+                index, price, size = SLOT.unpack_from(buf, slots_offset + i * SLOT.size)
+                slots[index] = (price, size)
+            if start_us is not None and ts_us < start_us:
+                continue
+            yield ts_us, list(slots)
+
+    def iter_snapshots(self, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> Iterator[Tuple[datetime, Books]]:
+        """Генератор (время, книги заявок по token_id) для снимков в интервале [start, end)"""
+        for ts_us, slots in self.iter_slots(start, end):
+            yield _from_us(ts_us), decode_book(slots, self.token_ids, self.levels)
+
+    def to_arrays(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Снимки в виде массивов NumPy.
+
+        Returns:
+            dict: 'timestamp' (datetime64[us], UTC), 'price' и 'size' (float64) формы
+            (снимки, токены, 2, уровни) - сторона 0 bid, 1 ask; пустые уровни - NaN
+        """
+        if np is None:
+            raise RuntimeError("Для to_arrays требуется numpy: pip install numpy")
+
+        timestamps: List[int] = []
+        rows: List[List[Level]] = []
+        for ts_us, slots in self.iter_slots(start, end):
+            timestamps.append(ts_us)
+            rows.append(slots)
+
+        shape = (len(rows), len(self.token_ids), 2, self.levels)
+        raw = np.array(rows, dtype=np.float64).reshape(shape + (2,)) if rows else np.zeros(shape + (2,))
+        empty = (raw[..., 0] == 0) & (raw[..., 1] == 0)
+        price = np.where(empty, np.nan, raw[..., 0] / PRICE_SCALE)
+        size = np.where(empty, np.nan, raw[..., 1] / SIZE_SCALE)
+        return {'timestamp': np.array(timestamps, dtype='datetime64[us]'), 'price': price, 'size': size}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Чтение файлов глубины книги заявок")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_info = sub.add_parser('info', help="Сводка по файлу")
+    p_info.add_argument('path', help="Файл .depth")
+
+    p_dump = sub.add_parser('dump', help="Вывод снимков в JSON Lines")
+    p_dump.add_argument('path', help="Файл .depth")
+    p_dump.add_argument('--start', help="Начало интервала (ISO формат)")
+    p_dump.add_argument('--end', help="Конец интервала (ISO формат)")
+
+    args = parser.parse_args(argv)
+
+    try:
+        with DepthReader(args.path) as reader:
+            if args.command == 'info':
+                count = sum(1 for _ in reader._iter_raw())
+                print(f"Токенов: {len(reader.token_ids)}, уровней: {reader.levels}")
+                print(f"Снимков: {count}, ключевых кадров: {len(reader.keyframes())}")
+                print(f"Размер: {os.path.getsize(args.path)} байт")
+            else:
+                snapshots = reader.iter_snapshots(
+                    start=datetime.fromisoformat(args.start) if args.start else None,
+                    end=datetime.fromisoformat(args.end) if args.end else None,
+                )
+                for timestamp, books in snapshots:
+                    print(json.dumps({'timestamp': timestamp.isoformat(), 'books': books}, ensure_ascii=False))
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+Автоматический поиск рынков в Gamma API.
+
+Вместо ручного перечисления slug в config.json рынки выбираются по фильтрам
+(тег, событие, минимальные объем и ликвидность, active/closed). Список
+`/markets` запрашивается страницами параллельно; ответ уже содержит
+clobTokenIds, поэтому детали всех найденных рынков сразу попадают в
+MarketCache и мониторы инициализируются без отдельных запросов по slug.
+
+ServiceManager периодически повторяет поиск (`discovery_interval_seconds`):
+новые рынки запускаются, а закрытые/разрешенные и переставшие подходить под
+фильтры - останавливаются. Рынки из `markets` в config.json имеют приоритет:
+запись с `"enabled": false` исключает рынок, даже если он найден поиском.
+
+Использование:
+    python discovery.py --tag-id 2 --min-volume 100000 --max-markets 50
+"""
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+
+from api_client import PolymarketClient, get_client, extract_token_id
+from market_cache import MarketCache, is_market_closed
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class MarketDiscovery:
+    """
+    Поиск рынков по фильтрам.
+
+    Args:
+        client: HTTP клиент (по умолчанию общий)
+        tag_id: ID тега Gamma
+        event_slug: Slug события - рынки берутся из события вместо общего списка
+        min_volume: Минимальный объем (volumeNum)
+        min_liquidity: Минимальная ликвидность (liquidityNum)
+        active: Только активные рынки (None - без фильтра)
+        closed: Закрытые (True) или открытые (False) рынки (None - без фильтра)
+        max_markets: Максимум рынков (по убыванию объема, None - без ограничения)
+        page_size: Размер страницы списка
+        concurrency: Количество одновременно запрашиваемых страниц
+    """
+
+    def __init__(self,
+                 client: Optional[PolymarketClient] = None,
+                 tag_id: Optional[int] = None,
+                 event_slug: Optional[str] = None,
+                 min_volume: float = 0,
+                 min_liquidity: float = 0,
+                 active: Optional[bool] = True,
+                 closed: Optional[bool] = False,
+                 max_markets: Optional[int] = None,
+                 page_size: int = DEFAULT_PAGE_SIZE,
+                 concurrency: int = DEFAULT_CONCURRENCY):
+        self.client = client
+        self.tag_id = tag_id
+        self.event_slug = event_slug
+        self.min_volume = min_volume or 0
+        self.min_liquidity = min_liquidity or 0
+        self.active = active
+        self.closed = closed
+        self.max_markets = max_markets
+        self.page_size = max(1, int(page_size))
+        self.concurrency = max(1, int(concurrency))
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None,
+                      client: Optional[PolymarketClient] = None) -> "MarketDiscovery":
+        """Создание поиска по разделу `settings` конфигурации (ключи discovery_*)"""
+        settings = settings or {}
+        return cls(
+            client=client,
+            tag_id=settings.get('discovery_tag_id'),
+            event_slug=settings.get('discovery_event_slug'),
+            min_volume=settings.get('discovery_min_volume', 0),
+            min_liquidity=settings.get('discovery_min_liquidity', 0),
+            active=settings.get('discovery_active', True),
+            closed=settings.get('discovery_closed', False),
+            max_markets=settings.get('discovery_max_markets'),
+            page_size=settings.get('discovery_page_size', DEFAULT_PAGE_SIZE),
+            concurrency=settings.get('discovery_concurrency', DEFAULT_CONCURRENCY),
+        )
+
+    def _client(self) -> PolymarketClient:
+        return self.client or get_client()
+
+    def _params(self) -> Dict[str, Any]:
+        params: Dict[str, Any] = {'order': 'volumeNum', 'ascending': 'false'}
+        if self.tag_id is not None:
+            params['tag_id'] = self.tag_id
+        if self.active is not None:
+            params['active'] = str(self.active).lower()
+        if self.closed is not None:
+            params['closed'] = str(self.closed).lower()
+        if self.min_volume:
+            params['volume_num_min'] = self.min_volume
+        if self.min_liquidity:
+            params['liquidity_num_min'] = self.min_liquidity
+        return params
+
+    def matches(self, market: Dict[str, Any]) -> bool:
+        """Проверка фильтров на стороне клиента (API может игнорировать часть параметров)"""
+        if not market.get('slug') or not market.get('clobTokenIds'):
+            return False
+        if market.get('enableOrderBook') is False:
+            return False
+        if self.closed is False and is_market_closed(market):
+            return False
+        if self.closed is True and market.get('closed') is not True:
+            return False
+        if self.active is True and market.get('active') is False:
+            return False
+        if _number(market.get('volumeNum', market.get('volume'))) < self.min_volume:
+            return False
+        if _number(market.get('liquidityNum', market.get('liquidity'))) < self.min_liquidity:
+            return False
+        return True
+
+    def _fetch_page(self, offset: int) -> Optional[List[Dict[str, Any]]]:
+        params = dict(self._params(), limit=self.page_size, offset=offset)
+        return self._client().list_markets(params)
+
+    def list_markets(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Все рынки, подходящие под фильтры.
+
+        Страницы запрашиваются волнами по `concurrency` штук, пока не придет
+        неполная страница или не наберется `max_markets` подходящих рынков.
+        Если хотя бы одна страница не получена, возвращается None: по неполному
+        списку нельзя решать, какие рынки останавливать.
+        """
+        unique: Dict[str, Dict[str, Any]] = {}
+
+        def add(markets: List[Dict[str, Any]]) -> None:
+            for market in markets:
+                if self.matches(market):
+                    unique.setdefault(market['slug'], market)
+
+        if self.event_slug:
+            events = self._client().list_events({'slug': self.event_slug})
+            if events is None:
+                return None
+            add([m for event in events for m in event.get('markets') or []])
+        else:
+            offset = 0
+            finished = False
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="discovery") as pool:
+                while not finished:
+                    offsets = [offset + i * self.page_size for i in range(self.concurrency)]
+                    for page in pool.map(self._fetch_page, offsets):
+                        if page is None:
+                            return None
+                        add(page)
+                        if len(page) < self.page_size:
+                            finished = True
+                            break
+                    offset += self.concurrency * self.page_size
+                    # Учитываются только подходящие под фильтры рынки
+                    if self.max_markets and len(unique) >= self.max_markets:
+                        finished = True
+
+        result = sorted(unique.values(), key=lambda m: _number(m.get('volumeNum', m.get('volume'))), reverse=True)
+        if self.max_markets:
+            result = result[:self.max_markets]
+        return result
+
+    def discover(self, market_cache: Optional[MarketCache] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Поиск рынков для мониторинга.
+
+        Детали найденных рынков кладутся в market_cache, чтобы мониторы
+        получили token_id без запросов по slug.
+
+        Returns:
+            dict: slug -> запись рынка в формате раздела `markets` config.json,
+            или None, если список получить не удалось
+        """
+        markets = self.list_markets()
+        if markets is None:
+            return None
+
+        found: Dict[str, Dict[str, Any]] = {}
+        for market in markets:
+            if not extract_token_id(market):
+                continue
+            if market_cache is not None:
+                market_cache.put(market['slug'], market)
+            found[market['slug']] = {
+                'slug': market['slug'],
+                'name': market.get('question') or market['slug'],
+                'enabled': True,
+                'discovered': True,
+            }
+        return found
+
+
+def merge_markets(config: Dict[str, Any], discovered: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Рынки для мониторинга: найденные поиском и перечисленные в config.json.
+
+    Запись в config.json имеет приоритет: `"enabled": false` исключает рынок.
+    """
+    configured = {m['slug']: m for m in config.get('markets', [])}
+    markets = {slug: m for slug, m in discovered.items() if slug not in configured}
+    markets.update({slug: m for slug, m in configured.items() if m.get('enabled', True)})
+    return markets
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Поиск рынков Polymarket по фильтрам")
+    parser.add_argument('--tag-id', type=int, help="ID тега Gamma")
+    parser.add_argument('--event', help="Slug события")
+    parser.add_argument('--min-volume', type=float, default=0, help="Минимальный объем")
+    parser.add_argument('--min-liquidity', type=float, default=0, help="Минимальная ликвидность")
+    parser.add_argument('--closed', action='store_true', help="Искать закрытые рынки вместо открытых")
+    parser.add_argument('--max-markets', type=int, help="Максимум рынков (по убыванию объема)")
+    parser.add_argument('--json', action='store_true', help="Вывести записи для раздела markets config.json")
+    args = parser.parse_args(argv)
+
+    discovery = MarketDiscovery(
+        tag_id=args.tag_id,
+        event_slug=args.event,
+        min_volume=args.min_volume,
+        min_liquidity=args.min_liquidity,
+        active=None if args.closed else True,
+        closed=args.closed,
+        max_markets=args.max_markets,
+    )
+
+    found = discovery.discover()
+    if found is None:
+        print("Ошибка: не удалось получить список рынков")
+        return 1
+
+    if args.json:
+        entries = [{'slug': m['slug'], 'name': m['name'], 'enabled': True} for m in found.values()]
+        print(json.dumps(entries, ensure_ascii=False, indent=2))
+    else:
+        for market in found.values():
+            print(f"{market['slug']}  {market['name']}")
+        print(f"Найдено рынков: {len(found)}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
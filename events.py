@@ -0,0 +1,321 @@
+"""
+Мониторинг событий с несколькими исходами (выборы, турниры и т.п.).
+
+Вместо отдельного slug, потока и запросов на каждого кандидата событие
+задается одной записью в разделе `events` config.json. Все исходы события
+(рынки и их YES токены) получаются одним запросом Gamma `/events`, а цены
+всех исходов всех событий - одним пакетным циклом `POST /prices`.
+
+Каждый тик записывается одной компактной строкой на событие в
+`{output_directory}/events/{slug}_{date}` - массивы цен в порядке исходов:
+
+    {"timestamp": "...", "bid": [...], "ask": [...], "mid": [...], "overround": 0.031, "missing": 0}
+
+Первая строка каждого файла (и строка после изменения набора исходов) -
+ключевой кадр с `"keyframe": true`, названиями исходов и token_id.
+`overround` - сумма mid по исходам минус 1 (для взаимоисключающих исходов
+близка к нулю, положительная - суммарная переоценка).
+
+Использование:
+    python events.py resolve presidential-election-winner-2028
+    python events.py metrics logs/events/presidential-election-winner-2028_2026-01-28.jsonl
+"""
+import sys
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Sequence, Iterator
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - опциональная зависимость
+    np = None
+
+from api_client import PolymarketClient, get_client, extract_token_id
+from market_cache import is_market_closed
+from storage import LogStorage, JsonArrayStorage, PathLike, iter_log_records
+from writer import LogWriter
+
+EVENTS_DIR = "events"
+PRICE_FIELDS = ('bid', 'ask', 'mid')
+
+
+def extract_outcomes(event: Dict[str, Any], include_closed: bool = False) -> List[Dict[str, Any]]:
+    """
+    Исходы события: по одному на рынок события (YES токен рынка).
+
+    Returns:
+        list: {'label', 'market_slug', 'token_id'} в порядке рынков события
+    """
+    outcomes = []
+    for market in event.get('markets') or []:
+        if not include_closed and is_market_closed(market):
+            continue
+        if not market.get('clobTokenIds'):
+            continue
+        token_id = extract_token_id(market)
+        if not token_id:
+            continue
+        outcomes.append({
+            'label': market.get('groupItemTitle') or market.get('question') or market.get('slug'),
+            'market_slug': market.get('slug'),
+            'token_id': token_id,
+        })
+    return outcomes
+
+
+def _nansum(values: List[Optional[float]]) -> Optional[float]:
+    present = [v for v in values if v is not None]
+    return sum(present) if present else None
+
+
+def event_metrics(mids: Sequence[Optional[float]]) -> Dict[str, Any]:
+    """Производные показатели одного тика: overround (сумма mid - 1) и число исходов без цены"""
+    if np is not None:
+        values = np.array([np.nan if v is None else v for v in mids], dtype=np.float64)
+        missing = int(np.isnan(values).sum())
+        total = float(np.nansum(values)) if missing < values.size else None
+    else:
+        missing = sum(1 for v in mids if v is None)
+        total = _nansum(list(mids))
+    return {
+        'overround': None if total is None else round(total - 1.0, 6),
+        'missing': missing,
+    }
+
+
+class EventMonitor:
+    """
+    Мониторинг одного события: исходы, запись компактных строк.
+
+    Цены для монитора запрашивает ServiceManager общим пакетным циклом событий.
+    """
+
+    def __init__(self, slug: str, name: str, output_dir: str, storage: Optional[LogStorage] = None,
+                 writer: Optional[LogWriter] = None, client: Optional[PolymarketClient] = None):
+        self.slug = slug
+        self.name = name
+        self.output_dir = Path(output_dir) / EVENTS_DIR
+        self.storage = storage or JsonArrayStorage()
+        self.writer = writer
+        self.client = client
+        self.should_stop = False
+        self.outcomes: List[Dict[str, Any]] = []
+        self.token_ids: List[str] = []
+        self.resolved_at: Optional[float] = None
+        # Неудачное получение исходов повторяется с задержкой от retry_min до retry_max
+        self.failed_at: Optional[float] = None
+        self.failures = 0
+        self.retry_min: float = 5
+        self.retry_max: float = 300
+        self.last_keyframe_path: Optional[Path] = None
+        self.iteration = 0
+
+    def resolve(self) -> bool:
+        """Получение всех исходов события одним запросом Gamma"""
+        client = self.client or get_client()
+        events = client.list_events({'slug': self.slug})
+        if not events:
+            print(f"[{self.name}] Ошибка: событие не найдено")
+            return False
+
+        outcomes = extract_outcomes(events[0])
+        if not outcomes:
+            if extract_outcomes(events[0], include_closed=True):
+                # Все исходы закрыты - событие завершено
+                print(f"[{self.name}] У события нет открытых исходов, мониторинг остановлен")
+                self.outcomes = []
+                self.token_ids = []
+                self.stop()
+            else:
+                print(f"[{self.name}] Ошибка: у события нет исходов")
+            return False
+
+        if [o['token_id'] for o in outcomes] != self.token_ids:
+            print(f"[{self.name}] Исходов: {len(outcomes)}")
+            # Новый набор исходов описывается следующим ключевым кадром
+            self.last_keyframe_path = None
+        self.outcomes = outcomes
+        self.token_ids = [o['token_id'] for o in outcomes]
+        return True
+
+    @property
+    def pending(self) -> bool:
+        """Исходы еще ни разу не запрашивались (новый монитор)"""
+        return self.resolved_at is None and self.failed_at is None and not self.should_stop
+
+    def retry_delay(self) -> float:
+        return min(self.retry_max, self.retry_min * 2 ** max(0, self.failures - 1))
+
+    def refresh(self, now: float, refresh_interval: float) -> None:
+        """Уточнение исходов, если пора: раз в refresh_interval, после ошибки - через retry_delay()"""
+        if self.failed_at is not None:
+            due = now - self.failed_at >= self.retry_delay()
+        else:
+            due = self.resolved_at is None or now - self.resolved_at >= refresh_interval
+        if not due:
+            return
+
+        if self.resolve():
+            self.resolved_at = now
+            self.failed_at = None
+            self.failures = 0
+        elif not self.should_stop:
+            self.failed_at = now
+            self.failures += 1
+            print(f"[{self.name}] Повторный запрос исходов через {self.retry_delay():g}с")
+
+    def get_log_filename(self) -> Path:
+        return self.storage.log_path(self.output_dir, self.slug)
+
+    def build_row(self, prices: Dict[str, Dict[str, Optional[float]]], path: Path) -> Dict[str, Any]:
+        """Компактная строка тика (ключевой кадр - с описанием исходов)"""
+        row: Dict[str, Any] = {'timestamp': datetime.now().isoformat()}
+        for field in PRICE_FIELDS:
+            row[field] = [(prices.get(token) or {}).get(field) for token in self.token_ids]
+        row.update(event_metrics(row['mid']))
+
+        if path != self.last_keyframe_path:
+            row.update({
+                'keyframe': True,
+                'event_slug': self.slug,
+                'event_name': self.name,
+                'outcomes': [o['label'] for o in self.outcomes],
+                'market_slugs': [o['market_slug'] for o in self.outcomes],
+                'token_ids': list(self.token_ids),
+            })
+            self.last_keyframe_path = path
+        return row
+
+    def handle_prices(self, prices: Dict[str, Dict[str, Optional[float]]],
+                      deadline: Optional[float] = None) -> bool:
+        """Запись одного тика по результатам общего пакетного запроса"""
+        if not self.token_ids:
+            return False
+        if not any(token in prices for token in self.token_ids):
+            print(f"[{self.name}] Не удалось получить цены")
+            return False
+
+        path = self.get_log_filename()
+        row = self.build_row(prices, path)
+        try:
+            if self.writer:
+                if not self.writer.submit(path, row, deadline):
+                    print(f"[{self.name}] Очередь записи переполнена, запись отброшена")
+                    # Ключевой кадр мог быть отброшен - повторяем его в следующей строке
+                    self.last_keyframe_path = None
+                    return False
+            else:
+                self.storage.append(path, row)
+        except Exception as e:
+            print(f"[{self.name}] Ошибка записи в файл: {e}")
+            self.last_keyframe_path = None
+            return False
+
+        self.iteration += 1
+        overround = row['overround']
+        print(f"[{self.name}] Запись #{self.iteration}: исходов {len(self.token_ids)}, "
+              f"без цены {row['missing']}, overround={overround if overround is None else f'{overround:+.4f}'}")
+        return True
+
+    def stop(self):
+        self.should_stop = True
+
+
+def iter_event_rows(path: PathLike) -> Iterator[Dict[str, Any]]:
+    """Строки лога события с названиями исходов и token_id из последнего ключевого кадра"""
+    outcomes: List[str] = []
+    token_ids: List[str] = []
+    for row in iter_log_records(path):
+        if row.get('keyframe'):
+            outcomes = row.get('outcomes', [])
+            token_ids = row.get('token_ids', [])
+        yield dict(row, outcomes=outcomes, token_ids=token_ids)
+
+
+def event_arrays(path: PathLike) -> Dict[str, Any]:
+    """
+    Лог события -> матрицы NumPy [тик × исход].
+
+    Исходы, добавленные или снятые в течение файла, объединяются по token_id
+    (в тиках, где исхода не было, значения NaN). Производные показатели
+    считаются векторно по всей матрице.
+
+    Returns:
+        dict: timestamp (datetime64[us]), token_ids, outcomes, bid/ask/mid (float64 [n × k]),
+        overround, mid_sum, ask_sum, bid_sum, missing (по тикам)
+    """
+    if np is None:
+        raise RuntimeError("Для event_arrays требуется numpy (pip install numpy)")
+
+    rows = list(iter_event_rows(path))
+    columns: Dict[str, int] = {}
+    labels: List[str] = []
+    for row in rows:
+        for token, label in zip(row['token_ids'], row['outcomes']):
+            if token not in columns:
+                columns[token] = len(columns)
+                labels.append(label)
+
+    shape = (len(rows), len(columns))
+    result: Dict[str, Any] = {
+        'timestamp': np.array([row['timestamp'] for row in rows], dtype='datetime64[us]'),
+        'token_ids': list(columns),
+        'outcomes': labels,
+    }
+    for field in PRICE_FIELDS:
+        matrix = np.full(shape, np.nan, dtype=np.float64)
+        for i, row in enumerate(rows):
+            index = [columns[token] for token in row['token_ids']]
+            values = np.array([np.nan if v is None else v for v in row.get(field, [])], dtype=np.float64)
+            if values.size == len(index):
+                matrix[i, index] = values
+        result[field] = matrix
+
+    result['missing'] = np.array([row.get('missing', 0) for row in rows], dtype=np.int64)
+    for field in PRICE_FIELDS:
+        result[f'{field}_sum'] = np.nansum(result[field], axis=1)
+    result['overround'] = np.where(np.isnan(result['mid']).all(axis=1), np.nan, result['mid_sum'] - 1.0)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="События с несколькими исходами")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_resolve = sub.add_parser('resolve', help="Исходы события (один запрос Gamma)")
+    p_resolve.add_argument('slug', help="Slug события")
+    p_resolve.add_argument('--closed', action='store_true', help="Включая закрытые исходы")
+
+    p_metrics = sub.add_parser('metrics', help="Сводка overround по логу события")
+    p_metrics.add_argument('path', help="Файл лога события")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'resolve':
+            events = get_client().list_events({'slug': args.slug})
+            if not events:
+                print("Ошибка: событие не найдено")
+                return 1
+            outcomes = extract_outcomes(events[0], include_closed=args.closed)
+            for outcome in outcomes:
+                print(f"{outcome['label']}  {outcome['market_slug']}  {outcome['token_id']}")
+            print(f"Исходов: {len(outcomes)}")
+        elif args.command == 'metrics':
+            data = event_arrays(args.path)
+            overround = data['overround'][~np.isnan(data['overround'])]
+            print(f"Тиков: {len(data['timestamp'])}, исходов: {len(data['outcomes'])}")
+            if overround.size:
+                print(f"Overround: среднее {overround.mean():+.4f}, мин {overround.min():+.4f}, "
+                      f"макс {overround.max():+.4f}")
+            print(f"Сумма ask (стоимость покупки всех исходов), среднее: {np.nanmean(data['ask_sum']):.4f}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Кэш метаданных рынков: slug -> детали рынка (Gamma API) и token_id.
+
+- LRU в памяти с TTL
+- Опциональный файл на диске, чтобы после перезапуска кэш был "теплым"
+- Закрытые/разрешенные рынки не кэшируются и удаляются из кэша
+- Счетчики попаданий и промахов
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from api_client import get_market_details, extract_token_id
+
+
+def is_market_closed(market_details: Dict[str, Any]) -> bool:
+    """Рынок закрыт или разрешен - его метаданные больше не стоит кэшировать"""
+    if market_details.get('closed') is True:
+        return True
+    if market_details.get('active') is False:
+        return True
+    return str(market_details.get('umaResolutionStatus', '')).lower() == 'resolved'
+
+
+class MarketCache:
+    """
+    Потокобезопасный кэш деталей рынков.
+
+    Args:
+        ttl_seconds: Время жизни записи в памяти
+        max_entries: Максимальное количество записей (вытеснение LRU)
+        cache_file: Путь к файлу на диске (None - только память)
+        persist_ttl_seconds: Время жизни записей, загруженных с диска
+    """
+
+    SAVE_INTERVAL = 5.0
+
+    def __init__(self,
+                 ttl_seconds: float = 3600,
+                 max_entries: int = 10000,
+                 cache_file: Optional[str] = None,
+                 persist_ttl_seconds: float = 7 * 24 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.persist_ttl_seconds = persist_ttl_seconds
+
+        # slug -> (время получения, детали, загружено с диска)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any], bool]]" = OrderedDict()
+        self._lock = Lock()
+        self._dirty = False
+        self._last_save = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.prefetches = 0
+
+        if self.cache_file:
+            self._load()
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "MarketCache":
+        """Создание кэша по разделу `settings` конфигурации"""
+        settings = settings or {}
+        return cls(
+            ttl_seconds=settings.get('market_cache_ttl_seconds', 3600),
+            max_entries=settings.get('market_cache_max_entries', 10000),
+            cache_file=settings.get('market_cache_file'),
+            persist_ttl_seconds=settings.get('market_cache_persist_ttl_seconds', 7 * 24 * 3600),
+        )
+
+    def _load(self) -> None:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[Cache] Ошибка чтения {self.cache_file}: {e}")
+            return
+
+        now = time.time()
+        loaded = 0
+        for slug, item in data.items():
+            fetched_at = item.get('fetched_at', 0)
+            if now - fetched_at < self.persist_ttl_seconds and isinstance(item.get('details'), dict):
+                self._entries[slug] = (fetched_at, item['details'], True)
+                loaded += 1
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        print(f"[Cache] Загружено {loaded} рынков из {self.cache_file}")
+
+    def save(self) -> None:
+        """Сохранение кэша на диск (атомарно, через временный файл)"""
+        if not self.cache_file:
+            return
+
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {slug: {'fetched_at': fetched_at, 'details': details}
+                    for slug, (fetched_at, details, _) in self._entries.items()}
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_file.with_suffix(self.cache_file.suffix + ".tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            print(f"[Cache] Ошибка записи {self.cache_file}: {e}")
+
+    def _is_fresh(self, fetched_at: float, from_disk: bool = False) -> bool:
+        ttl = self.persist_ttl_seconds if from_disk else self.ttl_seconds
+        return time.time() - fetched_at < ttl
+
+    def get(self, slug: str) -> Optional[Dict[str, Any]]:
+        """Детали рынка из кэша (без обращения к API) или None"""
+        with self._lock:
+            entry = self._entries.get(slug)
+            if entry is None or not self._is_fresh(entry[0], from_disk=entry[2]):
+                if entry is not None:
+                    del self._entries[slug]
+                    self._dirty = True
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(slug)
+            self.hits += 1
+            if entry[2]:
+                self.disk_hits += 1
+            return entry[1]
+
+    def contains(self, slug: str) -> bool:
+        """Есть ли свежая запись о рынке (не учитывается в счетчиках попаданий и промахов)"""
+        with self._lock:
+            entry = self._entries.get(slug)
+            return entry is not None and self._is_fresh(entry[0], from_disk=entry[2])
+
+    def put(self, slug: str, details: Dict[str, Any], prefetch: bool = False) -> None:
+        """
+        Добавление деталей рынка в кэш (закрытые рынки не кэшируются и удаляются).
+
+        prefetch=True - детали загружены заранее, пачкой (учитываются в счетчике prefetches)
+        """
+        if is_market_closed(details):
+            self.invalidate(slug)
+            return
+
+        with self._lock:
+            if prefetch:
+                self.prefetches += 1
+            self._entries[slug] = (time.time(), details, False)
+            self._entries.move_to_end(slug)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+            save_due = self.cache_file is not None and time.monotonic() - self._last_save >= self.SAVE_INTERVAL
+
+        if save_due:
+            self.save()
+
+    def invalidate(self, slug: Optional[str] = None) -> None:
+        """Удаление рынка из кэша (None - очистка всего кэша)"""
+        with self._lock:
+            if slug is None:
+                self._entries.clear()
+            elif self._entries.pop(slug, None) is None:
+                return
+            self._dirty = True
+            self.invalidations += 1
+
+    def get_details(self, slug: str,
+                    fetch: Callable[[str], Optional[Dict[str, Any]]] = get_market_details) -> Optional[Dict[str, Any]]:
+        """Детали рынка: из кэша или через `fetch` (по умолчанию Gamma API) с сохранением в кэш"""
+        details = self.get(slug)
+        if details is not None:
+            return details
+
+        details = fetch(slug)
+        if details:
+            self.put(slug, details)
+        return details
+
+    def get_token_id(self, slug: str,
+                     fetch: Callable[[str], Optional[Dict[str, Any]]] = get_market_details) -> Optional[str]:
+        """token_id (YES) рынка по slug"""
+        details = self.get_details(slug, fetch)
+        if not details:
+            return None
+        return extract_token_id(details)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'disk_hits': self.disk_hits,
+                'prefetches': self.prefetches,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def close(self) -> None:
+        self.save()
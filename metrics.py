@@ -0,0 +1,345 @@
+"""
+Метрики сервиса в формате Prometheus.
+
+Инструменты (счетчики, gauge, гистограммы) хранятся в памяти и отдаются
+в текстовом формате Prometheus по HTTP на `/metrics`. Когда метрики
+выключены (`metrics_enabled: false`, по умолчанию), все инструменты
+заменяются пустыми заглушками и обращения к ним ничего не стоят.
+
+Использование в коде:
+    get_metrics().http_latency.labels("/prices").observe(0.12)
+    get_metrics().market_polls.labels(slug, "success").inc()
+"""
+import math
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+from typing import Dict, Any, Optional, List, Tuple, Callable, Sequence
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DRIFT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MARKET_CACHE_EVENTS = ("hits", "misses", "disk_hits", "prefetches", "evictions", "invalidations")
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Базовый класс метрики с метками (labels)"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = Lock()
+        if not self.labelnames:
+            # Метрика без меток видна в выводе сразу, с нулевым значением
+            self._children[()] = self._new_child()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> Any:
+        """Дочерняя метрика для набора значений меток"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ('value', 'lock', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = Lock()
+        self.function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Значение вычисляется при каждом чтении метрик"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float('nan')
+        return self.value
+
+
+class Counter(_Metric):
+    """Счетчик; имя должно оканчиваться на _total"""
+
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+                for key, child in list(self._children.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+                for key, child in list(self._children.items())]
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            with child.lock:
+                counts = list(child.counts)
+                total_sum = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _NoopMetric:
+    """Заглушка для выключенных метрик: все операции ничего не делают"""
+
+    def labels(self, *values: Any) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1.0) -> None:
+        pass
+
+    def dec(self, amount: float = 1.0) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+_NOOP = _NoopMetric()
+
+
+class ServiceMetrics:
+    """
+    Набор метрик сервиса.
+
+    Args:
+        enabled: False - все инструменты являются заглушками
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: List[_Metric] = []
+
+        self.http_latency = self._add(Histogram(
+            "polymarket_http_request_duration_seconds", "Длительность HTTP запросов к API", ("endpoint",)))
+        self.http_requests = self._add(Counter(
+            "polymarket_http_requests_total", "HTTP запросы к API по коду ответа", ("endpoint", "status")))
+        self.market_polls = self._add(Counter(
+            "polymarket_market_polls_total", "Результаты получения цен по рынкам", ("market", "result")))
+        self.poll_drift = self._add(Histogram(
+            "polymarket_poll_drift_seconds", "Отставание фактического опроса от расписания",
+            ("loop",), DRIFT_BUCKETS))
+        self.writer_flush = self._add(Histogram(
+            "polymarket_writer_flush_duration_seconds", "Длительность сброса пачки записей на диск"))
+        self.writer_queue = self._add(Gauge(
+            "polymarket_writer_queue_size", "Записей в очереди потока записи"))
+        self.writer_dropped = self._add(Counter(
+            "polymarket_writer_dropped_total", "Записи, отброшенные из-за переполнения очереди"))
+        self.active_monitors = self._add(Gauge(
+            "polymarket_active_monitors", "Запущенные мониторы рынков"))
+        self.threads = self._add(Gauge(
+            "polymarket_threads", "Активные потоки процесса"))
+        self.market_cache = self._add(Counter(
+            "polymarket_market_cache_total", "Обращения и изменения кэша рынков по типу", ("event",)))
+        self.market_cache_entries = self._add(Gauge(
+            "polymarket_market_cache_entries", "Рынков в кэше метаданных"))
+
+        self.threads.set_function(threading.active_count)
+
+    def track_market_cache(self, market_cache: Any) -> None:
+        """Счетчики MarketCache читаются при каждом запросе метрик"""
+        for event in MARKET_CACHE_EVENTS:
+            self.market_cache.labels(event).set_function(lambda event=event: getattr(market_cache, event))
+        self.market_cache_entries.set_function(lambda: market_cache.stats()['entries'])
+
+    def _add(self, metric: _Metric) -> Any:
+        if not self.enabled:
+            return _NOOP
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+class MetricsServer:
+    """HTTP сервер `/metrics` в отдельном потоке"""
+
+    def __init__(self, metrics: ServiceMetrics, host: str = "127.0.0.1", port: int = 9108):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?', 1)[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header("Content-Type", CONTENT_TYPE)
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self) -> "MetricsServer":
+        self._thread = Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Общий набор метрик; по умолчанию выключен
+_metrics = ServiceMetrics(enabled=False)
+
+
+def get_metrics() -> ServiceMetrics:
+    """Текущий набор метрик (заглушки, если метрики не включены)"""
+    return _metrics
+
+
+def configure_metrics(settings: Optional[Dict[str, Any]] = None) -> ServiceMetrics:
+    """Пересоздание общего набора метрик по разделу `settings` конфигурации"""
+    global _metrics
+    _metrics = ServiceMetrics(enabled=(settings or {}).get('metrics_enabled', False))
+    return _metrics
+
+
+def start_metrics_server(settings: Optional[Dict[str, Any]] = None) -> Optional[MetricsServer]:
+    """Запуск `/metrics` для общего набора метрик (None, если метрики выключены или порт занят)"""
+    settings = settings or {}
+    if not _metrics.enabled:
+        return None
+    try:
+        return MetricsServer(
+            _metrics,
+            host=settings.get('metrics_host', '127.0.0.1'),
+            port=settings.get('metrics_port', 9108),
+        ).start()
+    except OSError as e:
+        print(f"[Metrics] Не удалось запустить HTTP сервер метрик: {e}")
+        return None
@@ -5,16 +5,23 @@ from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
-from api_client import get_market_details, get_current_price, extract_token_id
+from api_client import get_current_price, extract_token_id
+from storage import LogStorage, JsonArrayStorage, JsonLinesStorage
+from market_cache import MarketCache
 
-def log_market_prices(market_id: str, duration_minutes: Optional[int] = None, log_file: str = "price_log.json"):
+def log_market_prices(market_id: str, duration_minutes: Optional[float] = None, log_file: str = "price_log.json",
+                      storage: Optional[LogStorage] = None, market_cache: Optional[MarketCache] = None,
+                      poll_interval: float = 60):
     """
-    Мониторит указанный рынок Polymarket и записывает лучшие bid/ask цены каждую минуту.
+    Мониторит указанный рынок Polymarket и записывает лучшие bid/ask цены раз в poll_interval секунд.
 
     Args:
         market_id: ID рынка Polymarket для мониторинга
         duration_minutes: Длительность мониторинга в минутах (None = бесконечно)
-        log_file: Имя файла для записи логов
+        log_file: Имя файла для записи логов (`.jsonl` - append-only формат JSON Lines)
+        storage: Бэкенд хранения (по умолчанию выбирается по расширению log_file)
+        market_cache: Кэш метаданных рынков (по умолчанию - в памяти, TTL 1 час)
+        poll_interval: Интервал между запросами в секундах (по умолчанию 60 - раз в минуту)
     """
     # Настраиваем кодировку для Windows консоли
     if sys.platform == 'win32':
@@ -27,11 +34,21 @@ def log_market_prices(market_id: str, duration_minutes: Optional[int] = None, lo
 
     log_path = Path(log_file)
 
+    if storage is None:
+        if log_path.suffix == JsonLinesStorage.extension:
+            storage = JsonLinesStorage()
+        else:
+            storage = JsonArrayStorage()
+
     # Создаем файл, если его нет
-    if not log_path.exists():
+    if not log_path.exists() and isinstance(storage, JsonArrayStorage):
         with open(log_path, 'w', encoding='utf-8') as f:
             json.dump([], f)
 
+    # Детали рынка и token_id не меняются от итерации к итерации - берем из кэша
+    if market_cache is None:
+        market_cache = MarketCache()
+
     start_time = time.time()
     iteration = 0
 
@@ -46,11 +63,11 @@ def log_market_prices(market_id: str, duration_minutes: Optional[int] = None, lo
 
             try:
                 # Получаем детали рынка
-                market_details = get_market_details(market_id)
+                market_details = market_cache.get_details(market_id)
 
                 if not market_details:
                     print(f"Ошибка: не удалось получить данные для рынка {market_id}")
-                    time.sleep(60)
+                    time.sleep(poll_interval)
                     continue
 
                 # Получаем token_id
@@ -58,7 +75,7 @@ def log_market_prices(market_id: str, duration_minutes: Optional[int] = None, lo
                 
                 if not token_id:
                     print("Ошибка: не удалось извлечь token_id")
-                    time.sleep(60)
+                    time.sleep(poll_interval)
                     continue
 
                 market_name = market_details.get('question', 'Unknown')
@@ -68,7 +85,7 @@ def log_market_prices(market_id: str, duration_minutes: Optional[int] = None, lo
 
                 if not price_data:
                     print(f"Ошибка: не удалось получить цены для токена {token_id}")
-                    time.sleep(60)
+                    time.sleep(poll_interval)
                     continue
 
                 # Формируем запись
@@ -83,19 +100,8 @@ def log_market_prices(market_id: str, duration_minutes: Optional[int] = None, lo
                     "mid": price_data.get('mid')
                 }
 
-                # Читаем существующие данные
-                try:
-                    with open(log_path, 'r', encoding='utf-8') as f:
-                        logs = json.load(f)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    logs = []
-
                 # Добавляем новую запись
-                logs.append(log_entry)
-
-                # Записываем обратно в файл
-                with open(log_path, 'w', encoding='utf-8') as f:
-                    json.dump(logs, f, indent=2, ensure_ascii=False)
+                storage.append(log_path, log_entry)
 
                 iteration += 1
                 print(f"[{timestamp}] Итерация {iteration}: Bid={log_entry['bid']}, Ask={log_entry['ask']}, Mid={log_entry['mid']}")
@@ -103,13 +109,16 @@ def log_market_prices(market_id: str, duration_minutes: Optional[int] = None, lo
             except Exception as e:
                 print(f"Ошибка при получении данных: {e}")
 
-            # Ждем 60 секунд до следующей итерации
-            time.sleep(60)
+            # Ждем до следующей итерации
+            time.sleep(poll_interval)
 
     except KeyboardInterrupt:
         print(f"\nМониторинг остановлен пользователем")
         print(f"Записано {iteration} записей в {log_file}")
 
+    finally:
+        storage.close()
+
 
 if __name__ == "__main__":
     # Пример использования
@@ -4,34 +4,105 @@
 import time
 import json
 import sys
+import argparse
+import queue
+from contextlib import nullcontext
 from datetime import datetime
-from threading import Thread, Lock
-from typing import Dict, Optional, Any, Tuple
+from threading import Thread, Lock, BoundedSemaphore, Event
+from typing import Dict, Optional, Any, Tuple, List, Sequence, Set
 from pathlib import Path
 
-from api_client import get_market_details, get_current_price, extract_token_id
+from api_client import (get_market_details, get_current_price, get_current_prices, get_order_books,
+                        extract_token_id, extract_token_ids, configure_client, DEFAULT_PRICE_BATCH_SIZE)
+from storage import LogStorage, JsonArrayStorage, create_storage, recover_logs, format_recovery
+from market_cache import MarketCache, is_market_closed
+from scheduler import AdaptiveScheduler
+from writer import LogWriter
+from recording import ChangeRecorder
+from depth import DepthRecorder
+from discovery import MarketDiscovery, merge_markets
+from backfill import Backfiller, format_stats
+from events import EventMonitor, EVENTS_DIR
+from startup import WarmState, prefetch_details, fetch_details
+from metrics import get_metrics, configure_metrics, start_metrics_server, MetricsServer
+from streaming import MarketStream, CLOB_WS_MARKET_URL, LOG_BOTH
+from config_watcher import ConfigWatcher, diff_markets, diff_settings
 
 # Глобальная блокировка для конфигурации
 config_lock = Lock()
 
+# Время на завершение потоков остановленных мониторов (общее для всех)
+STOP_TIMEOUT = 5
+
+# Настройки, которые применяются к работающему сервису без перезапуска.
+# Остальные читаются при старте и требуют перезапуска.
+RECORDER_SETTINGS = frozenset({'record_mode', 'change_epsilon', 'keyframe_interval_seconds'})
+LIVE_SETTINGS = frozenset({
+    'poll_interval_seconds', 'output_directory', 'price_batch_size', 'depth_interval_seconds',
+    'discovery_interval_seconds', 'config_reload_interval_seconds',
+    'discovery_tag_id', 'discovery_event_slug', 'discovery_min_volume', 'discovery_min_liquidity',
+    'discovery_active', 'discovery_closed', 'discovery_max_markets', 'discovery_page_size',
+    'discovery_concurrency', 'market_refresh_interval_seconds',
+}) | RECORDER_SETTINGS
+
+def format_slugs(slugs: Sequence[str], limit: int = 10) -> str:
+    """Количество и список slug для вывода в консоль (длинные списки сокращаются)"""
+    if not slugs:
+        return "0"
+    shown = ", ".join(slugs[:limit])
+    if len(slugs) > limit:
+        shown += f", ... еще {len(slugs) - limit}"
+    return f"{len(slugs)} ({shown})"
+
+
 class MarketMonitor:
     """Класс для мониторинга отдельного рынка"""
 
-    def __init__(self, slug: str, name: str, output_dir: str):
+    def __init__(self, slug: str, name: str, output_dir: str, storage: Optional[LogStorage] = None,
+                 market_cache: Optional[MarketCache] = None, writer: Optional[LogWriter] = None,
+                 recorder: Optional[ChangeRecorder] = None):
         self.slug = slug
         self.name = name
         self.output_dir = Path(output_dir)
+        self.storage = storage or JsonArrayStorage()
+        self.market_cache = market_cache
+        self.writer = writer
+        self.recorder = recorder
         self.should_stop = False
+        # Рынок закрыт или разрешен: монитор остановлен и снимается сервисом
+        self.closed = False
         self.market_details: Optional[Dict[str, Any]] = None
         self.token_id: Optional[str] = None
+        self.token_ids: List[str] = []
+        self.iteration = 0
+        self.last_fetch_time: Optional[float] = None
+        self.last_price: Optional[Dict[str, Optional[float]]] = None
+        self.poll_interval: float = 60
+        # Повторная инициализация: задержка растет от init_retry до init_retry_max
+        self.init_retry: float = 5
+        self.init_retry_max: float = 300
+        # Общее ограничение одновременных инициализаций и ожидание предзагрузки деталей
+        self.init_slots: Optional[BoundedSemaphore] = None
+        self.init_ready: Optional[Event] = None
 
     def initialize(self) -> bool:
         """Инициализация: получение деталей рынка и token_id"""
+        if self.token_id and self.market_details:
+            # Восстановлено из снимка прошлого запуска
+            print(f"[{self.name}] Инициализация из снимка")
+            return True
+
         try:
-            self.market_details = get_market_details(self.slug)
+            if self.market_cache:
+                self.market_details = self.market_cache.get_details(self.slug)
+            else:
+                self.market_details = get_market_details(self.slug)
             if not self.market_details:
                 print(f"[{self.name}] Ошибка: не удалось получить детали рынка")
                 return False
+            if is_market_closed(self.market_details):
+                self.retire()
+                return False
 
             self.token_id = extract_token_id(self.market_details)
 
@@ -39,6 +110,8 @@ class MarketMonitor:
                 print(f"[{self.name}] Ошибка: не удалось извлечь token_id")
                 return False
 
+            self.token_ids = extract_token_ids(self.market_details)
+
             print(f"[{self.name}] Инициализация завершена")
             return True
 
@@ -46,33 +119,38 @@ class MarketMonitor:
             print(f"[{self.name}] Ошибка инициализации: {e}")
             return False
 
+    def initialize_with_retry(self) -> bool:
+        """
+        Инициализация с повторными попытками в фоне (до остановки монитора).
+
+        Returns:
+            bool: False, если монитор остановлен до успешной инициализации
+        """
+        if self.init_ready is not None and not self.token_id:
+            while not self.should_stop and not self.init_ready.wait(1.0):
+                pass
+
+        delay = self.init_retry
+        while not self.should_stop:
+            with self.init_slots or nullcontext():
+                if self.initialize():
+                    return True
+            print(f"[{self.name}] Повторная попытка инициализации через {delay:g}с")
+            deadline = time.monotonic() + delay
+            while not self.should_stop and time.monotonic() < deadline:
+                time.sleep(max(0.0, min(1.0, deadline - time.monotonic())))
+            delay = min(delay * 2, self.init_retry_max)
+        return False
+
     def get_log_filename(self) -> Path:
         """Генерация имени файла для логирования"""
-        date_str = datetime.now().strftime("%Y-%m-%d")
-        safe_slug = self.slug.replace('/', '_').replace('\\', '_')
-        return self.output_dir / f"{safe_slug}_{date_str}.json"
+        return self.storage.log_path(self.output_dir, self.slug)
 
-    def log_price(self, price_data: Dict[str, Optional[float]]) -> bool:
+    def log_price(self, price_data: Dict[str, Optional[float]], deadline: Optional[float] = None) -> bool:
         """Запись данных о цене в файл"""
         try:
             log_file = self.get_log_filename()
 
-            # Создаем директорию если её нет
-            log_file.parent.mkdir(parents=True, exist_ok=True)
-
-            # Читаем существующие данные или создаем новый файл
-            logs = []
-            if log_file.exists():
-                try:
-                    with open(log_file, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if content:
-                            logs = json.loads(content)
-                except json.JSONDecodeError:
-                    logs = []
-                except Exception as e:
-                    print(f"[{self.name}] Ошибка чтения лога: {e}")
-            
             market_question = 'Unknown'
             if self.market_details:
                  market_question = self.market_details.get('question', 'Unknown')
@@ -89,11 +167,23 @@ class MarketMonitor:
                 "mid": price_data.get('mid')
             }
 
-            logs.append(log_entry)
+            if self.recorder:
+                # Режим записи изменений: неизменившиеся цены не пишутся
+                log_entry = self.recorder.filter(log_file, log_entry)
+                if log_entry is None:
+                    return True
+
+            if self.writer:
+                # Запись выполняет отдельный поток, здесь только постановка в очередь
+                if not self.writer.submit(log_file, log_entry, deadline):
+                    print(f"[{self.name}] Очередь записи переполнена, запись отброшена")
+                    return False
+            else:
+                self.storage.append(log_file, log_entry)
 
-            # Записываем обратно в файл
-            with open(log_file, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, indent=2, ensure_ascii=False)
+            if self.recorder:
+                # Базовые значения фильтра обновляются только для принятой записи
+                self.recorder.commit()
 
             return True
 
@@ -101,49 +191,85 @@ class MarketMonitor:
             print(f"[{self.name}] Ошибка записи в файл: {e}")
             return False
 
-    def run(self, poll_interval: int):
-        """Основной цикл мониторинга"""
+    def handle_price(self, price_data: Optional[Dict[str, Optional[float]]],
+                     deadline: Optional[float] = None) -> None:
+        """Обработка полученных цен: запись в файл и вывод в консоль"""
+        if price_data:
+            get_metrics().market_polls.labels(self.slug, "success").inc()
+            self.last_price = price_data
+            # Записываем в файл
+            if self.log_price(price_data, deadline):
+                self.iteration += 1
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"[{self.name}] [{timestamp}] Запись #{self.iteration}: "
+                      f"Bid={price_data.get('bid')}, Ask={price_data.get('ask')}, Mid={price_data.get('mid')}")
+        else:
+            get_metrics().market_polls.labels(self.slug, "failure").inc()
+            print(f"[{self.name}] Не удалось получить цены")
+
+    def reconfigure(self, name: str, output_dir: str, poll_interval: float) -> None:
+        """Применение новых настроек без перезапуска (интервал действует со следующего ожидания)"""
+        self.name = name
+        self.output_dir = Path(output_dir)
+        self.poll_interval = poll_interval
+
+    def run(self, poll_interval: float, self_poll: bool = True):
+        """
+        Основной цикл мониторинга.
+
+        При self_poll=False монитор только инициализируется, а цены
+        для него запрашивает ServiceManager общим пакетным запросом.
+        Интервал можно менять во время работы через reconfigure().
+        """
+        self.poll_interval = poll_interval
         print(f"[{self.name}] Запуск мониторинга...")
 
-        if not self.initialize():
-            print(f"[{self.name}] Не удалось инициализировать монитор")
+        if not self.initialize_with_retry():
+            print(f"[{self.name}] Монитор остановлен до инициализации")
             return
 
-        iteration = 0
+        if not self_poll:
+            return
+
+        last_started: Optional[float] = None
 
         while not self.should_stop:
+            started = time.monotonic()
+            if last_started is not None:
+                # Фактический интервал включает время запроса, сверх poll_interval - отставание
+                get_metrics().poll_drift.labels("monitor").observe(
+                    max(0.0, started - last_started - self.poll_interval))
+            last_started = started
+
             try:
                 if self.token_id:
                     # Получаем цены
-                    price_data = get_current_price(self.token_id)
-
-                    if price_data:
-                        # Записываем в файл
-                        if self.log_price(price_data):
-                            iteration += 1
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            print(f"[{self.name}] [{timestamp}] Запись #{iteration}: "
-                                  f"Bid={price_data.get('bid')}, Ask={price_data.get('ask')}, Mid={price_data.get('mid')}")
-                    else:
-                        print(f"[{self.name}] Не удалось получить цены")
+                    self.handle_price(get_current_price(self.token_id))
                 else:
                     print(f"[{self.name}] Token ID потерян")
 
             except Exception as e:
                 print(f"[{self.name}] Ошибка в цикле мониторинга: {e}")
 
-            # Ждем до следующей итерации
-            for _ in range(poll_interval):
-                if self.should_stop:
-                    break
-                time.sleep(1)
+            # Ждем до следующей итерации (интервал может быть дробным)
+            deadline = time.monotonic() + self.poll_interval
+            while not self.should_stop and time.monotonic() < deadline:
+                time.sleep(max(0.0, min(1.0, deadline - time.monotonic())))
 
-        print(f"[{self.name}] Мониторинг остановлен (записано {iteration} записей)")
+        print(f"[{self.name}] Мониторинг остановлен (записано {self.iteration} записей)")
 
     def stop(self):
         """Остановка мониторинга"""
         self.should_stop = True
 
+    def retire(self):
+        """Рынок закрыт или разрешен: детали удаляются из кэша, мониторинг прекращается"""
+        print(f"[{self.name}] Рынок закрыт или разрешен, мониторинг прекращается")
+        self.closed = True
+        if self.market_cache:
+            self.market_cache.invalidate(self.slug)
+        self.stop()
+
 
 class ServiceManager:
     def __init__(self, config_file: str = "config.json"):
@@ -151,6 +277,32 @@ class ServiceManager:
         self.current_config: Optional[Dict[str, Any]] = None
         self.last_config_mtime: float = 0
         self.running_monitors: Dict[str, Tuple[Thread, MarketMonitor]] = {}
+        # Потоки остановленных мониторов, которые еще завершаются (slug -> поток)
+        self.stopping_monitors: Dict[str, Thread] = {}
+        # Набор рынков, по которому запущены мониторы (для сравнения при перезагрузке)
+        self.active_markets: Dict[str, Dict[str, Any]] = {}
+        self.watcher: Optional[ConfigWatcher] = None
+        self.backfiller: Optional[Backfiller] = None
+        self.backfill_queue: "queue.Queue[str]" = queue.Queue()
+        self.event_monitors: Dict[str, EventMonitor] = {}
+        self.events_thread: Optional[Thread] = None
+        self.warm_state: Optional[WarmState] = None
+        self.init_slots: Optional[BoundedSemaphore] = None
+        # Устанавливается после предзагрузки деталей рынков при старте
+        self.init_ready = Event()
+        self.storage: LogStorage = JsonArrayStorage()
+        self.market_cache = MarketCache()
+        self.writer: Optional[LogWriter] = None
+        self.batch_mode = True
+        self.ingestion_mode = "poll"
+        self.stream: Optional[MarketStream] = None
+        self.scheduler: Optional[AdaptiveScheduler] = None
+        self.depth: Optional[DepthRecorder] = None
+        self.metrics_server: Optional[MetricsServer] = None
+        self.discovery: Optional[MarketDiscovery] = None
+        self.discovered_markets: Dict[str, Dict[str, Any]] = {}
+        # Закрытые и разрешенные рынки не запускаются повторно до перезапуска сервиса
+        self.closed_markets: Set[str] = set()
         self.should_stop = False
 
     def load_config(self) -> Optional[Dict[str, Any]]:
@@ -169,92 +321,637 @@ class ServiceManager:
         except OSError:
             return 0.0
 
-    def start_monitor(self, market: Dict[str, Any], output_dir: str, poll_interval: int) -> Tuple[Thread, MarketMonitor]:
+    def is_batch_mode(self) -> bool:
+        """Пакетный режим: цены всех рынков запрашиваются одним циклом ServiceManager"""
+        if not self.current_config:
+            return True
+        return self.current_config.get('settings', {}).get('batch_price_fetch', True)
+
+    def start_monitor(self, market: Dict[str, Any], output_dir: str, poll_interval: int,
+                      self_poll: bool = True) -> Tuple[Thread, MarketMonitor]:
         """Запуск монитора для рынка в отдельном потоке"""
         monitor = MarketMonitor(
             slug=market['slug'],
             name=market.get('name', market['slug']),
-            output_dir=output_dir
+            output_dir=output_dir,
+            storage=self.storage,
+            market_cache=self.market_cache,
+            writer=self.writer,
+            recorder=ChangeRecorder.from_settings((self.current_config or {}).get('settings', {}))
         )
+        self.prepare_monitor(monitor)
 
-        thread = Thread(target=monitor.run, args=(poll_interval,), daemon=True)
+        previous = self.stopping_monitors.get(market['slug'])
+        thread = Thread(target=self.run_monitor, args=(monitor, poll_interval, self_poll, previous), daemon=True)
         thread.start()
 
         return thread, monitor
 
-    def update_monitors(self):
-        """Обновление запущенных мониторов на основе конфигурации"""
+    def prepare_monitor(self, monitor: MarketMonitor) -> None:
+        """Параметры инициализации монитора и восстановление из снимка прошлого запуска"""
+        settings = (self.current_config or {}).get('settings', {})
+        monitor.init_retry = settings.get('init_retry_seconds', 5)
+        monitor.init_retry_max = settings.get('init_retry_max_seconds', 300)
+        monitor.init_slots = self.init_slots
+        monitor.init_ready = self.init_ready
+        if self.warm_state:
+            self.warm_state.restore_monitor(monitor)
+
+    @staticmethod
+    def run_monitor(monitor: MarketMonitor, poll_interval: int, self_poll: bool,
+                    previous: Optional[Thread] = None):
+        """
+        Поток монитора. Если рынок только что был остановлен и снова добавлен,
+        новый монитор ждет завершения прежнего потока, чтобы они не писали в файл одновременно.
+        """
+        while previous is not None and previous.is_alive() and not monitor.should_stop:
+            previous.join(timeout=1)
+        if not monitor.should_stop:
+            monitor.run(poll_interval, self_poll)
+
+    def join_stopped(self, stopped: List[Tuple[str, Thread]]):
+        """Ожидание завершения остановленных мониторов (в фоне, общий таймаут на все потоки)"""
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for slug, thread in stopped:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                print(f"[Service] Монитор {slug} не завершился за {STOP_TIMEOUT}с")
+
+        with config_lock:
+            for slug, thread in stopped:
+                if self.stopping_monitors.get(slug) is thread and not thread.is_alive():
+                    del self.stopping_monitors[slug]
+
+    def update_monitors(self, changed_settings: Sequence[str] = ()) -> Dict[str, List[str]]:
+        """
+        Обновление запущенных мониторов на основе конфигурации.
+
+        Новые рынки запускаются. Удаленные получают сигнал остановки, а их
+        потоки дожидаются в фоне, не удерживая config_lock. У измененных рынков
+        и при смене настроек из LIVE_SETTINGS параметры мониторов обновляются
+        без перезапуска.
+
+        Args:
+            changed_settings: Ключи `settings`, изменившиеся с прошлой загрузки
+
+        Returns:
+            dict: slug добавленных (added), удаленных (removed) и измененных (changed) рынков
+        """
+        stopped: List[Tuple[str, Thread]] = []
+
         with config_lock:
             if not self.current_config:
-                return
+                return {'added': [], 'removed': [], 'changed': []}
 
             new_config = self.current_config
-            
-            # Определяем, какие рынки нужно остановить
-            # A market is kept if it exists in new config AND is enabled
-            new_markets_map = {m['slug']: m for m in new_config.get('markets', []) if m.get('enabled', True)}
-            
-            # Identify monitors to stop (running but not in new valid markets)
-            slugs_to_stop = []
-            for slug in self.running_monitors:
-                if slug not in new_markets_map:
-                    slugs_to_stop.append(slug)
-            
-            # Stop removed/disabled markets
-            for slug in slugs_to_stop:
+
+            new_markets_map = self.monitored_markets(new_config)
+
+            removed = sorted(slug for slug in self.running_monitors if slug not in new_markets_map)
+            added = sorted(slug for slug in new_markets_map if slug not in self.running_monitors)
+            _, _, changed = diff_markets(self.active_markets, new_markets_map)
+            changed = [slug for slug in changed if slug in self.running_monitors]
+
+            # Остановка удаленных/выключенных рынков: только сигнал, без ожидания потоков
+            for slug in removed:
                 print(f"[Service] Остановка монитора: {slug}")
-                thread, monitor = self.running_monitors[slug]
+                thread, monitor = self.running_monitors.pop(slug)
                 monitor.stop()
-                thread.join(timeout=5)
-                del self.running_monitors[slug]
+                self.stopping_monitors[slug] = thread
+                stopped.append((slug, thread))
+                if self.depth:
+                    self.depth.forget(slug)
 
-            # Start new markets
             settings = new_config.get('settings', {})
             output_dir = settings.get('output_directory', 'logs')
             poll_interval = settings.get('poll_interval_seconds', 60)
+            self_poll = not self.batch_mode and self.ingestion_mode != "stream"
 
-            for slug, market in new_markets_map.items():
-                if slug not in self.running_monitors:
-                    print(f"[Service] Запуск нового монитора: {market.get('name', slug)}")
-                    thread, monitor = self.start_monitor(market, output_dir, poll_interval)
-                    self.running_monitors[slug] = (thread, monitor)
+            # Новые настройки применяются к работающим мониторам
+            recorder_changed = bool(RECORDER_SETTINGS.intersection(changed_settings))
+            if 'output_directory' in changed_settings:
+                Path(output_dir).mkdir(parents=True, exist_ok=True)
+            if recorder_changed or {'poll_interval_seconds', 'output_directory'}.intersection(changed_settings):
+                reconfigure = list(self.running_monitors)
+            else:
+                reconfigure = changed
 
-    def config_reloader_loop(self):
-        """Цикл перезагрузки конфигурации"""
-        print(f"[Config Reloader] Запущен")
+            for slug in reconfigure:
+                market = new_markets_map[slug]
+                _, monitor = self.running_monitors[slug]
+                monitor.reconfigure(market.get('name', slug), output_dir, poll_interval)
+                if recorder_changed:
+                    monitor.recorder = ChangeRecorder.from_settings(settings)
+
+            # Запуск новых рынков
+            for slug in added:
+                market = new_markets_map[slug]
+                print(f"[Service] Запуск нового монитора: {market.get('name', slug)}")
+                thread, monitor = self.start_monitor(market, output_dir, poll_interval, self_poll)
+                self.running_monitors[slug] = (thread, monitor)
+                if self.backfiller:
+                    self.backfill_queue.put(slug)
+
+            self.active_markets = new_markets_map
+            self.update_event_monitors(output_dir)
+
+        if stopped:
+            Thread(target=self.join_stopped, args=(stopped,), daemon=True).start()
+
+        return {'added': added, 'removed': removed, 'changed': changed}
+
+    def monitored_markets(self, config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Рынки для мониторинга: включенные в конфигурации или найденные поиском
+        (и не выключенные в конфигурации), кроме закрытых и разрешенных
+        """
+        markets = merge_markets(config, self.discovered_markets)
+        for slug in self.closed_markets:
+            markets.pop(slug, None)
+        return markets
+
+    def update_event_monitors(self, output_dir: str):
+        """Запуск и остановка мониторов событий по разделу `events` (вызывается под config_lock)"""
+        events = {e['slug']: e for e in (self.current_config or {}).get('events', []) if e.get('enabled', True)}
+
+        for slug in [s for s in self.event_monitors if s not in events]:
+            print(f"[Service] Остановка монитора события: {slug}")
+            self.event_monitors.pop(slug).stop()
+
+        for slug, event in events.items():
+            monitor = self.event_monitors.get(slug)
+            if monitor is None:
+                print(f"[Service] Запуск монитора события: {event.get('name', slug)}")
+                # Исходы события запрашиваются в цикле событий, не под блокировкой
+                monitor = EventMonitor(
+                    slug=slug,
+                    name=event.get('name', slug),
+                    output_dir=output_dir,
+                    storage=self.storage,
+                    writer=self.writer,
+                )
+                settings = (self.current_config or {}).get('settings', {})
+                monitor.retry_min = settings.get('init_retry_seconds', 5)
+                monitor.retry_max = settings.get('init_retry_max_seconds', 300)
+                if self.warm_state:
+                    self.warm_state.restore_event(monitor)
+                self.event_monitors[slug] = monitor
+            else:
+                monitor.name = event.get('name', slug)
+                monitor.output_dir = Path(output_dir) / EVENTS_DIR
+
+    def fetch_events_once(self) -> int:
+        """
+        Один цикл событий: исходы уточняются одним запросом Gamma на событие
+        (при запуске и раз в `event_refresh_interval_seconds`), цены всех исходов
+        всех событий запрашиваются одним пакетным запросом.
+        """
+        with config_lock:
+            monitors = [m for m in self.event_monitors.values() if not m.should_stop]
+            settings = (self.current_config or {}).get('settings', {})
+        if not monitors:
+            return 0
+
+        batch_size = settings.get('price_batch_size', DEFAULT_PRICE_BATCH_SIZE)
+        refresh_interval = settings.get('event_refresh_interval_seconds', 3600)
+
+        now = time.monotonic()
+        for monitor in monitors:
+            monitor.refresh(now, refresh_interval)
+
+        ready = [m for m in monitors if m.token_ids and not m.should_stop]
+        if not ready:
+            return 0
+
+        prices = get_current_prices([t for m in ready for t in m.token_ids], batch_size=batch_size)
+        deadline = self.writer.tick_deadline() if self.writer else None
+        for monitor in ready:
+            try:
+                monitor.handle_prices(prices, deadline)
+            except Exception as e:
+                print(f"[{monitor.name}] Ошибка обработки цен: {e}")
+        return len(ready)
+
+    def event_fetcher_loop(self):
+        """Цикл событий с несколькими исходами: один пакетный запрос на тик"""
+        print(f"[Events] Запущен")
+
+        next_tick = time.monotonic()
 
         while not self.should_stop:
+            get_metrics().poll_drift.labels("events").observe(max(0.0, time.monotonic() - next_tick))
             try:
-                # Проверяем, изменился ли файл конфигурации
-                current_mtime = self.get_config_mtime()
+                self.fetch_events_once()
+            except Exception as e:
+                print(f"[Events] Ошибка: {e}")
 
-                if current_mtime > self.last_config_mtime:
-                    print(f"[Config Reloader] Обнаружены изменения в конфигурации")
+            poll_interval = (self.current_config or {}).get('settings', {}).get('poll_interval_seconds', 60)
+            next_tick = max(next_tick + poll_interval, time.monotonic())
+            while not self.should_stop and time.monotonic() < next_tick:
+                time.sleep(max(0.0, min(1.0, next_tick - time.monotonic())))
+                # Только что добавленные события получают первый тик сразу (события с
+                # неудачным запросом исходов повторяются по своей задержке, а не каждую секунду)
+                if any(m.pending for m in list(self.event_monitors.values())):
+                    break
 
-                    new_config = self.load_config()
-                    if new_config:
-                        self.current_config = new_config
-                        self.last_config_mtime = current_mtime
-                        self.update_monitors()
-                        print(f"[Config Reloader] Конфигурация обновлена")
+    def discover_markets(self) -> bool:
+        """
+        Повторный поиск рынков по фильтрам discovery_*.
+
+        Returns:
+            bool: изменился ли набор найденных рынков (при ошибке набор сохраняется)
+        """
+        found = self.discovery.discover(self.market_cache)
+        if found is None:
+            print("[Discovery] Не удалось получить список рынков, набор рынков не изменен")
+            return False
+
+        added = len(found.keys() - self.discovered_markets.keys())
+        retired = len(self.discovered_markets.keys() - found.keys())
+        self.discovered_markets = found
+        print(f"[Discovery] Найдено рынков: {len(found)} (новых: {added}, снято: {retired})")
+        return bool(added or retired)
+
+    def discovery_loop(self):
+        """Цикл поиска рынков: новые запускаются, закрытые и не подходящие под фильтры останавливаются"""
+        print(f"[Discovery] Запущен")
 
+        while not self.should_stop:
+            settings = (self.current_config or {}).get('settings', {})
+            deadline = time.monotonic() + settings.get('discovery_interval_seconds', 300)
+            while not self.should_stop and time.monotonic() < deadline:
+                time.sleep(1)
+            if self.should_stop:
+                break
+
+            try:
+                if self.discover_markets():
+                    self.update_monitors()
             except Exception as e:
-                print(f"[Config Reloader] Ошибка: {e}")
+                print(f"[Discovery] Ошибка: {e}")
+
+    def fetch_prices_once(self, only_new: bool = False) -> int:
+        """
+        Один пакетный запрос цен для всех инициализированных мониторов.
+
+        При only_new=True запрашиваются только мониторы, которые еще ни разу
+        не получали цены (только что инициализированные).
+        """
+        with config_lock:
+            monitors = [m for _, m in self.running_monitors.values()
+                        if m.token_id and not m.should_stop and not (only_new and m.last_fetch_time is not None)]
+            settings = (self.current_config or {}).get('settings', {})
+            batch_size = settings.get('price_batch_size', DEFAULT_PRICE_BATCH_SIZE)
+
+        self.fetch_prices_for(monitors, batch_size)
+        return len(monitors)
+
+    def fetch_prices_for(self, monitors, batch_size: int) -> Dict[str, Dict[str, Optional[float]]]:
+        """Пакетный запрос цен для указанных мониторов и передача результатов им"""
+        if not monitors:
+            return {}
+
+        prices = get_current_prices([m.token_id for m in monitors], batch_size=batch_size)
+
+        fetch_time = time.time()
+        # Один срок ожидания очереди записи на весь тик
+        deadline = self.writer.tick_deadline() if self.writer else None
+        for monitor in monitors:
+            monitor.last_fetch_time = fetch_time
+            try:
+                monitor.handle_price(prices.get(monitor.token_id), deadline)
+            except Exception as e:
+                print(f"[{monitor.name}] Ошибка обработки цен: {e}")
 
-            # Ждем перед следующей проверкой
-            interval = 30
+        return prices
+
+    def fetch_due_prices(self) -> int:
+        """Один тик адаптивного расписания: запрос цен только для рынков, которым пора"""
+        with config_lock:
+            monitors = {slug: m for slug, (_, m) in self.running_monitors.items()
+                        if m.token_id and not m.should_stop}
+            settings = (self.current_config or {}).get('settings', {})
+            batch_size = settings.get('price_batch_size', DEFAULT_PRICE_BATCH_SIZE)
+
+        self.scheduler.sync(list(monitors))
+        due = [monitors[slug] for slug in self.scheduler.due(batch_size)]
+
+        prices = self.fetch_prices_for(due, batch_size)
+        for monitor in due:
+            self.scheduler.observe(monitor.slug, prices.get(monitor.token_id))
+
+        return len(due)
+
+    def adaptive_fetcher_loop(self):
+        """Цикл адаптивного опроса: каждую секунду запрашиваются рынки, у которых подошел срок"""
+        print(f"[Scheduler] Запущен (интервал {self.scheduler.min_interval:g}-{self.scheduler.max_interval:g}с)")
+
+        expected = time.monotonic()
+
+        while not self.should_stop:
+            started = time.monotonic()
+            get_metrics().poll_drift.labels("adaptive").observe(max(0.0, started - expected))
+            expected = started + 1.0
+            try:
+                self.fetch_due_prices()
+            except Exception as e:
+                print(f"[Scheduler] Ошибка: {e}")
+            time.sleep(max(0.0, 1.0 - (time.monotonic() - started)))
+
+    def price_fetcher_loop(self):
+        """Цикл пакетного получения цен: один тик на все рынки"""
+        print(f"[Price Fetcher] Запущен")
+
+        next_tick = time.monotonic()
+
+        while not self.should_stop:
+            get_metrics().poll_drift.labels("batch").observe(max(0.0, time.monotonic() - next_tick))
+            try:
+                self.fetch_prices_once()
+            except Exception as e:
+                print(f"[Price Fetcher] Ошибка: {e}")
+
+            poll_interval = 60
             if self.current_config:
-                interval = self.current_config.get('settings', {}).get('config_reload_interval_seconds', 30)
-            
-            time.sleep(interval)
+                poll_interval = self.current_config.get('settings', {}).get('poll_interval_seconds', 60)
 
-    def run(self):
-        """Главный цикл сервиса"""
-        # Настраиваем кодировку для Windows
+            # Ждем до следующего тика, не накапливая сдвиг.
+            # Новые мониторы получают первую цену сразу после инициализации.
+            next_tick = max(next_tick + poll_interval, time.monotonic())
+            while not self.should_stop and time.monotonic() < next_tick:
+                time.sleep(max(0.0, min(1.0, next_tick - time.monotonic())))
+                try:
+                    self.fetch_prices_once(only_new=True)
+                except Exception as e:
+                    print(f"[Price Fetcher] Ошибка: {e}")
+
+    def capture_depth_once(self) -> int:
+        """Один пакетный запрос книг заявок (все токены рынков) и запись снимков глубины"""
+        with config_lock:
+            monitors = [m for _, m in self.running_monitors.values() if m.token_ids and not m.should_stop]
+            settings = (self.current_config or {}).get('settings', {})
+            batch_size = settings.get('price_batch_size', DEFAULT_PRICE_BATCH_SIZE)
+
+        if not monitors:
+            return 0
+
+        books = get_order_books([t for m in monitors for t in m.token_ids], batch_size=batch_size)
+        timestamp = datetime.now()
+
+        for monitor in monitors:
+            # Отсутствующий токен записался бы как пустая книга и испортил дельты до ключевого кадра
+            if not all(t in books for t in monitor.token_ids):
+                print(f"[{monitor.name}] Не удалось получить книгу заявок")
+                continue
+            try:
+                self.depth.record(monitor.slug, monitor.token_ids, books, timestamp)
+            except Exception as e:
+                print(f"[{monitor.name}] Ошибка записи глубины: {e}")
+
+        return len(monitors)
+
+    def depth_capture_loop(self):
+        """Цикл записи глубины книги заявок"""
+        print(f"[Depth] Запущен ({self.depth.levels} уровней)")
+
+        next_tick = time.monotonic()
+
+        while not self.should_stop:
+            try:
+                self.capture_depth_once()
+            except Exception as e:
+                print(f"[Depth] Ошибка: {e}")
+
+            settings = (self.current_config or {}).get('settings', {})
+            interval = settings.get('depth_interval_seconds', settings.get('poll_interval_seconds', 60))
+
+            next_tick = max(next_tick + interval, time.monotonic())
+            while not self.should_stop and time.monotonic() < next_tick:
+                time.sleep(max(0.0, min(1.0, next_tick - time.monotonic())))
+
+    def backfill_loop(self):
+        """
+        Дозаполнение истории новых рынков (в том числе всех рынков при старте -
+        так заполняются пропуски, оставшиеся после остановки сервиса)
+        """
+        print(f"[Backfill] Запущен")
+
+        while not self.should_stop:
+            try:
+                slug = self.backfill_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            with config_lock:
+                if not self.is_monitored(slug):
+                    continue
+                settings = (self.current_config or {}).get('settings', {})
+
+            end = time.time()
+            start = end - settings.get('backfill_hours', 24) * 3600
+            try:
+                stats = self.backfiller.backfill(slug, start, end)
+                if stats['gaps']:
+                    print(f"[Backfill] {slug}: {format_stats(stats)}")
+            except Exception as e:
+                print(f"[Backfill] {slug}: ошибка: {e}")
+
+    def prefetch_markets(self, settings: Dict[str, Any]) -> None:
+        """
+        Предзагрузка деталей рынков при старте (в фоне): пачки slug параллельно,
+        затем мониторы без снимка инициализируются из кэша
+        """
+        try:
+            with config_lock:
+                slugs = [slug for slug, (_, monitor) in self.running_monitors.items() if not monitor.token_id]
+            if slugs:
+                started = time.monotonic()
+                found = prefetch_details(
+                    slugs, self.market_cache,
+                    batch_size=settings.get('init_batch_size', 50),
+                    concurrency=settings.get('init_concurrency', 8),
+                )
+                print(f"[Service] Предзагрузка деталей: {found} из {len(slugs)} рынков "
+                      f"за {time.monotonic() - started:.1f}с")
+        except Exception as e:
+            print(f"[Service] Ошибка предзагрузки деталей: {e}")
+        finally:
+            self.init_ready.set()
+
+    def refresh_markets(self) -> int:
+        """
+        Повторная загрузка деталей инициализированных рынков пачками.
+
+        Свежие детали обновляют кэш и монитор (а с ним и снимок состояния),
+        закрытые и разрешенные рынки удаляются из кэша, их мониторы останавливаются.
+
+        Returns:
+            int: количество закрытых рынков
+        """
+        settings = (self.current_config or {}).get('settings', {})
+        monitors = {m.slug: m for m in self.get_active_monitors() if m.token_id and not m.should_stop}
+        found = fetch_details(
+            monitors,
+            batch_size=settings.get('init_batch_size', 50),
+            concurrency=settings.get('init_concurrency', 8),
+        )
+
+        closed = 0
+        for slug, details in found.items():
+            monitor = monitors[slug]
+            if is_market_closed(details):
+                monitor.retire()
+                closed += 1
+            else:
+                self.market_cache.put(slug, details)
+                monitor.market_details = details
+        return closed
+
+    def retire_closed_monitors(self) -> List[str]:
+        """Снятие мониторов закрытых и разрешенных рынков (slug запоминаются до перезапуска)"""
+        closed = sorted(m.slug for m in self.get_active_monitors() if m.closed)
+        if closed:
+            self.closed_markets.update(closed)
+            print(f"[Service] Закрытые и разрешенные рынки сняты с мониторинга: {format_slugs(closed)}")
+            self.update_monitors()
+        return closed
+
+    def market_refresh_loop(self):
+        """
+        Цикл обновления деталей рынков: первый проход сразу после предзагрузки
+        (детали из снимка могли устареть), затем раз в market_refresh_interval_seconds
+        (0 - без обновления, снимаются только рынки, закрытые на момент инициализации)
+        """
+        print(f"[Market Refresh] Запущен")
+        while not self.should_stop and not self.init_ready.wait(1.0):
+            pass
+
+        next_refresh = time.monotonic()
+        while not self.should_stop:
+            interval = (self.current_config or {}).get('settings', {}).get('market_refresh_interval_seconds', 3600)
+            if interval > 0 and time.monotonic() >= next_refresh:
+                try:
+                    self.refresh_markets()
+                except Exception as e:
+                    print(f"[Market Refresh] Ошибка: {e}")
+                next_refresh = time.monotonic() + interval
+
+            # Мониторы, обнаружившие закрытие рынка при инициализации, снимаются без ожидания прохода
+            try:
+                self.retire_closed_monitors()
+            except Exception as e:
+                print(f"[Market Refresh] Ошибка: {e}")
+            time.sleep(1)
+
+    def save_warm_state(self) -> None:
+        """Сохранение снимка состояния для быстрого перезапуска"""
+        if not self.warm_state:
+            return
+        with config_lock:
+            events = list(self.event_monitors.values())
+        count = self.warm_state.save(self.get_active_monitors(), events, self.scheduler)
+        print(f"[Warm State] Снимок сохранен: рынков {count}")
+
+    def is_monitored(self, slug: str) -> bool:
+        """Рынок отслеживается сервисом (вызывается под config_lock)"""
+        return slug in self.running_monitors
+
+    def get_active_monitors(self):
+        """Снимок текущих мониторов (для потокового режима)"""
+        with config_lock:
+            return [monitor for _, monitor in self.running_monitors.values()]
+
+    def create_stream(self, settings: Dict[str, Any]) -> MarketStream:
+        """Создание WebSocket подписки по разделу `settings` конфигурации"""
+        poll_interval = settings.get('poll_interval_seconds', 60)
+        return MarketStream(
+            get_monitors=self.get_active_monitors,
+            rest_fallback=self.fetch_prices_once,
+            url=settings.get('stream_url', CLOB_WS_MARKET_URL),
+            log_mode=settings.get('stream_log_mode', LOG_BOTH),
+            heartbeat_seconds=settings.get('stream_heartbeat_seconds', poll_interval),
+            fallback_interval=poll_interval,
+        )
+
+    def reload_config(self) -> bool:
+        """
+        Перечитывание конфигурации и применение изменений без перезапуска сервиса.
+
+        Returns:
+            bool: False, если файл не удалось прочитать (действует прежняя конфигурация)
+        """
+        new_config = self.load_config()
+        if not new_config:
+            return False
+
+        old_settings = (self.current_config or {}).get('settings', {})
+        settings = new_config.get('settings', {})
+        changed_settings = diff_settings(old_settings, settings)
+
+        self.current_config = new_config
+        self.last_config_mtime = self.get_config_mtime()
+
+        if self.watcher:
+            self.watcher.poll_interval = settings.get('config_reload_interval_seconds', 30)
+        if self.discovery and any(key.startswith('discovery_') for key in changed_settings):
+            self.discovery = MarketDiscovery.from_settings(settings)
+
+        report = self.update_monitors(changed_settings)
+
+        print(f"[Config Reloader] Рынки: добавлено {format_slugs(report['added'])}, "
+              f"удалено {format_slugs(report['removed'])}, изменено {format_slugs(report['changed'])}")
+        if changed_settings:
+            live = [key for key in changed_settings if key in LIVE_SETTINGS]
+            restart = [key for key in changed_settings if key not in LIVE_SETTINGS]
+            if live:
+                print(f"[Config Reloader] Настройки применены: {', '.join(live)}")
+            if restart:
+                print(f"[Config Reloader] Настройки применятся после перезапуска: {', '.join(restart)}")
+        return True
+
+    def config_reloader_loop(self):
+        """Цикл перезагрузки конфигурации: ожидание изменений файла (inotify или опрос)"""
+        print(f"[Config Reloader] Запущен ({self.watcher.mode})")
+
+        while not self.should_stop:
+            try:
+                if self.watcher.wait(1.0):
+                    print(f"[Config Reloader] Обнаружены изменения в конфигурации")
+                    if self.reload_config():
+                        print(f"[Config Reloader] Конфигурация обновлена")
+            except Exception as e:
+                print(f"[Config Reloader] Ошибка: {e}")
+                time.sleep(1)
+
+    @staticmethod
+    def recover_storage(settings: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Восстановление файлов логов после аварийного завершения (до начала записи)"""
+        if not settings.get('storage_recovery', True):
+            return []
+        results = recover_logs(settings.get('output_directory', 'logs'))
+        for result in results:
+            print(f"[Storage] {format_recovery(result)}")
+        if results:
+            print(f"[Storage] Восстановление после сбоя: исправлено файлов: {len(results)}")
+        return results
+
+    def close_writer(self):
+        """Запись накопленных данных и остановка потока записи"""
+        if self.writer:
+            self.writer.close()
+            print(f"Поток записи: {self.writer.stats()}")
+
+    @staticmethod
+    def setup_console():
+        """Настраиваем кодировку для Windows"""
         if sys.platform == 'win32':
              if hasattr(sys.stdout, 'reconfigure'):
                 sys.stdout.reconfigure(encoding='utf-8') # type: ignore
 
+    def run(self):
+        """Главный цикл сервиса"""
+        self.setup_console()
+
         print("=" * 60)
         print("Polymarket Price Monitor Service")
         print("=" * 60)
@@ -271,16 +968,98 @@ class ServiceManager:
 
         # Создаем директорию для логов
         settings = self.current_config.get('settings', {})
+        self.watcher = ConfigWatcher.from_settings(self.config_file, settings)
         output_dir = settings.get('output_directory', 'logs')
         Path(output_dir).mkdir(parents=True, exist_ok=True)
 
-        # Запускаем начальные мониторы
+        # Метрики создаются до остальных компонентов, чтобы те писали в общий набор
+        metrics = configure_metrics(settings)
+        metrics.active_monitors.set_function(lambda: len(self.running_monitors))
+        self.metrics_server = start_metrics_server(settings)
+
+        # Бэкенд хранения выбирается при старте (смена требует перезапуска)
+        try:
+            self.storage = create_storage(settings)
+        except ValueError as e:
+            print(f"Ошибка: {e}")
+            return
+
+        # Файлы, оборванные при прошлом падении процесса, исправляются до первой записи
+        self.recover_storage(settings)
+
+        # Запись на диск в отдельном потоке, чтобы не задерживать опрос цен
+        if settings.get('writer_enabled', True):
+            self.writer = LogWriter.from_settings(self.storage, settings).start()
+
+        # Общий HTTP клиент (пул соединений и лимиты запросов) для всех мониторов
+        configure_client(settings)
+
+        # Общий кэш метаданных рынков (slug -> детали, token_id)
+        self.market_cache = MarketCache.from_settings(settings)
+        metrics.track_market_cache(self.market_cache)
+
+        # Снимок прошлого запуска: мониторы из него стартуют без запросов к Gamma
+        self.warm_state = WarmState.from_settings(settings)
+        if self.warm_state:
+            self.warm_state.load()
+        self.init_slots = BoundedSemaphore(max(1, settings.get('init_concurrency', 8)))
+
+        # Поиск рынков по фильтрам: детали найденных рынков сразу попадают в кэш
+        if settings.get('discovery_enabled', False):
+            self.discovery = MarketDiscovery.from_settings(settings)
+            self.discover_markets()
+
+        # Режим получения цен выбирается при старте (смена требует перезапуска)
+        self.batch_mode = self.is_batch_mode()
+        self.ingestion_mode = settings.get('ingestion_mode', 'poll')
+
+        if self.batch_mode and settings.get('adaptive_polling', False):
+            self.scheduler = AdaptiveScheduler.from_settings(settings)
+            if self.warm_state:
+                self.warm_state.restore_scheduler(self.scheduler)
+        elif settings.get('adaptive_polling', False):
+            print("[Service] adaptive_polling работает только с batch_price_fetch, интервал опроса фиксированный")
+
+        # Запись глубины книги заявок (оба токена, N уровней) в бинарные файлы
+        if settings.get('depth_capture', False):
+            self.depth = DepthRecorder.from_settings(settings)
+
+        if self.ingestion_mode == 'stream':
+            try:
+                self.stream = self.create_stream(settings)
+            except (ValueError, RuntimeError) as e:
+                print(f"Ошибка: {e}")
+                return
+
+        # Дозаполнение истории через /prices-history (через общий бэкенд хранения)
+        if settings.get('backfill_enabled', False):
+            self.backfiller = Backfiller.from_settings(settings, storage=self.storage, market_cache=self.market_cache)
+
+        # Запускаем начальные мониторы; детали рынков без снимка загружаются пачками в фоне
         self.update_monitors()
+        Thread(target=self.prefetch_markets, args=(settings,), daemon=True).start()
 
         print()
         print(f"Запущено мониторов: {len(self.running_monitors)}")
+        if self.event_monitors:
+            print(f"Событий: {len(self.event_monitors)}")
+        if self.discovery:
+            print(f"Из них найдено поиском: {len(self.discovered_markets)}")
         print(f"Директория для логов: {output_dir}")
-        print(f"Файл конфигурации: {self.config_file}")
+        print(f"Формат хранения: {self.storage.name}")
+        if self.stream:
+            print(f"Получение цен: WebSocket поток (запись: {self.stream.log_mode})")
+        elif self.scheduler:
+            print(f"Получение цен: пакетное, адаптивный интервал")
+        else:
+            print(f"Получение цен: {'пакетное' if self.batch_mode else 'поток на рынок'}")
+        if self.depth:
+            print(f"Запись глубины: {self.depth.levels} уровней")
+        if self.backfiller:
+            print(f"Дозаполнение истории: {settings.get('backfill_hours', 24)} ч")
+        if self.metrics_server:
+            print(f"Метрики: {self.metrics_server.address}")
+        print(f"Файл конфигурации: {self.config_file} (отслеживание: {self.watcher.mode})")
         print()
         print("Для остановки нажмите Ctrl+C")
         print("=" * 60)
@@ -290,27 +1069,116 @@ class ServiceManager:
         reloader_thread = Thread(target=self.config_reloader_loop, daemon=True)
         reloader_thread.start()
 
+        if self.stream:
+            # Цены приходят по WebSocket, REST используется только при обрыве
+            stream_thread = Thread(target=self.stream.run, daemon=True)
+            stream_thread.start()
+        elif self.scheduler:
+            # Каждый рынок опрашивается со своим адаптивным интервалом
+            fetcher_thread = Thread(target=self.adaptive_fetcher_loop, daemon=True)
+            fetcher_thread.start()
+        elif self.batch_mode:
+            # Один поток запрашивает цены для всех рынков
+            fetcher_thread = Thread(target=self.price_fetcher_loop, daemon=True)
+            fetcher_thread.start()
+
+        if self.depth:
+            depth_thread = Thread(target=self.depth_capture_loop, daemon=True)
+            depth_thread.start()
+
+        if self.discovery:
+            discovery_thread = Thread(target=self.discovery_loop, daemon=True)
+            discovery_thread.start()
+
+        if self.backfiller:
+            backfill_thread = Thread(target=self.backfill_loop, daemon=True)
+            backfill_thread.start()
+
+        refresh_thread = Thread(target=self.market_refresh_loop, daemon=True)
+        refresh_thread.start()
+
+        # События могут появиться в конфигурации позже, поэтому цикл запускается всегда
+        self.events_thread = Thread(target=self.event_fetcher_loop, daemon=True)
+        self.events_thread.start()
+
         try:
-            # Основной цикл - просто ждем
-            while True:
+            # Основной цикл: периодически сохраняем снимок состояния (на случай аварийного завершения)
+            next_save = time.monotonic() + settings.get('warm_state_interval_seconds', 300)
+            while not self.should_stop:
                 time.sleep(1)
+                if self.warm_state and time.monotonic() >= next_save:
+                    self.save_warm_state()
+                    next_save = time.monotonic() + settings.get('warm_state_interval_seconds', 300)
 
         except KeyboardInterrupt:
             print("\n\nОстановка сервиса...")
-            self.should_stop = True
 
-            # Останавливаем все мониторы
-            with config_lock:
-                for slug, (thread, monitor) in self.running_monitors.items():
-                    print(f"Остановка монитора: {slug}")
-                    monitor.stop()
+        self.shutdown()
 
-                # Ждем завершения всех потоков
-                for slug, (thread, monitor) in self.running_monitors.items():
-                    thread.join(timeout=5)
-            
-            print("Сервис остановлен")
+    def stop(self):
+        """Запрос остановки сервиса из другого потока (run() завершится в течение секунды)"""
+        self.should_stop = True
+
+    def shutdown(self):
+        """Остановка мониторов и запись накопленных данных"""
+        self.should_stop = True
+        if self.stream:
+            self.stream.stop()
+
+        # Останавливаем все мониторы
+        with config_lock:
+            for slug, (thread, monitor) in self.running_monitors.items():
+                print(f"Остановка монитора: {slug}")
+                monitor.stop()
+            threads = [thread for thread, _ in self.running_monitors.values()]
+            threads.extend(self.stopping_monitors.values())
+            for monitor in self.event_monitors.values():
+                monitor.stop()
+        if self.events_thread:
+            threads.append(self.events_thread)
+
+        # Ждем завершения всех потоков (общий таймаут: потоки завершаются параллельно)
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for thread in threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+        if self.watcher:
+            self.watcher.close()
+
+        self.save_warm_state()
+        self.close_writer()
+        self.storage.close()
+        if self.depth:
+            self.depth.close()
+            print(f"Глубина: {self.depth.stats()}")
+        if self.metrics_server:
+            self.metrics_server.stop()
+        self.market_cache.close()
+        print(f"Кэш рынков: {self.market_cache.stats()}")
+        print("Сервис остановлен")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Polymarket Price Monitor Service")
+    parser.add_argument('--config', default="config.json", help="Путь к файлу конфигурации")
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads',
+                        help="threads - поток на рынок (по умолчанию), asyncio - один цикл событий")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Количество процессов-воркеров (больше 1 - многопроцессный режим, см. supervisor.py)")
+    args = parser.parse_args(argv)
+
+    if args.workers is not None and args.workers > 1:
+        from supervisor import Supervisor
+        Supervisor(args.config, args.workers, args.engine).run()
+        return
+
+    if args.engine == 'asyncio':
+        from async_engine import AsyncServiceManager
+        manager = AsyncServiceManager(args.config)
+    else:
+        manager = ServiceManager(args.config)
 
-if __name__ == "__main__":
-    manager = ServiceManager()
     manager.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Быстрые запросы по временному интервалу к логам цен.
+
+Для файлов JSON Lines (`storage_backend: "jsonl"`) строится индекс-спутник
+`{file}.idx`: для каждого блока из BLOCK_SIZE записей хранятся смещение в
+байтах и время первой/последней записи. Запрос читает только блоки,
+пересекающиеся с интервалом. Индекс обновляется инкрементально по мере
+роста файла; если файл заменен или перезаписан (другой inode или другие
+байты в начале/конце проиндексированной части), индекс строится заново.
+Файлы с JSON массивом читаются целиком.
+
+Время в логах - локальное без часового пояса, поэтому при переводе часов
+назад (и при дозаписи более старых записей) оно может убывать. Бинарный
+поиск по блокам используется, только пока блоки идут по времени без
+перекрытий; иначе проверяются все блоки по их min/max.
+
+Использование:
+    from query import query
+    data = query("market-slug", datetime(2026, 1, 18, 14), datetime(2026, 1, 18, 15), fields=["mid"])
+    data["timestamp"], data["mid"]   # массивы NumPy
+
+    python query.py index logs/
+    python query.py range market-slug --start 2026-01-18T14:00 --end 2026-01-18T15:00 --fields mid,bid
+"""
+import sys
+import json
+import hashlib
+import argparse
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterator, Sequence, Union
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - опциональная зависимость
+    np = None
+
+from storage import PathLike, JsonArrayStorage, JsonLinesStorage, iter_log_files, iter_log_records
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 2
+BLOCK_SIZE = 256
+# Сколько байт начала и конца проиндексированной части файла входит в отпечаток
+FINGERPRINT_BYTES = 4096
+
+DEFAULT_FIELDS = ('bid', 'ask', 'mid')
+
+
+def _ts(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+class BlockIndex:
+    """
+    Индекс блоков одного файла JSON Lines.
+
+    blocks: список [ts_first, ts_last, offset, count]
+    size: размер файла (в байтах), до которого построен индекс
+    inode, digest: отпечаток файла - inode и хэш начала и конца первых size байт
+    """
+
+    def __init__(self, path: Path, block_size: int = BLOCK_SIZE):
+        self.path = path
+        self.index_path = path.with_name(path.name + INDEX_SUFFIX)
+        self.block_size = block_size
+        self.blocks: List[List[float]] = []
+        self.size = 0
+        self.inode = 0
+        self.digest = ""
+
+    def load(self) -> bool:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False
+        if data.get('version') != INDEX_VERSION or data.get('block_size') != self.block_size:
+            return False
+        self.blocks = data['blocks']
+        self.size = data['size']
+        self.inode = data['inode']
+        self.digest = data['digest']
+        return True
+
+    def save(self) -> None:
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'block_size': self.block_size,
+                       'size': self.size, 'inode': self.inode, 'digest': self.digest,
+                       'blocks': self.blocks}, f)
+        tmp.replace(self.index_path)
+
+    def fingerprint(self, size: int) -> str:
+        """Хэш начала и конца первых size байт файла"""
+        digest = hashlib.sha1()
+        with open(self.path, 'rb') as f:
+            digest.update(f.read(min(size, FINGERPRINT_BYTES)))
+            if size > FINGERPRINT_BYTES:
+                f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+                digest.update(f.read(size - f.tell()))
+        return digest.hexdigest()
+
+    def is_stale(self, stat) -> bool:
+        """Файл заменен или перезаписан с момента построения индекса"""
+        if not self.size:
+            return False
+        return (stat.st_ino != self.inode or stat.st_size < self.size
+                or self.fingerprint(self.size) != self.digest)
+
+    def update(self) -> bool:
+        """
+        Дописывание индекса для новых данных в конце файла.
+
+        Последний (возможно неполный) блок переиндексируется. Если отпечаток
+        файла не совпадает (файл заменен, усечен или перезаписан на месте),
+        индекс строится заново. Возвращает True, если индекс изменился.
+        """
+        stat = self.path.stat()
+        rebuilt = self.is_stale(stat)
+        if rebuilt:
+            self.blocks = []
+            self.size = 0
+        if stat.st_size == self.size:
+            return rebuilt
+
+        start_offset = 0
+        if self.blocks:
+            start_offset = int(self.blocks.pop()[2])
+
+        with open(self.path, 'rb') as f:
+            f.seek(start_offset)
+            offset = start_offset
+            block: Optional[List[float]] = None
+
+            for raw in f:
+                # Недописанная последняя строка будет проиндексирована при следующем обновлении
+                if not raw.endswith(b"\n"):
+                    break
+
+                line_offset = offset
+                offset += len(raw)
+
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    ts = _ts(json.loads(line)['timestamp'])
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+                if block is None or block[3] >= self.block_size:
+                    block = [ts, ts, line_offset, 0]
+                    self.blocks.append(block)
+                block[0] = min(block[0], ts)
+                block[1] = max(block[1], ts)
+                block[3] += 1
+
+        self.size = offset
+        self.inode = stat.st_ino
+        self.digest = self.fingerprint(offset)
+        return True
+
+    def block_range(self, start: Optional[float], end: Optional[float]) -> List[List[float]]:
+        """Блоки, пересекающиеся с интервалом [start, end)"""
+        if any(a[1] > b[0] for a, b in zip(self.blocks, self.blocks[1:])):
+            # Время в файле убывает (перевод часов назад) - просмотр всех блоков
+            return [b for b in self.blocks
+                    if (start is None or b[1] >= start) and (end is None or b[0] < end)]
+
+        first = 0
+        if start is not None:
+            # Блоки упорядочены по времени, поэтому ts_last блоков отсортированы
+            first = bisect_left([b[1] for b in self.blocks], start)
+        result = []
+        for block in self.blocks[first:]:
+            if end is not None and block[0] >= end:
+                break
+            result.append(block)
+        return result
+
+
+def ensure_index(path: PathLike, block_size: int = BLOCK_SIZE) -> BlockIndex:
+    """Загрузка индекса-спутника файла с обновлением под текущий размер файла"""
+    index = BlockIndex(Path(path), block_size)
+    index.load()
+    if index.update():
+        index.save()
+    return index
+
+
+def _iter_jsonl_blocks(path: Path, blocks: List[List[float]]) -> Iterator[Dict[str, Any]]:
+    with open(path, 'rb') as f:
+        previous_end = None
+        for ts_first, ts_last, offset, count in blocks:
+            if previous_end != offset:
+                f.seek(int(offset))
+            read = 0
+            while read < count:
+                raw = f.readline()
+                if not raw:
+                    return
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                read += 1
+                yield record
+            previous_end = f.tell()
+
+
+def _files_for_range(slug: str, output_dir: PathLike,
+                     start: Optional[datetime], end: Optional[datetime]) -> List[Path]:
+    if start is None or end is None:
+        # Интервал открыт хотя бы с одной стороны - перебираем все файлы рынка
+        return [path for _, date_str, path in iter_log_files(output_dir, slug)
+                if (start is None or date_str >= start.date().isoformat())
+                and (end is None or date_str <= end.date().isoformat())]
+
+    files = []
+    day = start.date()
+    while day <= end.date():
+        for storage_cls in (JsonLinesStorage, JsonArrayStorage):
+            path = storage_cls().log_path(output_dir, slug, day.isoformat())
+            if path.exists():
+                files.append(path)
+        day += timedelta(days=1)
+    return files
+
+
+def iter_query(slug: str,
+               start: Optional[datetime] = None,
+               end: Optional[datetime] = None,
+               output_dir: PathLike = "logs") -> Iterator[Dict[str, Any]]:
+    """Генератор записей рынка за интервал [start, end), по дням и с чтением только нужных блоков"""
+    start_ts = start.timestamp() if start is not None else None
+    end_ts = end.timestamp() if end is not None else None
+
+    for path in _files_for_range(slug, output_dir, start, end):
+        if path.suffix == JsonLinesStorage.extension:
+            index = ensure_index(path)
+            records: Iterator[Dict[str, Any]] = _iter_jsonl_blocks(path, index.block_range(start_ts, end_ts))
+        else:
+            records = iter_log_records(path)
+
+        for record in records:
+            try:
+                ts = _ts(record['timestamp'])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if start_ts is not None and ts < start_ts:
+                continue
+            if end_ts is not None and ts >= end_ts:
+                continue
+            yield record
+
+
+def query(slug: str,
+          start: Optional[datetime] = None,
+          end: Optional[datetime] = None,
+          fields: Sequence[str] = DEFAULT_FIELDS,
+          output_dir: PathLike = "logs",
+          as_numpy: bool = True) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
+    """
+    Данные рынка за интервал [start, end).
+
+    Args:
+        slug: Slug рынка
+        start: Начало интервала (None - без ограничения)
+        end: Конец интервала (None - без ограничения)
+        fields: Ценовые поля (bid, ask, mid)
+        output_dir: Директория с логами (settings.output_directory)
+        as_numpy: True - словарь массивов NumPy ('timestamp' - datetime64[us], поля - float64 с NaN
+            вместо пропусков); False - генератор словарей {'timestamp', *fields}
+    """
+    fields = list(fields)
+    records = iter_query(slug, start, end, output_dir)
+
+    if not as_numpy:
+        return ({'timestamp': r['timestamp'], **{name: r.get(name) for name in fields}} for r in records)
+
+    if np is None:
+        raise RuntimeError("Для as_numpy=True требуется numpy: pip install numpy")
+
+    timestamps: List[str] = []
+    values: Dict[str, List[Optional[float]]] = {name: [] for name in fields}
+    for record in records:
+        timestamps.append(record['timestamp'])
+        for name in fields:
+            values[name].append(record.get(name))
+
+    result: Dict[str, Any] = {'timestamp': np.array(timestamps, dtype='datetime64[us]')}
+    for name in fields:
+        result[name] = np.array([np.nan if v is None else v for v in values[name]], dtype=np.float64)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Запросы к логам цен по временному интервалу")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_index = sub.add_parser('index', help="Построение/обновление индексов для .jsonl файлов")
+    p_index.add_argument('output_dir', help="Директория с логами")
+
+    p_range = sub.add_parser('range', help="Данные рынка за интервал")
+    p_range.add_argument('slug', help="Slug рынка")
+    p_range.add_argument('--start', help="Начало интервала (ISO формат)")
+    p_range.add_argument('--end', help="Конец интервала (ISO формат)")
+    p_range.add_argument('--fields', default=",".join(DEFAULT_FIELDS), help="Поля через запятую")
+    p_range.add_argument('--output-dir', default="logs", help="Директория с логами")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'index':
+            count = 0
+            for _, _, path in iter_log_files(args.output_dir):
+                if path.suffix == JsonLinesStorage.extension:
+                    index = ensure_index(path)
+                    count += 1
+                    print(f"[Query] {path.name}: {len(index.blocks)} блоков")
+            print(f"[Query] Проиндексировано файлов: {count}")
+        elif args.command == 'range':
+            rows = query(
+                args.slug,
+                start=datetime.fromisoformat(args.start) if args.start else None,
+                end=datetime.fromisoformat(args.end) if args.end else None,
+                fields=args.fields.split(','),
+                output_dir=args.output_dir,
+                as_numpy=False,
+            )
+            count = 0
+            for row in rows:
+                print(json.dumps(row, ensure_ascii=False))
+                count += 1
+            print(f"Записей: {count}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
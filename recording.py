@@ -0,0 +1,181 @@
+"""
+Запись только изменений цен (дедупликация) с периодическими ключевыми кадрами.
+
+В режиме `record_mode: "changes"` строка пишется, только если bid, ask или mid
+изменились больше чем на `change_epsilon`. Такие строки компактные:
+timestamp, bid, ask, mid. Раз в `keyframe_interval_seconds` (а также первой
+строкой каждого файла) пишется полный ключевой кадр с `"keyframe": true` -
+по ним отсутствие изменений отличается от простоя сервиса.
+
+Состояние фильтра (последние значения, время ключевого кадра) меняется только
+в commit() - после того как запись принята хранилищем или очередью записи.
+Если запись отброшена, следующая строка сравнивается с последней сохраненной
+и ключевой кадр повторяется.
+
+expand_to_grid() разворачивает сжатый поток обратно в регулярную сетку.
+"""
+import sys
+import json
+import argparse
+import statistics
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional, Iterable, Iterator, List
+
+from storage import PathLike, iter_log_records
+
+PRICE_FIELDS = ('bid', 'ask', 'mid')
+
+RECORD_ALL = "all"
+RECORD_CHANGES = "changes"
+
+
+def _changed(previous: Optional[float], current: Optional[float], epsilon: float) -> bool:
+    if previous is None or current is None:
+        return previous is not current
+    return abs(current - previous) > epsilon
+
+
+class ChangeRecorder:
+    """
+    Фильтр записей одного рынка.
+
+    Args:
+        epsilon: Минимальное изменение цены, считающееся изменением
+        keyframe_interval: Интервал между ключевыми кадрами (секунды)
+    """
+
+    def __init__(self, epsilon: float = 0.0, keyframe_interval: float = 300):
+        self.epsilon = epsilon
+        self.keyframe_interval = keyframe_interval
+        self.last_values: Optional[Dict[str, Optional[float]]] = None
+        self.last_keyframe: Optional[datetime] = None
+        self.last_path: Optional[Path] = None
+        self.skipped = 0
+        self._pending: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> Optional["ChangeRecorder"]:
+        """Фильтр по разделу `settings` конфигурации (None, если record_mode != "changes")"""
+        settings = settings or {}
+        if settings.get('record_mode', RECORD_ALL) != RECORD_CHANGES:
+            return None
+        return cls(
+            epsilon=settings.get('change_epsilon', 0.0),
+            keyframe_interval=settings.get('keyframe_interval_seconds', 300),
+        )
+
+    def filter(self, path: PathLike, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Запись, которую нужно сохранить (полный кадр или компактное изменение), или None.
+
+        Состояние не меняется до вызова commit() после успешной записи.
+        """
+        path = Path(path)
+        self._pending = None
+        timestamp = datetime.fromisoformat(entry['timestamp'])
+        values = {name: entry.get(name) for name in PRICE_FIELDS}
+
+        keyframe_due = (
+            self.last_keyframe is None
+            or path != self.last_path
+            or (timestamp - self.last_keyframe).total_seconds() >= self.keyframe_interval
+        )
+
+        if keyframe_due:
+            self._pending = {'last_values': values, 'last_keyframe': timestamp, 'last_path': path}
+            return dict(entry, keyframe=True)
+
+        if any(_changed(self.last_values[name], values[name], self.epsilon) for name in PRICE_FIELDS):
+            self._pending = {'last_values': values}
+            return {'timestamp': entry['timestamp'], **values}
+
+        self.skipped += 1
+        return None
+
+    def commit(self) -> None:
+        """Фиксация состояния после того, как запись последнего filter() сохранена"""
+        if self._pending:
+            for name, value in self._pending.items():
+                setattr(self, name, value)
+        self._pending = None
+
+
+def expand_to_grid(records: Iterable[Dict[str, Any]],
+                   step_seconds: float,
+                   start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   max_gap_seconds: Optional[float] = None,
+                   keyframe_interval: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Разворачивание сжатого потока в регулярную сетку с шагом `step_seconds`.
+
+    Значение в узле сетки - последнее известное на этот момент. Если с
+    последней записи прошло больше `max_gap_seconds` (по умолчанию - 1.5
+    интервала между ключевыми кадрами), узел считается простоем: цены None
+    и `"gap": true`. Интервал берется из `keyframe_interval_seconds` записи
+    (`keyframe_interval`), иначе оценивается по данным медианой: внеплановый
+    ключевой кадр после перезапуска не должен уменьшать порог.
+    """
+    rows = sorted(records, key=lambda r: r['timestamp'])
+    if not rows:
+        return
+
+    parsed = [(datetime.fromisoformat(r['timestamp']), r) for r in rows]
+
+    if max_gap_seconds is None:
+        if keyframe_interval is None:
+            keyframes = [ts for ts, r in parsed if r.get('keyframe')]
+            intervals = [(b - a).total_seconds() for a, b in zip(keyframes, keyframes[1:])]
+            # median_low: при двух интервалах (норма и простой) берется меньший
+            keyframe_interval = statistics.median_low(intervals) if intervals else 300
+        max_gap_seconds = 1.5 * keyframe_interval
+
+    step = timedelta(seconds=step_seconds)
+    current = start or parsed[0][0]
+    stop = end or parsed[-1][0]
+
+    index = -1
+    values: Dict[str, Optional[float]] = {name: None for name in PRICE_FIELDS}
+    last_seen: Optional[datetime] = None
+
+    while current <= stop:
+        while index + 1 < len(parsed) and parsed[index + 1][0] <= current:
+            index += 1
+            last_seen, record = parsed[index]
+            values = {name: record.get(name) for name in PRICE_FIELDS}
+
+        gap = last_seen is None or (current - last_seen).total_seconds() > max_gap_seconds
+        row: Dict[str, Any] = {'timestamp': current.isoformat()}
+        if gap:
+            row.update({name: None for name in PRICE_FIELDS})
+            row['gap'] = True
+        else:
+            row.update(values)
+        yield row
+
+        current += step
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Разворачивание сжатого лога в регулярную сетку")
+    parser.add_argument('path', help="Файл лога")
+    parser.add_argument('--step', type=float, default=60, help="Шаг сетки в секундах")
+    parser.add_argument('--max-gap', type=float, default=None, help="Порог простоя в секундах")
+    parser.add_argument('--keyframe-interval', type=float, default=None,
+                        help="Интервал ключевых кадров при записи (keyframe_interval_seconds)")
+    args = parser.parse_args(argv)
+
+    try:
+        for row in expand_to_grid(iter_log_records(args.path), args.step, max_gap_seconds=args.max_gap,
+                                  keyframe_interval=args.keyframe_interval):
+            print(json.dumps(row, ensure_ascii=False))
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Адаптивное расписание опроса рынков.
+
+У каждого рынка свой интервал в пределах [min_interval, max_interval]:
+- интервал сокращается, когда mid или спред изменились больше порога
+- интервал растет, когда цены стоят на месте
+
+Общий бюджет запросов в секунду ограничивает, сколько пакетных запросов
+может сделать один тик; рынки, не вошедшие в бюджет, остаются в очереди
+и обслуживаются первыми на следующем тике.
+"""
+import math
+import time
+from threading import Lock
+from typing import Dict, Any, Optional, List, Hashable
+
+from api_client import TokenBucket
+
+
+class MarketSchedule:
+    """Состояние расписания одного рынка"""
+
+    __slots__ = ('interval', 'next_due', 'last_mid', 'last_spread')
+
+    def __init__(self, interval: float, next_due: float):
+        self.interval = interval
+        self.next_due = next_due
+        self.last_mid: Optional[float] = None
+        self.last_spread: Optional[float] = None
+
+
+class AdaptiveScheduler:
+    """
+    Args:
+        min_interval: Минимальный интервал опроса рынка (секунды)
+        max_interval: Максимальный интервал опроса рынка (секунды)
+        initial_interval: Начальный интервал для новых рынков
+        change_threshold: Изменение mid или спреда, при котором интервал сокращается
+        tighten_factor: Множитель интервала при изменении цены (< 1)
+        backoff_factor: Множитель интервала при неизменной цене (> 1)
+        request_budget_per_second: Общий лимит запросов в секунду (0 - без ограничения)
+    """
+
+    def __init__(self,
+                 min_interval: float = 5,
+                 max_interval: float = 300,
+                 initial_interval: float = 60,
+                 change_threshold: float = 0.005,
+                 tighten_factor: float = 0.5,
+                 backoff_factor: float = 1.5,
+                 request_budget_per_second: float = 0):
+        self.min_interval = float(min_interval)
+        self.max_interval = max(float(max_interval), self.min_interval)
+        self.initial_interval = self._clamp(initial_interval)
+        self.change_threshold = change_threshold
+        self.tighten_factor = tighten_factor
+        self.backoff_factor = backoff_factor
+        self.budget = TokenBucket(request_budget_per_second) if request_budget_per_second > 0 else None
+
+        self._schedules: Dict[Hashable, MarketSchedule] = {}
+        self._lock = Lock()
+        self.deferred = 0
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "AdaptiveScheduler":
+        """Создание расписания по разделу `settings` конфигурации"""
+        settings = settings or {}
+        return cls(
+            min_interval=settings.get('min_poll_interval_seconds', 5),
+            max_interval=settings.get('max_poll_interval_seconds', 300),
+            initial_interval=settings.get('poll_interval_seconds', 60),
+            change_threshold=settings.get('adaptive_change_threshold', 0.005),
+            tighten_factor=settings.get('adaptive_tighten_factor', 0.5),
+            backoff_factor=settings.get('adaptive_backoff_factor', 1.5),
+            request_budget_per_second=settings.get('request_budget_per_second', 0),
+        )
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, float(interval)))
+
+    def sync(self, keys: List[Hashable], now: Optional[float] = None) -> None:
+        """Синхронизация набора рынков: новые опрашиваются сразу, удаленные забываются"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            current = set(keys)
+            for key in [k for k in self._schedules if k not in current]:
+                del self._schedules[key]
+            for key in keys:
+                if key not in self._schedules:
+                    self._schedules[key] = MarketSchedule(self.initial_interval, now)
+
+    def due(self, batch_size: int = 1, now: Optional[float] = None) -> List[Hashable]:
+        """
+        Рынки, которые пора опросить в этом тике, начиная с самых просроченных.
+
+        Каждые `batch_size` рынков расходуют один запрос из общего бюджета.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            ready = sorted((s.next_due, key) for key, s in self._schedules.items() if s.next_due <= now)
+
+        keys = [key for _, key in ready]
+        if self.budget is None or not keys:
+            return keys
+
+        batch_size = max(1, int(batch_size))
+        allowed = 0
+        for _ in range(math.ceil(len(keys) / batch_size)):
+            if not self.budget.try_acquire():
+                break
+            allowed += batch_size
+
+        self.deferred += max(0, len(keys) - allowed)
+        return keys[:allowed]
+
+    def observe(self, key: Hashable, price_data: Optional[Dict[str, Optional[float]]],
+                now: Optional[float] = None) -> float:
+        """
+        Учет результата опроса и планирование следующего. Возвращает новый интервал.
+
+        Без цен (ошибка запроса) интервал не меняется.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            schedule = self._schedules.get(key)
+            if schedule is None:
+                return self.initial_interval
+
+            if price_data:
+                mid = price_data.get('mid')
+                bid, ask = price_data.get('bid'), price_data.get('ask')
+                spread = ask - bid if bid is not None and ask is not None else None
+
+                changed = False
+                for previous, current in ((schedule.last_mid, mid), (schedule.last_spread, spread)):
+                    if (previous is None) != (current is None):
+                        changed = True
+                    elif previous is not None and abs(current - previous) > self.change_threshold:
+                        changed = True
+
+                # Первое наблюдение не меняет интервал
+                if schedule.last_mid is not None or schedule.last_spread is not None:
+                    factor = self.tighten_factor if changed else self.backoff_factor
+                    schedule.interval = self._clamp(schedule.interval * factor)
+
+                schedule.last_mid = mid
+                schedule.last_spread = spread
+
+            schedule.next_due = now + schedule.interval
+            return schedule.interval
+
+    def intervals(self) -> Dict[Hashable, float]:
+        with self._lock:
+            return {key: s.interval for key, s in self._schedules.items()}
+
+    def snapshot(self) -> Dict[Hashable, Dict[str, Any]]:
+        """Состояние расписания для сохранения между запусками (срок опроса - по часам системы)"""
+        offset = time.time() - time.monotonic()
+        with self._lock:
+            return {key: {'interval': s.interval, 'next_due_at': s.next_due + offset,
+                          'last_mid': s.last_mid, 'last_spread': s.last_spread}
+                    for key, s in self._schedules.items()}
+
+    def restore(self, states: Dict[Hashable, Dict[str, Any]], now: Optional[float] = None) -> int:
+        """
+        Восстановление состояния из snapshot(). Рынки, срок которых прошел
+        за время остановки, опрашиваются сразу.
+
+        Returns:
+            int: количество восстановленных рынков
+        """
+        now = time.monotonic() if now is None else now
+        remaining_base = time.time()
+        with self._lock:
+            for key, state in states.items():
+                schedule = MarketSchedule(self._clamp(state.get('interval', self.initial_interval)),
+                                          now + max(0.0, state.get('next_due_at', 0) - remaining_base))
+                schedule.last_mid = state.get('last_mid')
+                schedule.last_spread = state.get('last_spread')
+                self._schedules[key] = schedule
+        return len(states)
@@ -0,0 +1,544 @@
+"""
+Бэкенд хранения SQLite (`storage_backend: "sqlite"`).
+
+Все рынки пишутся в одну базу `{output_directory}/prices.db` (или
+`sqlite_path`) в режиме WAL. Схема нормализована: рынок хранится один раз
+в таблице `markets`, строки цен ссылаются на него целым `market_id`:
+
+    markets(id, slug, name, token_id)
+    prices(market_id, ts, bid, ask, mid, extra)   -- уникальный индекс (market_id, ts)
+    prices_view                                   -- prices + slug/name рынка
+
+`ts` - время записи в ISO формате (как `timestamp` в файлах), поля записи,
+кроме цен и описания рынка (например `backfill`, `keyframe`, массивы цен
+событий), сохраняются JSON в `extra`. Строки накапливаются в памяти и
+вставляются одним executemany в одной транзакции: после каждой пачки
+LogWriter (записи всех мониторов сразу), а без него - каждые
+`sqlite_batch_records` записей или `fsync_interval_seconds` секунд. Запись
+только дописывает строки в конец таблицы и индекса, поэтому ее стоимость
+не зависит от объема истории.
+
+Интерфейс тот же, что у файловых бэкендов: `log_path()` возвращает
+условный путь `{slug}_{date}.sqlite`, по которому определяется рынок
+(рынки событий из `events/` хранятся как `events/{slug}`).
+
+Обслуживание (раз в `sqlite_maintenance_interval_seconds` и командой
+`maintain`): удаление строк старше `sqlite_retention_days` и прореживание
+строк старше `sqlite_downsample_after_days` до одной (последней) строки на
+интервал `sqlite_downsample_seconds`. Граница уже прореженной истории
+хранится для каждого рынка в `meta` и сдвигается назад, когда merge()
+(бэкфилл, import) добавляет строки старше нее.
+
+Использование:
+    python sqlite_storage.py stats logs/prices.db
+    python sqlite_storage.py query logs/prices.db market-slug --start 2026-01-18T14:00 --end 2026-01-18T15:00
+    python sqlite_storage.py import logs/prices.db logs/
+    python sqlite_storage.py maintain logs/prices.db --retention-days 90 --downsample-after-days 7
+    sqlite3 logs/prices.db "SELECT slug, avg(mid) FROM prices_view WHERE ts >= '2026-01-18' GROUP BY slug"
+"""
+import sys
+import json
+import time
+import sqlite3
+import calendar
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+
+from storage import LogStorage, PathLike, SQLITE_BACKEND, iter_log_files, read_log
+
+DEFAULT_DB_NAME = "prices.db"
+PRICE_FIELDS = ('bid', 'ask', 'mid')
+MARKET_FIELDS = ('market_slug', 'market_name', 'token_id')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS markets (
+    id INTEGER PRIMARY KEY,
+    slug TEXT NOT NULL UNIQUE,
+    name TEXT,
+    token_id TEXT
+);
+CREATE TABLE IF NOT EXISTS prices (
+    market_id INTEGER NOT NULL REFERENCES markets(id),
+    ts TEXT NOT NULL,
+    bid REAL,
+    ask REAL,
+    mid REAL,
+    extra TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS prices_market_ts ON prices (market_id, ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE VIEW IF NOT EXISTS prices_view AS
+    SELECT m.slug, m.name, m.token_id, p.ts, p.bid, p.ask, p.mid, p.extra
+    FROM prices p JOIN markets m ON m.id = p.market_id;
+"""
+
+INSERT_SQL = "INSERT OR IGNORE INTO prices (market_id, ts, bid, ask, mid, extra) VALUES (?, ?, ?, ?, ?, ?)"
+
+SELECT_SQL = """
+SELECT m.slug, m.name, m.token_id, p.ts, p.bid, p.ask, p.mid, p.extra
+FROM prices p JOIN markets m ON m.id = p.market_id
+WHERE p.market_id = ? AND p.ts >= ? AND p.ts < ?
+ORDER BY p.ts
+"""
+
+# Из строк одного интервала остается последняя по времени
+DOWNSAMPLE_SQL = """
+DELETE FROM prices WHERE rowid IN (
+    SELECT rowid FROM (
+        SELECT rowid, ROW_NUMBER() OVER (
+            PARTITION BY CAST(strftime('%s', ts) AS INTEGER) / :bucket ORDER BY ts DESC
+        ) AS n
+        FROM prices WHERE market_id = :market AND ts >= :since AND ts < :cutoff
+    ) WHERE n > 1
+)
+"""
+
+# Границы интервалов в ISO формате: '' меньше любой даты, '~' - больше
+TS_MIN = ""
+TS_MAX = "~"
+
+
+def _row(market_id: int, entry: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Запись лога -> строка таблицы prices"""
+    extra = {k: v for k, v in entry.items() if k != 'timestamp' and k not in PRICE_FIELDS and k not in MARKET_FIELDS}
+    prices = []
+    for field in PRICE_FIELDS:
+        value = entry.get(field)
+        if value is not None and not isinstance(value, (int, float)):
+            # Массивы цен событий не помещаются в числовые столбцы
+            extra[field] = value
+            value = None
+        prices.append(value)
+    return (market_id, entry['timestamp'], *prices,
+            json.dumps(extra, ensure_ascii=False, separators=(',', ':')) if extra else None)
+
+
+def _record(slug: str, name: Optional[str], token_id: Optional[str], ts: str,
+            bid: Optional[float], ask: Optional[float], mid: Optional[float], extra: Optional[str]) -> Dict[str, Any]:
+    """Строка таблицы -> запись в формате файловых логов"""
+    record: Dict[str, Any] = {'timestamp': ts}
+    if token_id is not None:
+        record.update(market_slug=slug, market_name=name, token_id=token_id)
+    record.update(bid=bid, ask=ask, mid=mid)
+    if extra:
+        record.update(json.loads(extra))
+    return record
+
+
+def _align(ts: str, bucket_seconds: int) -> str:
+    """Начало интервала прореживания, содержащего ts (в той же шкале, что strftime('%s') в SQL)"""
+    seconds = calendar.timegm(datetime.fromisoformat(ts).timetuple())
+    return (datetime(1970, 1, 1) + timedelta(seconds=seconds - seconds % bucket_seconds)).isoformat()
+
+
+def _watermark_key(market_id: int) -> str:
+    """Ключ `meta` с границей прореженной истории рынка"""
+    return f"downsampled_until:{market_id}"
+
+
+def _next_day(date_str: str) -> str:
+    return (datetime.fromisoformat(date_str) + timedelta(days=1)).date().isoformat()
+
+
+class SqliteStorage(LogStorage):
+    """
+    Все рынки в одной базе SQLite.
+
+    Args:
+        db_path: Файл базы
+        root: Директория логов, относительно которой условные пути `log_path()`
+            переводятся в ключи рынков (по умолчанию - директория базы)
+        batch_records: Вставка накопленных строк после стольких записей
+        commit_interval: Вставка накопленных строк не реже, чем раз в столько секунд
+        retention_days: Удалять строки старше стольких дней (None - хранить все)
+        downsample_after_days: Прореживать строки старше стольких дней (None - не прореживать)
+        downsample_seconds: Интервал прореживания (одна строка на интервал)
+        maintenance_interval: Как часто выполнять удаление и прореживание (секунды)
+    """
+
+    name = SQLITE_BACKEND
+    extension = ".sqlite"
+
+    def __init__(self, db_path: PathLike, root: Optional[PathLike] = None, batch_records: int = 1000,
+                 commit_interval: float = 5.0, retention_days: Optional[float] = None,
+                 downsample_after_days: Optional[float] = None, downsample_seconds: int = 300,
+                 maintenance_interval: float = 3600):
+        super().__init__()
+        self.db_path = Path(db_path)
+        self.root = Path(root).absolute() if root is not None else self.db_path.parent.absolute()
+        self.batch_records = max(1, int(batch_records))
+        self.commit_interval = commit_interval
+        self.retention_days = retention_days
+        self.downsample_after_days = downsample_after_days
+        self.downsample_seconds = max(1, int(downsample_seconds))
+        self.maintenance_interval = maintenance_interval
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Транзакции управляются явно; соединение защищено self._lock
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        self._keys: Dict[Path, str] = {}
+        self._markets: Dict[str, Tuple[int, Optional[str], Optional[str]]] = {}
+        self._buffer: List[Tuple[Any, ...]] = []
+        self._last_commit = time.monotonic()
+        # Первое обслуживание - при первой вставке после запуска
+        self._last_maintenance: Optional[float] = None
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> "SqliteStorage":
+        """Создание по разделу `settings` конфигурации"""
+        settings = settings or {}
+        output_dir = settings.get('output_directory', 'logs')
+        return cls(
+            settings.get('sqlite_path') or Path(output_dir) / DEFAULT_DB_NAME,
+            root=output_dir,
+            batch_records=settings.get('sqlite_batch_records', 1000),
+            commit_interval=settings.get('fsync_interval_seconds', 5.0),
+            retention_days=settings.get('sqlite_retention_days'),
+            downsample_after_days=settings.get('sqlite_downsample_after_days'),
+            downsample_seconds=settings.get('sqlite_downsample_seconds', 300),
+            maintenance_interval=settings.get('sqlite_maintenance_interval_seconds', 3600),
+        )
+
+    # Рынки
+
+    def _parse(self, path: PathLike) -> Tuple[str, Optional[str]]:
+        """Условный путь `{dir}/{slug}_{date}.sqlite` -> (ключ рынка, дата)"""
+        path = Path(path)
+        stem = path.name[:-len(self.extension)] if path.name.endswith(self.extension) else path.name
+        slug, sep, date_str = stem.rpartition('_')
+        if not sep:
+            slug, date_str = stem, ""
+
+        key = self._keys.get(path.parent)
+        if key is None:
+            try:
+                key = path.parent.absolute().relative_to(self.root).as_posix()
+            except ValueError:
+                key = "."
+            self._keys[path.parent] = key
+        return (slug if key == "." else f"{key}/{slug}"), (date_str or None)
+
+    def _market_id_locked(self, slug: str, entry: Optional[Dict[str, Any]] = None) -> int:
+        name = entry.get('market_name') if entry else None
+        token_id = entry.get('token_id') if entry else None
+
+        cached = self._markets.get(slug)
+        if cached is not None and (name is None or name == cached[1]) and (token_id is None or token_id == cached[2]):
+            return cached[0]
+
+        self._conn.execute(
+            "INSERT INTO markets (slug, name, token_id) VALUES (?, ?, ?) "
+            "ON CONFLICT(slug) DO UPDATE SET name = coalesce(excluded.name, name), "
+            "token_id = coalesce(excluded.token_id, token_id)",
+            (slug, name, token_id),
+        )
+        market_id, name, token_id = self._conn.execute(
+            "SELECT id, name, token_id FROM markets WHERE slug = ?", (slug,)).fetchone()
+        self._markets[slug] = (market_id, name, token_id)
+        return market_id
+
+    def _lookup_locked(self, slug: str) -> Optional[int]:
+        cached = self._markets.get(slug)
+        if cached is not None:
+            return cached[0]
+        row = self._conn.execute("SELECT id FROM markets WHERE slug = ?", (slug,)).fetchone()
+        return row[0] if row else None
+
+    # Запись
+
+    def append(self, path: PathLike, entry: Dict[str, Any]) -> None:
+        self.append_many(path, [entry])
+
+    def append_many(self, path: PathLike, entries: List[Dict[str, Any]]) -> None:
+        if not entries:
+            return
+        slug, _ = self._parse(path)
+        with self._lock:
+            # Описание рынка берется из последней полной записи (в сжатых записях его нет)
+            full = next((e for e in reversed(entries) if e.get('token_id') is not None), None)
+            market_id = self._market_id_locked(slug, full)
+            self._buffer.extend(_row(market_id, entry) for entry in entries)
+            if (len(self._buffer) >= self.batch_records
+                    or time.monotonic() - self._last_commit >= self.commit_interval):
+                self._commit_locked()
+
+    def _commit_locked(self) -> None:
+        """Вставка накопленных строк одним executemany в одной транзакции"""
+        if self._buffer:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(INSERT_SQL, self._buffer)
+                self._conn.execute("COMMIT")
+            except sqlite3.OperationalError:
+                # База занята другим процессом дольше таймаута - строки останутся до следующей пачки
+                self._conn.execute("ROLLBACK")
+                raise
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._buffer.clear()
+                raise
+            self._buffer.clear()
+        self._last_commit = time.monotonic()
+
+        if self._last_maintenance is None or time.monotonic() - self._last_maintenance >= self.maintenance_interval:
+            self._last_maintenance = time.monotonic()
+            result = self._maintain_locked()
+            if result['pruned'] or result['downsampled']:
+                print(f"[Storage] SQLite: удалено строк {result['pruned']}, прорежено {result['downsampled']}")
+
+    def commit(self) -> None:
+        with self._lock:
+            self._commit_locked()
+
+    def merge(self, path: PathLike, entries: List[Dict[str, Any]]) -> int:
+        """Вставка записей с дедупликацией по (рынок, timestamp). Returns: количество добавленных"""
+        if not entries:
+            return 0
+        slug, _ = self._parse(path)
+        with self._lock:
+            self._commit_locked()
+            full = next((e for e in reversed(entries) if e.get('token_id') is not None), None)
+            market_id = self._market_id_locked(slug, full)
+            rows = [_row(market_id, entry) for entry in entries]
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(INSERT_SQL, rows)
+                added = self._conn.total_changes - before
+                earliest = min(row[1] for row in rows)
+                if added and earliest < self._watermark_locked(market_id):
+                    # Строки добавлены в уже прореженную часть истории - она будет прорежена заново
+                    self._set_watermark_locked(market_id, earliest)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return added
+
+    def flush(self) -> None:
+        with self._lock:
+            self._commit_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is None:
+                return
+            self._commit_locked()
+            self._conn.close()
+            self._conn = None
+
+    # Чтение
+
+    def _select_locked(self, slug: str, start: str, end: str) -> List[Dict[str, Any]]:
+        self._commit_locked()
+        market_id = self._lookup_locked(slug)
+        if market_id is None:
+            return []
+        return [_record(*row) for row in self._conn.execute(SELECT_SQL, (market_id, start, end))]
+
+    def iter_records(self, path: PathLike) -> Iterator[Dict[str, Any]]:
+        slug, date_str = self._parse(path)
+        with self._lock:
+            if date_str:
+                records = self._select_locked(slug, date_str, _next_day(date_str))
+            else:
+                records = self._select_locked(slug, TS_MIN, TS_MAX)
+        return iter(records)
+
+    def query(self, slug: str, start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Записи рынка за интервал [start, end) в порядке времени"""
+        with self._lock:
+            return self._select_locked(
+                slug,
+                start.isoformat() if start else TS_MIN,
+                end.isoformat() if end else TS_MAX,
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._commit_locked()
+            markets = self._conn.execute("SELECT count(*) FROM markets").fetchone()[0]
+            rows, first, last = self._conn.execute("SELECT count(*), min(ts), max(ts) FROM prices").fetchone()
+        return {
+            'markets': markets,
+            'rows': rows,
+            'first': first,
+            'last': last,
+            'size_bytes': sum(p.stat().st_size for p in self.db_path.parent.glob(self.db_path.name + "*")),
+        }
+
+    # Обслуживание
+
+    def _market_ids_locked(self) -> List[int]:
+        return [row[0] for row in self._conn.execute("SELECT id FROM markets")]
+
+    def _prune_locked(self, before: str) -> int:
+        before_changes = self._conn.total_changes
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # По рынкам, чтобы удаление шло по индексу (market_id, ts)
+            for market_id in self._market_ids_locked():
+                self._conn.execute("DELETE FROM prices WHERE market_id = ? AND ts < ?", (market_id, before))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return self._conn.total_changes - before_changes
+
+    def _watermark_locked(self, market_id: int) -> str:
+        """Граница прореженной истории рынка (общая граница - для баз прежних версий)"""
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key IN (?, 'downsampled_until') ORDER BY key = 'downsampled_until'",
+            (_watermark_key(market_id),)).fetchone()
+        return row[0] if row else TS_MIN
+
+    def _set_watermark_locked(self, market_id: int, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                           (_watermark_key(market_id), value))
+
+    def _downsample_locked(self, before: str, bucket_seconds: int) -> int:
+        cutoff = _align(before, bucket_seconds)
+        removed = 0
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for market_id in self._market_ids_locked():
+                # Уже прореженная часть истории повторно не просматривается; граница
+                # выравнивается по интервалу, чтобы интервал с добавленными строками попал целиком
+                watermark = self._watermark_locked(market_id)
+                since = _align(watermark, bucket_seconds) if watermark != TS_MIN else TS_MIN
+                if cutoff > since:
+                    before_changes = self._conn.total_changes
+                    self._conn.execute(DOWNSAMPLE_SQL, {'bucket': bucket_seconds, 'market': market_id,
+                                                        'since': since, 'cutoff': cutoff})
+                    removed += self._conn.total_changes - before_changes
+                self._set_watermark_locked(market_id, max(cutoff, watermark))
+            self._conn.execute("DELETE FROM meta WHERE key = 'downsampled_until'")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def _maintain_locked(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        now = now or datetime.now()
+        result = {'pruned': 0, 'downsampled': 0}
+        if self.retention_days:
+            result['pruned'] = self._prune_locked((now - timedelta(days=self.retention_days)).isoformat())
+        if self.downsample_after_days:
+            result['downsampled'] = self._downsample_locked(
+                (now - timedelta(days=self.downsample_after_days)).isoformat(), self.downsample_seconds)
+        return result
+
+    def prune(self, before: datetime) -> int:
+        """Удаление строк старше before. Returns: количество удаленных строк"""
+        with self._lock:
+            self._commit_locked()
+            return self._prune_locked(before.isoformat())
+
+    def downsample(self, before: datetime, bucket_seconds: int) -> int:
+        """Прореживание строк старше before до одной на интервал. Returns: количество удаленных строк"""
+        with self._lock:
+            self._commit_locked()
+            return self._downsample_locked(before.isoformat(), max(1, int(bucket_seconds)))
+
+    def maintain(self) -> Dict[str, int]:
+        """Удаление и прореживание по настройкам хранения"""
+        with self._lock:
+            self._commit_locked()
+            self._last_maintenance = time.monotonic()
+            return self._maintain_locked()
+
+
+def import_logs(storage: SqliteStorage, output_dir: PathLike) -> Dict[str, int]:
+    """Загрузка файлов логов `{slug}_{date}.json[l]` из директории и ее подкаталогов (`events/`) в базу"""
+    output_dir = Path(output_dir)
+    directories = [output_dir] + sorted(p for p in output_dir.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    stats = {'files': 0, 'added': 0}
+    for directory in directories:
+        for slug, date_str, path in iter_log_files(directory):
+            added = storage.merge(storage.log_path(directory, slug, date_str), read_log(path))
+            stats['files'] += 1
+            stats['added'] += added
+            print(f"[Storage] {path.relative_to(output_dir)}: добавлено {added}")
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Хранилище цен SQLite")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_stats = sub.add_parser('stats', help="Размер и содержимое базы")
+    p_stats.add_argument('db', help="Файл базы")
+
+    p_query = sub.add_parser('query', help="Записи рынка за интервал (JSON Lines)")
+    p_query.add_argument('db', help="Файл базы")
+    p_query.add_argument('slug', help="Slug рынка (для событий - events/{slug})")
+    p_query.add_argument('--start', help="Начало интервала (ISO формат)")
+    p_query.add_argument('--end', help="Конец интервала (ISO формат)")
+
+    p_import = sub.add_parser('import', help="Загрузка существующих файлов логов")
+    p_import.add_argument('db', help="Файл базы")
+    p_import.add_argument('directory', help="Директория с логами (output_directory)")
+
+    p_maintain = sub.add_parser('maintain', help="Удаление старых строк и прореживание")
+    p_maintain.add_argument('db', help="Файл базы")
+    p_maintain.add_argument('--retention-days', type=float, help="Удалить строки старше N дней")
+    p_maintain.add_argument('--downsample-after-days', type=float, help="Проредить строки старше N дней")
+    p_maintain.add_argument('--downsample-seconds', type=int, default=300, help="Интервал прореживания")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'import':
+            storage = SqliteStorage(args.db, root=args.directory)
+        elif args.command == 'maintain':
+            storage = SqliteStorage(args.db, retention_days=args.retention_days,
+                                    downsample_after_days=args.downsample_after_days,
+                                    downsample_seconds=args.downsample_seconds)
+        else:
+            if not Path(args.db).exists():
+                print(f"Ошибка: база {args.db} не найдена")
+                return 1
+            storage = SqliteStorage(args.db)
+
+        try:
+            if args.command == 'stats':
+                for key, value in storage.stats().items():
+                    print(f"{key}: {value}")
+            elif args.command == 'query':
+                rows = storage.query(
+                    args.slug,
+                    start=datetime.fromisoformat(args.start) if args.start else None,
+                    end=datetime.fromisoformat(args.end) if args.end else None,
+                )
+                for row in rows:
+                    print(json.dumps(row, ensure_ascii=False))
+                print(f"Записей: {len(rows)}")
+            elif args.command == 'import':
+                stats = import_logs(storage, args.directory)
+                print(f"[Storage] Файлов: {stats['files']}, добавлено записей: {stats['added']}")
+            elif args.command == 'maintain':
+                result = storage.maintain()
+                print(f"[Storage] Удалено строк: {result['pruned']}, прорежено: {result['downsampled']}")
+        finally:
+            storage.close()
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+Быстрый старт сервиса: параллельная предзагрузка рынков, повторная
+инициализация в фоне и снимок "теплого" состояния.
+
+Предзагрузка: детали всех рынков, которых нет в кэше и в снимке,
+запрашиваются у Gamma пачками по `init_batch_size` slug в одном запросе
+(`GET /markets?slug=a&slug=b...`), не больше `init_concurrency` пачек
+одновременно. Мониторы затем инициализируются из MarketCache без запросов.
+
+Снимок (`warm_state_file`, по умолчанию `{output_directory}/.warm_state.json`)
+сохраняется при остановке и раз в `warm_state_interval_seconds`: детали и
+token_id рынков, последние цены, адаптивное расписание и исходы событий.
+После перезапуска мониторы из снимка получают token_id без обращения к
+Gamma, и первый пакетный запрос цен выполняется сразу; их детали затем
+уточняются в фоне (`fetch_details`), и закрытые за время простоя рынки снимаются.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterable
+
+from api_client import PolymarketClient, get_client
+from market_cache import MarketCache
+from scheduler import AdaptiveScheduler
+from storage import atomic_write_text
+
+WARM_STATE_NAME = ".warm_state.json"
+WARM_STATE_VERSION = 1
+
+
+def fetch_details(slugs: Iterable[str], client: Optional[PolymarketClient] = None,
+                  batch_size: int = 50, concurrency: int = 8) -> Dict[str, Dict[str, Any]]:
+    """
+    Детали рынков от Gamma пачками slug, пачки - параллельно (без кэша).
+
+    Returns:
+        dict: slug -> детали рынка (рынки, не найденные Gamma, отсутствуют)
+    """
+    slugs = list(dict.fromkeys(slugs))
+    if not slugs:
+        return {}
+
+    client = client or get_client()
+    batch_size = max(1, int(batch_size))
+    chunks = [slugs[i:i + batch_size] for i in range(0, len(slugs), batch_size)]
+
+    def fetch(chunk: List[str]) -> Optional[List[Dict[str, Any]]]:
+        return client.list_markets({'slug': chunk, 'limit': len(chunk)})
+
+    found: Dict[str, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=max(1, int(concurrency)), thread_name_prefix="prefetch") as pool:
+        for chunk, markets in zip(chunks, pool.map(fetch, chunks)):
+            wanted = set(chunk)
+            for market in markets or []:
+                if market.get('slug') in wanted:
+                    found[market['slug']] = market
+    return found
+
+
+def prefetch_details(slugs: Iterable[str], market_cache: MarketCache, client: Optional[PolymarketClient] = None,
+                     batch_size: int = 50, concurrency: int = 8) -> int:
+    """
+    Загрузка в кэш деталей рынков, которых в нем нет, пачками slug.
+
+    Returns:
+        int: количество рынков, полученных от Gamma
+    """
+    missing = [slug for slug in dict.fromkeys(slugs) if not market_cache.contains(slug)]
+    found = fetch_details(missing, client, batch_size=batch_size, concurrency=concurrency)
+    for slug, market in found.items():
+        market_cache.put(slug, market, prefetch=True)
+    return len(found)
+
+
+class WarmState:
+    """
+    Снимок состояния сервиса для быстрого перезапуска.
+
+    Записи снимка используются один раз: после восстановления монитора его
+    запись удаляется, и рынок, добавленный позже, инициализируется обычно.
+
+    Args:
+        path: Файл снимка
+        max_age: Снимок старше стольких секунд не используется
+    """
+
+    def __init__(self, path: str, max_age: float = 7 * 24 * 3600):
+        self.path = Path(path)
+        self.max_age = max_age
+        self.markets: Dict[str, Dict[str, Any]] = {}
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.schedule: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_settings(cls, settings: Optional[Dict[str, Any]] = None) -> Optional["WarmState"]:
+        """Снимок по разделу `settings` конфигурации (None, если отключен)"""
+        settings = settings or {}
+        if not settings.get('warm_state_enabled', True):
+            return None
+        path = settings.get('warm_state_file') or Path(settings.get('output_directory', 'logs')) / WARM_STATE_NAME
+        return cls(str(path), max_age=settings.get('warm_state_max_age_seconds', 7 * 24 * 3600))
+
+    def load(self) -> bool:
+        """Чтение снимка. Returns: True, если снимок прочитан и не устарел"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[Warm State] Ошибка чтения {self.path}: {e}")
+            return False
+
+        if data.get('version') != WARM_STATE_VERSION:
+            return False
+        age = time.time() - data.get('saved_ts', 0)
+        if age > self.max_age:
+            print(f"[Warm State] Снимок устарел ({age / 3600:.1f} ч), не используется")
+            return False
+
+        self.markets = data.get('markets', {})
+        self.events = data.get('events', {})
+        self.schedule = data.get('schedule', {})
+        print(f"[Warm State] Загружен снимок: рынков {len(self.markets)}, событий {len(self.events)}")
+        return True
+
+    def restore_monitor(self, monitor) -> bool:
+        """Детали, token_id и последняя цена MarketMonitor из снимка"""
+        state = self.markets.pop(monitor.slug, None)
+        if not state or not state.get('token_id') or not isinstance(state.get('details'), dict):
+            return False
+        monitor.market_details = state['details']
+        monitor.token_id = state['token_id']
+        monitor.token_ids = state.get('token_ids') or [state['token_id']]
+        monitor.last_price = state.get('last_price')
+        return True
+
+    def restore_event(self, monitor) -> bool:
+        """Исходы EventMonitor из снимка (следующее уточнение - через event_refresh_interval_seconds)"""
+        state = self.events.pop(monitor.slug, None)
+        if not state or not state.get('outcomes'):
+            return False
+        monitor.outcomes = state['outcomes']
+        monitor.token_ids = [o['token_id'] for o in monitor.outcomes]
+        monitor.resolved_at = time.monotonic()
+        return True
+
+    def restore_scheduler(self, scheduler: AdaptiveScheduler) -> int:
+        """Интервалы и сроки опроса адаптивного расписания"""
+        restored = scheduler.restore(self.schedule)
+        self.schedule = {}
+        return restored
+
+    def save(self, monitors: Iterable[Any], event_monitors: Iterable[Any] = (),
+             scheduler: Optional[AdaptiveScheduler] = None) -> int:
+        """
+        Атомарная запись снимка по текущим мониторам.
+
+        Returns:
+            int: количество сохраненных рынков
+        """
+        markets = {}
+        for monitor in monitors:
+            if monitor.token_id and monitor.market_details:
+                markets[monitor.slug] = {
+                    'details': monitor.market_details,
+                    'token_id': monitor.token_id,
+                    'token_ids': monitor.token_ids,
+                    'last_price': monitor.last_price,
+                }
+        events = {monitor.slug: {'outcomes': monitor.outcomes} for monitor in event_monitors if monitor.outcomes}
+
+        data = {
+            'version': WARM_STATE_VERSION,
+            'saved_at': datetime.now().isoformat(),
+            'saved_ts': time.time(),
+            'markets': markets,
+            'events': events,
+            'schedule': scheduler.snapshot() if scheduler else {},
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(self.path, json.dumps(data, ensure_ascii=False, separators=(',', ':')), fsync=False)
+        except OSError as e:
+            print(f"[Warm State] Ошибка записи {self.path}: {e}")
+            return 0
+        return len(markets)
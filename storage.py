@@ -0,0 +1,673 @@
+"""
+Бэкенды хранения логов цен.
+
+Поддерживаются форматы:
+- "json"   - исходный формат: один JSON массив на файл (чтение-изменение-запись на каждую запись)
+- "jsonl"  - JSON Lines: одна запись на строку, запись только дописыванием (O(1) на тик)
+- "sqlite" - одна база SQLite на все рынки (см. sqlite_storage.py)
+
+Имена файлов сохраняют прежнюю ротацию `{slug}_{date}`, меняется только расширение.
+
+Запись устойчива к падению процесса: JSON массив перезаписывается атомарно
+(временный файл + rename), JSON Lines только дописывается. fsync выполняется
+пачками (`fsync_every_records` / `fsync_interval_seconds`). Восстановление
+после падения (`recover_logs`, `python storage.py recover`) обрезает
+недописанные строки, извлекает уцелевшие записи из поврежденных массивов и
+удаляет брошенные временные файлы.
+"""
+import json
+import os
+import re
+import sys
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Any, Optional, List, Iterator, IO, Union, Tuple
+
+PathLike = Union[str, Path]
+
+
+def safe_slug(slug: str) -> str:
+    """Приведение slug к виду, пригодному для имени файла"""
+    return slug.replace('/', '_').replace('\\', '_')
+
+
+LOG_FILENAME_RE = re.compile(r"^(?P<slug>.+)_(?P<date>\d{4}-\d{2}-\d{2})\.(?P<ext>jsonl?)$")
+
+TMP_SUFFIX = ".tmp"
+CORRUPT_SUFFIX = ".corrupt"
+
+
+def parse_log_filename(path: PathLike) -> Optional[Tuple[str, str]]:
+    """Разбор имени файла лога `{slug}_{date}.json[l]` -> (slug, date) или None"""
+    match = LOG_FILENAME_RE.match(Path(path).name)
+    if not match:
+        return None
+    return match.group('slug'), match.group('date')
+
+
+def iter_log_files(output_dir: PathLike, slug: Optional[str] = None) -> Iterator[Tuple[str, str, Path]]:
+    """Перебор файлов логов в директории: (slug, date, path), отсортировано по slug и дате"""
+    found = []
+    for path in Path(output_dir).glob("*.json*"):
+        parsed = parse_log_filename(path)
+        if parsed is None:
+            continue
+        if slug is not None and parsed[0] != safe_slug(slug):
+            continue
+        found.append((parsed[0], parsed[1], path))
+    return iter(sorted(found))
+
+
+def _fsync_directory(directory: Path) -> None:
+    """fsync каталога, чтобы rename пережил отключение питания (только POSIX)"""
+    if os.name != 'posix':
+        return
+    try:
+        fd = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_text(path: PathLike, text: str, fsync: bool = True) -> None:
+    """
+    Атомарная замена содержимого файла: запись во временный файл рядом и os.replace.
+
+    При падении процесса на диске остается либо прежний, либо новый файл целиком.
+    fsync=True дополнительно защищает от потери данных при отключении питания.
+    """
+    path = Path(path)
+    tmp = path.with_name(path.name + TMP_SUFFIX)
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if fsync:
+        _fsync_directory(path.parent)
+
+
+def salvage_json_array(content: str) -> Tuple[List[Any], int]:
+    """
+    Извлечение целых элементов из оборванного JSON массива.
+
+    Returns:
+        (уцелевшие элементы, количество непрочитанных символов в конце)
+    """
+    decoder = json.JSONDecoder()
+    records: List[Any] = []
+    pos = len(content) - len(content.lstrip())
+    if not content.startswith('[', pos):
+        return records, len(content) - pos
+    pos += 1
+    good_end = pos
+    while True:
+        while pos < len(content) and content[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(content) or content[pos] == ']':
+            break
+        try:
+            record, pos = decoder.raw_decode(content, pos)
+        except json.JSONDecodeError:
+            break
+        records.append(record)
+        good_end = pos
+    rest = content[good_end:].strip().lstrip(',').strip()
+    return records, 0 if rest in ('', ']') else len(content) - good_end
+
+
+class LogStorage:
+    """Базовый класс бэкенда хранения"""
+
+    name = "base"
+    extension = ".json"
+
+    def __init__(self):
+        self._lock = Lock()
+
+    def log_path(self, output_dir: PathLike, slug: str, date_str: Optional[str] = None) -> Path:
+        """Путь к файлу лога для рынка за указанный день (по умолчанию - сегодня)"""
+        if date_str is None:
+            date_str = datetime.now().strftime("%Y-%m-%d")
+        return Path(output_dir) / f"{safe_slug(slug)}_{date_str}{self.extension}"
+
+    def append(self, path: PathLike, entry: Dict[str, Any]) -> None:
+        """Добавление одной записи в файл"""
+        raise NotImplementedError
+
+    def append_many(self, path: PathLike, entries: List[Dict[str, Any]]) -> None:
+        """Добавление нескольких записей в один файл"""
+        for entry in entries:
+            self.append(path, entry)
+
+    def merge(self, path: PathLike, entries: List[Dict[str, Any]]) -> int:
+        """
+        Вставка записей в середину файла (дозаполнение истории).
+
+        Записи с уже существующим `timestamp` отбрасываются, файл
+        перезаписывается атомарно в порядке времени. Выполняется под той же
+        блокировкой, что и дописывание, поэтому безопасна при работающем
+        потоке записи.
+
+        Returns:
+            int: количество добавленных записей
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            records = self._read_locked(path)
+            seen = {record.get('timestamp') for record in records}
+            added = 0
+            for entry in entries:
+                if entry.get('timestamp') in seen:
+                    continue
+                seen.add(entry.get('timestamp'))
+                records.append(entry)
+                added += 1
+            if added:
+                records.sort(key=lambda record: datetime.fromisoformat(record['timestamp']))
+                self._rewrite_locked(path, records)
+            return added
+
+    def _read_locked(self, path: Path) -> List[Dict[str, Any]]:
+        return read_log(path) if path.exists() else []
+
+    def _rewrite_locked(self, path: Path, records: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def iter_records(self, path: PathLike) -> Iterator[Dict[str, Any]]:
+        """Записи рынка за день из `log_path()` (пусто, если записей нет)"""
+        path = Path(path)
+        if path.exists():
+            yield from iter_log_records(path)
+
+    def commit(self) -> None:
+        """Завершение пачки записей (LogWriter вызывает после каждого сброса очереди)"""
+
+    def flush(self) -> None:
+        """Сброс буферов на диск"""
+
+    def close(self) -> None:
+        """Закрытие всех открытых ресурсов"""
+        self.flush()
+
+
+class JsonArrayStorage(LogStorage):
+    """
+    Исходный формат: файл содержит JSON массив, который перезаписывается целиком.
+
+    Перезапись атомарная (временный файл + rename), поэтому падение во время
+    записи не обрезает файл. fsync временного файла выполняется пачками:
+    каждые `fsync_every` записей или раз в `fsync_interval` секунд.
+    """
+
+    name = "json"
+    extension = ".json"
+
+    def __init__(self, fsync_every: int = 100, fsync_interval: float = 5.0):
+        super().__init__()
+        self.fsync_every = max(1, int(fsync_every))
+        self.fsync_interval = fsync_interval
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def append(self, path: PathLike, entry: Dict[str, Any]) -> None:
+        self.append_many(path, [entry])
+
+    def _read_locked(self, path: Path) -> List[Dict[str, Any]]:
+        return self._load(path)
+
+    def _rewrite_locked(self, path: Path, records: List[Dict[str, Any]]) -> None:
+        atomic_write_text(path, json.dumps(records, indent=2, ensure_ascii=False))
+
+    @staticmethod
+    def _load(path: Path) -> List[Dict[str, Any]]:
+        """Текущее содержимое файла; поврежденный файл сохраняется рядом, уцелевшие записи возвращаются"""
+        if not path.exists():
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        if not content.strip():
+            return []
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            records, lost = salvage_json_array(content)
+            backup = _backup_path(path)
+            os.replace(path, backup)
+            print(f"[Storage] Поврежденный файл {path}: восстановлено {len(records)} записей, "
+                  f"потеряно {lost} символов, копия: {backup.name}")
+            return records
+
+    def append_many(self, path: PathLike, entries: List[Dict[str, Any]]) -> None:
+        # Одна перезапись файла на всю пачку записей
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            logs = self._load(path)
+            logs.extend(entries)
+
+            now = time.monotonic()
+            self._pending += len(entries)
+            durable = self._pending >= self.fsync_every or now - self._last_fsync >= self.fsync_interval
+
+            atomic_write_text(path, json.dumps(logs, indent=2, ensure_ascii=False), fsync=durable)
+
+            if durable:
+                self._pending = 0
+                self._last_fsync = now
+
+
+class JsonLinesStorage(LogStorage):
+    """
+    Append-only JSON Lines.
+
+    Каждая запись - одна строка, записываемая одним вызовом write() и сразу
+    передаваемая ОС (flush), поэтому падение процесса теряет не более одной
+    недописанной строки. fsync выполняется пачками: каждые `fsync_every`
+    записей или раз в `fsync_interval` секунд.
+    """
+
+    name = "jsonl"
+    extension = ".jsonl"
+
+    # Файлы, в которые не писали дольше этого времени, закрываются (ротация по дням)
+    IDLE_CLOSE_SECONDS = 300
+
+    def __init__(self, fsync_every: int = 100, fsync_interval: float = 5.0):
+        super().__init__()
+        self.fsync_every = max(1, int(fsync_every))
+        self.fsync_interval = fsync_interval
+        self._handles: Dict[Path, IO[str]] = {}
+        self._last_write: Dict[Path, float] = {}
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def _get_handle(self, path: Path) -> IO[str]:
+        handle = self._handles.get(path)
+        if handle is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Недописанная при падении строка обрезается, чтобы не испортить следующую запись
+            result = recover_log_file(path)
+            if result:
+                print(f"[Storage] {format_recovery(result)}")
+            handle = open(path, 'a', encoding='utf-8')
+            self._handles[path] = handle
+        return handle
+
+    def append(self, path: PathLike, entry: Dict[str, Any]) -> None:
+        self.append_many(path, [entry])
+
+    def append_many(self, path: PathLike, entries: List[Dict[str, Any]]) -> None:
+        if not entries:
+            return
+        path = Path(path)
+        data = "".join(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n" for entry in entries)
+
+        with self._lock:
+            handle = self._get_handle(path)
+            handle.write(data)
+            handle.flush()
+
+            now = time.monotonic()
+            self._last_write[path] = now
+            self._pending += len(entries)
+
+            if self._pending >= self.fsync_every or now - self._last_fsync >= self.fsync_interval:
+                self._fsync_locked()
+                self._close_idle_locked(now)
+
+    def _rewrite_locked(self, path: Path, records: List[Dict[str, Any]]) -> None:
+        # Открытый файл закрывается: после замены следующая запись откроет новый
+        handle = self._handles.pop(path, None)
+        self._last_write.pop(path, None)
+        if handle is not None:
+            handle.close()
+        atomic_write_text(path, "".join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+                                        for record in records))
+
+    def _fsync_locked(self) -> None:
+        for handle in self._handles.values():
+            try:
+                handle.flush()
+                os.fsync(handle.fileno())
+            except (OSError, ValueError) as e:
+                print(f"[Storage] Ошибка fsync: {e}")
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def _close_idle_locked(self, now: float) -> None:
+        for path in [p for p, t in self._last_write.items() if now - t >= self.IDLE_CLOSE_SECONDS]:
+            handle = self._handles.pop(path, None)
+            self._last_write.pop(path, None)
+            if handle is not None:
+                handle.close()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._fsync_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            self._fsync_locked()
+            for handle in self._handles.values():
+                handle.close()
+            self._handles.clear()
+            self._last_write.clear()
+
+
+SQLITE_BACKEND = "sqlite"
+
+STORAGE_BACKENDS = {
+    JsonArrayStorage.name: JsonArrayStorage,
+    JsonLinesStorage.name: JsonLinesStorage,
+}
+
+
+def create_storage(settings: Optional[Dict[str, Any]] = None) -> LogStorage:
+    """
+    Создание бэкенда хранения по разделу `settings` конфигурации.
+
+    Используемые ключи:
+        storage_backend: "json" (по умолчанию), "jsonl" или "sqlite"
+        fsync_every_records: количество записей между fsync
+        fsync_interval_seconds: максимальный интервал между fsync
+    """
+    settings = settings or {}
+    backend = settings.get('storage_backend', JsonArrayStorage.name)
+
+    if backend == SQLITE_BACKEND:
+        from sqlite_storage import SqliteStorage
+        return SqliteStorage.from_settings(settings)
+
+    fsync_every = settings.get('fsync_every_records', 100)
+    fsync_interval = settings.get('fsync_interval_seconds', 5.0)
+
+    if backend == JsonLinesStorage.name:
+        return JsonLinesStorage(fsync_every=fsync_every, fsync_interval=fsync_interval)
+    if backend == JsonArrayStorage.name:
+        return JsonArrayStorage(fsync_every=fsync_every, fsync_interval=fsync_interval)
+
+    raise ValueError(f"Неизвестный бэкенд хранения: {backend} "
+                     f"(доступны: {', '.join([*STORAGE_BACKENDS, SQLITE_BACKEND])})")
+
+
+def _backup_path(path: Path) -> Path:
+    """Свободное имя для копии поврежденного файла: `{name}.corrupt`, `{name}.corrupt.1`, ..."""
+    backup = path.with_name(path.name + CORRUPT_SUFFIX)
+    index = 1
+    while backup.exists():
+        backup = path.with_name(f"{path.name}{CORRUPT_SUFFIX}.{index}")
+        index += 1
+    return backup
+
+
+def _recover_jsonl(path: Path) -> Optional[Dict[str, Any]]:
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return None
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return None
+
+        # Ищем начало последней строки, читая файл с конца блоками
+        block = 65536
+        end = size
+        line_start = 0
+        while end > 0:
+            start = max(0, end - block)
+            f.seek(start)
+            chunk = f.read(end - start)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                line_start = start + newline + 1
+                break
+            end = start
+
+        f.seek(line_start)
+        tail = f.read()
+        try:
+            json.loads(tail.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            f.truncate(line_start)
+            return {'path': str(path), 'action': 'truncated', 'records': None, 'dropped_bytes': len(tail)}
+        # Последняя запись целая, не хватает только перевода строки
+        f.write(b"\n")
+        return {'path': str(path), 'action': 'terminated', 'records': None, 'dropped_bytes': 0}
+
+
+def _recover_json(path: Path) -> Optional[Dict[str, Any]]:
+    with open(path, 'rb') as f:
+        raw = f.read()
+    stripped = raw.strip()
+    if not stripped or (stripped.startswith(b"[") and stripped.endswith(b"]")):
+        # Пустой файл читается как пустой массив; целый массив не разбирается, чтобы не тратить время
+        return None
+
+    content = raw.decode('utf-8', errors='replace')
+    records, lost = salvage_json_array(content)
+    backup = _backup_path(path)
+    os.replace(path, backup)
+    atomic_write_text(path, json.dumps(records, indent=2, ensure_ascii=False))
+    return {'path': str(path), 'action': 'salvaged', 'records': len(records), 'dropped_bytes': lost,
+            'backup': str(backup)}
+
+
+def recover_log_file(path: PathLike) -> Optional[Dict[str, Any]]:
+    """
+    Восстановление одного файла лога после падения процесса.
+
+    - `.jsonl`: недописанная последняя строка обрезается (или дописывается
+      перевод строки, если запись целая)
+    - `.json`: из оборванного массива извлекаются целые записи, файл
+      перезаписывается, оригинал сохраняется как `{name}.corrupt`
+
+    Returns:
+        dict с описанием исправления (path, action, records, dropped_bytes)
+        или None, если файл цел
+    """
+    path = Path(path)
+    try:
+        if path.suffix == JsonLinesStorage.extension:
+            return _recover_jsonl(path)
+        return _recover_json(path)
+    except FileNotFoundError:
+        return None
+
+
+def recover_logs(output_dir: PathLike) -> List[Dict[str, Any]]:
+    """
+    Проход восстановления по директории логов (выполняется при старте сервиса).
+
+    Брошенные временные файлы атомарной записи удаляются: прежняя версия
+    файла при этом цела, а временный файл недописан. Поддиректории (например
+    `events/`) проверяются так же.
+
+    Returns:
+        список исправлений (пустой, если все файлы целы)
+    """
+    output_dir = Path(output_dir)
+    if not output_dir.is_dir():
+        return []
+
+    results: List[Dict[str, Any]] = []
+    for tmp in sorted(output_dir.rglob(f"*.json*{TMP_SUFFIX}")):
+        try:
+            size = tmp.stat().st_size
+            tmp.unlink()
+        except OSError:
+            continue
+        results.append({'path': str(tmp), 'action': 'removed', 'records': None, 'dropped_bytes': size})
+
+    for path in sorted(output_dir.rglob("*.json*")):
+        if parse_log_filename(path) is None:
+            continue
+        try:
+            result = recover_log_file(path)
+        except OSError as e:
+            print(f"[Storage] Не удалось проверить {path}: {e}")
+            continue
+        if result:
+            results.append(result)
+    return results
+
+
+RECOVERY_ACTIONS = {
+    'truncated': "обрезана недописанная строка",
+    'terminated': "дописан перевод строки",
+    'salvaged': "восстановлен оборванный массив",
+    'removed': "удален недописанный временный файл",
+}
+
+
+def format_recovery(result: Dict[str, Any]) -> str:
+    """Описание исправления для вывода в консоль"""
+    text = f"{Path(result['path']).name}: {RECOVERY_ACTIONS.get(result['action'], result['action'])}"
+    if result.get('records') is not None:
+        text += f", записей: {result['records']}"
+    if result.get('dropped_bytes'):
+        text += f", отброшено байт: {result['dropped_bytes']}"
+    return text
+
+
+def iter_log_records(path: PathLike) -> Iterator[Dict[str, Any]]:
+    """
+    Построчное чтение записей из файла лога любого формата.
+
+    Для JSON Lines недописанная последняя строка (обрыв при падении) пропускается.
+    """
+    path = Path(path)
+    if path.suffix == JsonLinesStorage.extension:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        if content:
+            yield from json.loads(content)
+
+
+def read_log(path: PathLike) -> List[Dict[str, Any]]:
+    """Чтение файла лога любого формата в виде массива (legacy-формат для потребителей)"""
+    return list(iter_log_records(path))
+
+
+def convert_to_jsonl(path: PathLike, remove_source: bool = False) -> Path:
+    """
+    Конвертация файла с JSON массивом в JSON Lines рядом с исходным.
+
+    Если `.jsonl` уже существует (например, день начат в массиве и продолжен
+    после смены бэкенда), записи массива объединяются с ним без повторов по
+    timestamp, а не перезаписывают его.
+    """
+    path = Path(path)
+    target = path.with_suffix(JsonLinesStorage.extension)
+
+    if target.exists():
+        storage = JsonLinesStorage()
+        try:
+            added = storage.merge(target, list(iter_log_records(path)))
+        finally:
+            storage.close()
+        if remove_source:
+            path.unlink()
+        print(f"[Storage] {path} -> {target} (объединено, добавлено {added} записей)")
+        return target
+
+    tmp = target.with_suffix(target.suffix + ".tmp")
+
+    count = 0
+    with open(tmp, 'w', encoding='utf-8') as out:
+        for record in iter_log_records(path):
+            out.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            count += 1
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp, target)
+
+    if remove_source:
+        path.unlink()
+
+    print(f"[Storage] {path} -> {target} ({count} записей)")
+    return target
+
+
+def export_json_array(path: PathLike, target: Optional[PathLike] = None) -> Path:
+    """Экспорт файла JSON Lines в legacy JSON массив (для существующих потребителей)"""
+    path = Path(path)
+    target = Path(target) if target else path.with_suffix(JsonArrayStorage.extension)
+
+    logs = read_log(path)
+    atomic_write_text(target, json.dumps(logs, indent=2, ensure_ascii=False))
+
+    print(f"[Storage] {path} -> {target} ({len(logs)} записей)")
+    return target
+
+
+def _expand_paths(paths: List[str], pattern: str) -> List[Path]:
+    result: List[Path] = []
+    for p in paths:
+        path = Path(p)
+        if path.is_dir():
+            result.extend(sorted(path.glob(pattern)))
+        else:
+            result.append(path)
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Утилиты для файлов логов цен")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_convert = sub.add_parser('convert', help="JSON массив -> JSON Lines")
+    p_convert.add_argument('paths', nargs='+', help="Файлы или директории с логами")
+    p_convert.add_argument('--remove-source', action='store_true', help="Удалить исходные .json файлы")
+
+    p_export = sub.add_parser('export', help="JSON Lines -> JSON массив")
+    p_export.add_argument('paths', nargs='+', help="Файлы или директории с логами")
+
+    p_recover = sub.add_parser('recover', help="Восстановление файлов после падения процесса")
+    p_recover.add_argument('directory', help="Директория с логами")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'convert':
+            for path in _expand_paths(args.paths, f"*{JsonArrayStorage.extension}"):
+                convert_to_jsonl(path, remove_source=args.remove_source)
+        elif args.command == 'export':
+            for path in _expand_paths(args.paths, f"*{JsonLinesStorage.extension}"):
+                export_json_array(path)
+        elif args.command == 'recover':
+            results = recover_logs(args.directory)
+            for result in results:
+                print(f"[Storage] {format_recovery(result)}")
+            print(f"[Storage] Исправлено файлов: {len(results)}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Потоковое получение цен через WebSocket канал market CLOB API.
+
+Вместо опроса /price каждые poll_interval_seconds подписываемся на token_id
+всех мониторов и поддерживаем лучшие bid/ask в памяти по событиям book и
+price_change. Запись в лог - при изменении цены, по heartbeat или в обоих случаях.
+
+При обрыве соединения, пока идет переподключение, цены запрашиваются через REST
+(ServiceManager.fetch_prices_once); после переподключения книги заявок
+пересинхронизируются по новым снимкам book.
+
+Требует websockets (pip install websockets).
+"""
+import json
+import random
+import time
+from typing import Dict, Any, Optional, List, Callable, Iterable
+
+try:
+    from websockets.sync.client import connect as ws_connect
+    from websockets.exceptions import ConnectionClosed
+except ImportError:  # pragma: no cover - опциональная зависимость
+    ws_connect = None
+    ConnectionClosed = Exception
+
+CLOB_WS_MARKET_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
+
+# Режимы записи
+LOG_ON_CHANGE = "change"
+LOG_ON_HEARTBEAT = "heartbeat"
+LOG_BOTH = "both"
+
+
+class OrderBookState:
+    """Книга заявок одного токена: цена -> объем для каждой стороны"""
+
+    def __init__(self):
+        self.bids: Dict[float, float] = {}
+        self.asks: Dict[float, float] = {}
+
+    def apply_snapshot(self, bids: Iterable[Dict[str, Any]], asks: Iterable[Dict[str, Any]]) -> None:
+        self.bids = {float(level['price']): float(level['size']) for level in bids if float(level['size']) > 0}
+        self.asks = {float(level['price']): float(level['size']) for level in asks if float(level['size']) > 0}
+
+    def apply_change(self, side: str, price: float, size: float) -> None:
+        levels = self.bids if side.upper() == "BUY" else self.asks
+        if size > 0:
+            levels[price] = size
+        else:
+            levels.pop(price, None)
+
+    def best_bid(self) -> Optional[float]:
+        return max(self.bids) if self.bids else None
+
+    def best_ask(self) -> Optional[float]:
+        return min(self.asks) if self.asks else None
+
+    def top_of_book(self) -> Dict[str, Optional[float]]:
+        bid = self.best_bid()
+        ask = self.best_ask()
+        mid = (bid + ask) / 2 if bid is not None and ask is not None else None
+        return {'bid': bid, 'ask': ask, 'mid': mid}
+
+
+class MarketStream:
+    """
+    Подписка на канал market и раздача цен мониторам.
+
+    Args:
+        get_monitors: Функция, возвращающая текущие мониторы (с token_id) - вызывается
+            на каждой итерации, поэтому изменения конфигурации приводят к переподписке
+        rest_fallback: Функция однократного REST опроса всех мониторов (на время обрыва)
+        url: Адрес WebSocket канала market
+        log_mode: "change", "heartbeat" или "both"
+        heartbeat_seconds: Интервал heartbeat записей
+        fallback_interval: Интервал REST опроса во время обрыва соединения
+    """
+
+    PING_INTERVAL = 10
+    RESUBSCRIBE_CHECK_INTERVAL = 1.0
+
+    def __init__(self,
+                 get_monitors: Callable[[], List[Any]],
+                 rest_fallback: Callable[[], Any],
+                 url: str = CLOB_WS_MARKET_URL,
+                 log_mode: str = LOG_BOTH,
+                 heartbeat_seconds: float = 60,
+                 fallback_interval: float = 60,
+                 reconnect_max_delay: float = 30):
+        if ws_connect is None:
+            raise RuntimeError("Для потокового режима требуется websockets: pip install websockets")
+        if log_mode not in (LOG_ON_CHANGE, LOG_ON_HEARTBEAT, LOG_BOTH):
+            raise ValueError(f"Неизвестный режим записи: {log_mode}")
+
+        self.get_monitors = get_monitors
+        self.rest_fallback = rest_fallback
+        self.url = url
+        self.log_mode = log_mode
+        self.heartbeat_seconds = heartbeat_seconds
+        self.fallback_interval = fallback_interval
+        self.reconnect_max_delay = reconnect_max_delay
+
+        self.books: Dict[str, OrderBookState] = {}
+        self.last_logged: Dict[str, Dict[str, Optional[float]]] = {}
+        self.should_stop = False
+        self.connected = False
+        self.events_received = 0
+
+    def stop(self):
+        self.should_stop = True
+
+    def _monitors_by_token(self) -> Dict[str, Any]:
+        return {m.token_id: m for m in self.get_monitors() if m.token_id and not m.should_stop}
+
+    def _emit(self, monitor: Any, price_data: Dict[str, Optional[float]]) -> None:
+        try:
+            monitor.handle_price(price_data)
+            monitor.last_fetch_time = time.time()
+            self.last_logged[monitor.token_id] = price_data
+        except Exception as e:
+            print(f"[{monitor.name}] Ошибка обработки цен: {e}")
+
+    def handle_message(self, raw: str, monitors: Dict[str, Any]) -> None:
+        """Разбор сообщения канала market и обновление книг заявок"""
+        if raw in ("PONG", ""):
+            return
+
+        try:
+            payload = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+
+        events = payload if isinstance(payload, list) else [payload]
+        touched = set()
+
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            event_type = event.get('event_type')
+
+            if event_type == 'book':
+                asset_id = event.get('asset_id')
+                book = self.books.setdefault(asset_id, OrderBookState())
+                book.apply_snapshot(event.get('bids') or event.get('buys') or [],
+                                    event.get('asks') or event.get('sells') or [])
+                touched.add(asset_id)
+
+            elif event_type == 'price_change':
+                # Новый формат: price_changes с asset_id в каждом изменении;
+                # старый формат: asset_id события + changes
+                changes = event.get('price_changes')
+                if changes is None:
+                    changes = [dict(c, asset_id=event.get('asset_id')) for c in event.get('changes', [])]
+                for change in changes:
+                    asset_id = change.get('asset_id')
+                    book = self.books.get(asset_id)
+                    if book is None:
+                        # Изменение до снимка book этой сессии
+                        continue
+                    book.apply_change(change.get('side', ''), float(change['price']), float(change['size']))
+                    touched.add(asset_id)
+
+            else:
+                continue
+
+            self.events_received += 1
+
+        if self.log_mode == LOG_ON_HEARTBEAT:
+            return
+
+        for asset_id in touched:
+            monitor = monitors.get(asset_id)
+            if monitor is None:
+                continue
+            price_data = self.books[asset_id].top_of_book()
+            if price_data != self.last_logged.get(asset_id):
+                self._emit(monitor, price_data)
+
+    def heartbeat(self, monitors: Dict[str, Any]) -> None:
+        """Периодическая запись текущих цен всех рынков, даже без изменений"""
+        for token_id, monitor in monitors.items():
+            book = self.books.get(token_id)
+            if book is not None:
+                self._emit(monitor, book.top_of_book())
+
+    def _wait_with_fallback(self, delay: float, last_fallback: float) -> float:
+        """Ожидание переподключения с REST опросом вместо потока"""
+        deadline = time.monotonic() + delay
+        while not self.should_stop and time.monotonic() < deadline:
+            if time.monotonic() - last_fallback >= self.fallback_interval:
+                try:
+                    self.rest_fallback()
+                except Exception as e:
+                    print(f"[Stream] Ошибка REST опроса: {e}")
+                last_fallback = time.monotonic()
+            time.sleep(max(0.0, min(1.0, deadline - time.monotonic())))
+        return last_fallback
+
+    def run_session(self, monitors: Dict[str, Any]) -> None:
+        """Одно соединение: подписка и обработка событий до обрыва или смены набора токенов"""
+        token_ids = sorted(monitors)
+
+        with ws_connect(self.url, open_timeout=10, close_timeout=2) as ws:
+            ws.send(json.dumps({"assets_ids": token_ids, "type": "market"}))
+            self.connected = True
+            print(f"[Stream] Подписка на {len(token_ids)} токенов")
+
+            # Книги заявок пересинхронизируются по новым снимкам: до снимка book
+            # изменения и heartbeat к уровням, устаревшим за время обрыва, не применяются
+            self.books = {}
+
+            last_ping = time.monotonic()
+            last_heartbeat = time.monotonic()
+            last_check = time.monotonic()
+
+            while not self.should_stop:
+                try:
+                    raw = ws.recv(timeout=self.RESUBSCRIBE_CHECK_INTERVAL)
+                except TimeoutError:
+                    raw = None
+
+                if raw is not None:
+                    self.handle_message(raw if isinstance(raw, str) else raw.decode('utf-8'), monitors)
+
+                now = time.monotonic()
+                if now - last_ping >= self.PING_INTERVAL:
+                    ws.send("PING")
+                    last_ping = now
+
+                if self.log_mode != LOG_ON_CHANGE and now - last_heartbeat >= self.heartbeat_seconds:
+                    self.heartbeat(monitors)
+                    last_heartbeat = now
+
+                if now - last_check >= self.RESUBSCRIBE_CHECK_INTERVAL:
+                    last_check = now
+                    current = self._monitors_by_token()
+                    if set(current) != set(monitors):
+                        print(f"[Stream] Набор рынков изменился, переподписка")
+                        return
+
+    def run(self):
+        """Основной цикл: подключение, переподключение с экспоненциальной задержкой и REST fallback"""
+        print(f"[Stream] Запущен ({self.url}, запись: {self.log_mode})")
+
+        attempt = 0
+        last_fallback = 0.0
+
+        while not self.should_stop:
+            monitors = self._monitors_by_token()
+            if not monitors:
+                time.sleep(1)
+                continue
+
+            try:
+                self.run_session(monitors)
+                attempt = 0
+                continue
+            except (OSError, ConnectionClosed, TimeoutError) as e:
+                print(f"[Stream] Соединение потеряно: {e}")
+            except Exception as e:
+                print(f"[Stream] Ошибка: {e}")
+            finally:
+                self.connected = False
+
+            delay = min(self.reconnect_max_delay, 2 ** attempt) * random.uniform(0.5, 1.0)
+            attempt += 1
+            print(f"[Stream] Переподключение через {delay:.1f}с (REST опрос до восстановления)")
+            last_fallback = self._wait_with_fallback(delay, last_fallback)
+
+        print(f"[Stream] Остановлен (событий: {self.events_received})")
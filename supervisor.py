@@ -0,0 +1,451 @@
+"""
+Многопроцессный режим: рынки распределяются между N процессами-воркерами.
+
+Супервизор читает config.json и распределяет рынки по воркерам
+согласованным хешированием (consistent hashing) slug. Каждый воркер - обычный
+ServiceManager со своим файлом конфигурации `.shards/{config}.worker-{i}.json`,
+в котором только его рынки, поэтому файлы логов рынка пишет ровно один процесс.
+Файл кэша рынков и порт метрик у каждого воркера свои.
+
+При изменении config.json переписываются только файлы воркеров, чей набор
+рынков изменился. При смене количества воркеров (`worker_processes`) переезжает
+лишь часть рынков; переезд двухфазный: рынок сначала удаляется у прежнего
+воркера и добавляется новому только после того, как прежний успел его
+остановить, - два процесса не пишут один файл одновременно. События (`events`)
+распределяются и переезжают так же, по ключу `event:{slug}`.
+
+Упавший воркер перезапускается (с растущей задержкой, если падает сразу).
+Воркеры запускаются в своей сессии, поэтому SIGTERM супервизору (docker stop,
+systemd, kill) до них не доходит: супервизор сам останавливает каждого воркера.
+
+Запуск:
+    python price_monitor_service.py --workers 4
+    python supervisor.py --config config.json --workers 4 --engine asyncio
+"""
+import os
+import sys
+import json
+import time
+import signal
+import hashlib
+import argparse
+import threading
+import subprocess
+from bisect import bisect
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Set, Tuple
+
+from api_client import configure_client
+from discovery import MarketDiscovery, merge_markets
+from config_watcher import ConfigWatcher
+from storage import atomic_write_text, recover_logs, format_recovery
+from startup import WARM_STATE_NAME
+
+SHARDS_DIR = ".shards"
+
+# Параметры самого супервизора (не передаются воркерам, их изменение не трогает файлы воркеров)
+SUPERVISOR_SETTINGS = frozenset({'worker_processes', 'shard_reload_interval_seconds'})
+SERVICE_SCRIPT = Path(__file__).resolve().parent / "price_monitor_service.py"
+
+VIRTUAL_NODES = 64
+
+# Ключ события в кольце и в наборах воркеров (рынки - по slug)
+EVENT_KEY_PREFIX = "event:"
+
+# Перезапуск упавшего воркера
+RESTART_DELAY_MIN = 1.0
+RESTART_DELAY_MAX = 60.0
+STABLE_UPTIME = 30.0
+
+# Время на остановку монитора в воркере (ServiceManager.update_monitors, join)
+MONITOR_STOP_TIMEOUT = 5.0
+
+
+def event_key(slug: str) -> str:
+    return f"{EVENT_KEY_PREFIX}{slug}"
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Кольцо согласованного хеширования.
+
+    При добавлении воркера к нему переходит примерно 1/N рынков, остальные
+    остаются на своих местах.
+    """
+
+    def __init__(self, shards: int, virtual_nodes: int = VIRTUAL_NODES):
+        self.shards = max(1, int(shards))
+        points = sorted((_hash(f"worker-{shard}#{v}"), shard)
+                        for shard in range(self.shards) for v in range(virtual_nodes))
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, slug: str) -> int:
+        index = bisect(self._keys, _hash(slug)) % len(self._keys)
+        return self._shards[index]
+
+
+class Worker:
+    """Процесс-воркер и его текущий набор рынков (и ключей событий)"""
+
+    def __init__(self, index: int, config_file: Path):
+        self.index = index
+        self.config_file = config_file
+        self.slugs: Set[str] = set()
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.restart_delay = RESTART_DELAY_MIN
+        self.restart_at: Optional[float] = None
+        self.restarts = 0
+        self.shard_text: Optional[str] = None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def market_count(self) -> int:
+        return sum(1 for key in self.slugs if not key.startswith(EVENT_KEY_PREFIX))
+
+
+class Supervisor:
+    """
+    Args:
+        config_file: Основной файл конфигурации
+        workers: Количество воркеров (None - settings.worker_processes или число ядер)
+        engine: Движок воркеров: threads или asyncio
+    """
+
+    def __init__(self, config_file: str = "config.json", workers: Optional[int] = None, engine: str = "threads"):
+        self.config_file = Path(config_file)
+        self.shards_dir = self.config_file.resolve().parent / SHARDS_DIR
+        self.workers_override = workers
+        self.engine = engine
+
+        self.config: Dict[str, Any] = {}
+        self.last_config_mtime = 0.0
+        self.watcher: Optional[ConfigWatcher] = None
+        self.workers: Dict[int, Worker] = {}
+        self.ring: Optional[HashRing] = None
+        self.owner: Dict[str, int] = {}
+        # Отложенное добавление переезжающих рынков и событий: ключ -> (воркер, время)
+        self.pending: Dict[str, Tuple[int, float]] = {}
+        # Поиск рынков выполняет супервизор, воркеры получают готовые списки
+        self.discovery: Optional[MarketDiscovery] = None
+        self.discovered: Dict[str, Dict[str, Any]] = {}
+        self.last_discovery = 0.0
+        self.should_stop = False
+
+    # Конфигурация
+
+    def load_config(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[Supervisor] Ошибка загрузки конфигурации: {e}")
+            return None
+
+    def get_config_mtime(self) -> float:
+        try:
+            return self.config_file.stat().st_mtime
+        except OSError:
+            return 0.0
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        return self.config.get('settings', {})
+
+    def worker_count(self) -> int:
+        if self.workers_override:
+            return max(1, self.workers_override)
+        return max(1, int(self.settings.get('worker_processes') or os.cpu_count() or 1))
+
+    def reload_interval(self) -> float:
+        """Интервал перечитывания файлов конфигурации воркерами"""
+        return self.settings.get('shard_reload_interval_seconds', 2)
+
+    def handoff_delay(self) -> float:
+        """Сколько ждать, прежде чем отдать рынок новому воркеру"""
+        return 2 * self.reload_interval() + MONITOR_STOP_TIMEOUT
+
+    def shard_settings(self, index: int) -> Dict[str, Any]:
+        """Раздел settings для воркера: свои файлы кэша и снимка состояния, порт метрик"""
+        settings = {k: v for k, v in self.settings.items() if k not in SUPERVISOR_SETTINGS}
+        settings['config_reload_interval_seconds'] = self.reload_interval()
+        settings['discovery_enabled'] = False
+        # Восстановление файлов выполняет супервизор до запуска воркеров:
+        # перезапущенный воркер не должен обрезать файлы, в которые пишут остальные
+        settings['storage_recovery'] = False
+        if settings.get('market_cache_file'):
+            cache_file = Path(settings['market_cache_file'])
+            settings['market_cache_file'] = str(cache_file.with_name(f"{cache_file.stem}.worker-{index}{cache_file.suffix}"))
+        # Снимок состояния у каждого воркера свой (рынки воркеров не пересекаются)
+        warm_state = Path(settings.get('warm_state_file') or Path(settings.get('output_directory', 'logs')) / WARM_STATE_NAME)
+        settings['warm_state_file'] = str(warm_state.with_name(f"{warm_state.stem}.worker-{index}{warm_state.suffix}"))
+        if settings.get('metrics_enabled'):
+            settings['metrics_port'] = settings.get('metrics_port', 9108) + index
+        return settings
+
+    def write_shard(self, worker: Worker) -> bool:
+        """Атомарная запись файла конфигурации воркера (только если содержимое изменилось)"""
+        markets = merge_markets(self.config, self.discovered)
+        shard = {
+            'markets': [markets[slug] for slug in sorted(worker.slugs) if slug in markets],
+            'settings': self.shard_settings(worker.index),
+        }
+        events = [e for e in self.config.get('events', []) if event_key(e['slug']) in worker.slugs]
+        if events:
+            shard['events'] = events
+        text = json.dumps(shard, ensure_ascii=False, indent=2)
+        if text == worker.shard_text and worker.config_file.exists():
+            return False
+
+        atomic_write_text(worker.config_file, text, fsync=False)
+        worker.shard_text = text
+        return True
+
+    # Распределение рынков
+
+    def rebalance(self) -> None:
+        """Пересчет распределения рынков и запись изменившихся файлов воркеров"""
+        count = self.worker_count()
+        self.ring = HashRing(count)
+        now = time.monotonic()
+
+        for index in range(count):
+            if index not in self.workers:
+                self.workers[index] = Worker(index, self.shards_dir / f"{self.config_file.stem}.worker-{index}.json")
+
+        # Лишние воркеры останавливаются (с записью накопленных данных) до передачи их рынков
+        for index in [i for i in self.workers if i >= count]:
+            worker = self.workers.pop(index)
+            print(f"[Supervisor] Воркер {index} больше не нужен, остановка")
+            self.stop_worker(worker)
+            worker.config_file.unlink(missing_ok=True)
+            for slug in worker.slugs:
+                self.owner.pop(slug, None)
+
+        markets = merge_markets(self.config, self.discovered)
+        desired = {slug: self.ring.shard_for(slug) for slug in markets}
+        # События распределяются по тому же кольцу и переезжают в две фазы, как рынки
+        for event in self.config.get('events', []):
+            key = event_key(event['slug'])
+            desired[key] = self.ring.shard_for(key)
+
+        # Фаза 1: рынки, которых больше нет или которые переезжают, удаляются сразу
+        for slug, index in list(self.owner.items()):
+            if desired.get(slug) != index:
+                # Рынок удаляется у прежнего воркера сразу, новому передается через handoff_delay
+                self.workers[index].slugs.discard(slug)
+                del self.owner[slug]
+                if slug in desired:
+                    self.pending[slug] = (desired[slug], now + self.handoff_delay())
+
+        for slug in [s for s, (index, _) in self.pending.items() if desired.get(s) != index]:
+            del self.pending[slug]
+
+        # Новые рынки (не принадлежавшие ни одному воркеру) назначаются сразу
+        for slug, index in desired.items():
+            if slug not in self.owner and slug not in self.pending:
+                self.assign(slug, index)
+
+        # Файл воркера переписывается, если изменились его рынки или раздел settings
+        changed = [worker.index for worker in self.workers.values() if self.write_shard(worker)]
+
+        print(f"[Supervisor] Воркеров: {count}, рынков: {len(markets)}, событий: {len(desired) - len(markets)}, "
+              f"изменено воркеров: {len(changed)}, переезжает рынков и событий: {len(self.pending)}")
+
+    def assign(self, slug: str, index: int) -> None:
+        self.workers[index].slugs.add(slug)
+        self.owner[slug] = index
+
+    def apply_pending(self) -> None:
+        """Фаза 2: передача переезжающих рынков новым воркерам"""
+        now = time.monotonic()
+        ready = [slug for slug, (_, due) in self.pending.items() if due <= now]
+        changed: Set[int] = set()
+        for slug in ready:
+            index, _ = self.pending.pop(slug)
+            self.assign(slug, index)
+            changed.add(index)
+        for index in changed:
+            self.write_shard(self.workers[index])
+        if ready:
+            print(f"[Supervisor] Передано рынков: {len(ready)}")
+
+    # Процессы
+
+    def start_worker(self, worker: Worker) -> None:
+        command = [sys.executable, str(SERVICE_SCRIPT), '--config', str(worker.config_file), '--engine', self.engine]
+        # Своя сессия: Ctrl+C в терминале получает только супервизор и передает воркерам
+        # один SIGINT в stop_worker (второй прервал бы запись накопленных данных при остановке)
+        worker.process = subprocess.Popen(command, start_new_session=(os.name == 'posix'))
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        print(f"[Supervisor] Воркер {worker.index} запущен (pid {worker.process.pid}, рынков: {worker.market_count()})")
+
+    def stop_worker(self, worker: Worker, timeout: float = 30) -> None:
+        """Корректная остановка (SIGINT -> KeyboardInterrupt в воркере), затем принудительная"""
+        process = worker.process
+        if process is None:
+            return
+        if process.poll() is None:
+            try:
+                if os.name == 'posix':
+                    process.send_signal(signal.SIGINT)
+                else:
+                    process.terminate()
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                print(f"[Supervisor] Воркер {worker.index} не остановился, завершение")
+                process.kill()
+                process.wait()
+            except OSError:
+                pass
+        worker.process = None
+
+    def check_workers(self) -> None:
+        """Запуск новых и перезапуск упавших воркеров"""
+        now = time.monotonic()
+
+        for worker in self.workers.values():
+            if worker.is_alive():
+                continue
+
+            if worker.process is not None:
+                code = worker.process.returncode
+                uptime = now - worker.started_at
+                worker.process = None
+                worker.restarts += 1
+                if uptime >= STABLE_UPTIME:
+                    worker.restart_delay = RESTART_DELAY_MIN
+                worker.restart_at = now + worker.restart_delay
+                print(f"[Supervisor] Воркер {worker.index} завершился (код {code}), "
+                      f"перезапуск через {worker.restart_delay:.0f}с")
+                worker.restart_delay = min(RESTART_DELAY_MAX, worker.restart_delay * 2)
+            elif worker.restart_at is None or worker.restart_at <= now:
+                self.start_worker(worker)
+
+    def check_config(self) -> None:
+        if not self.watcher.wait(0):
+            return
+
+        config = self.load_config()
+        if config:
+            print(f"[Supervisor] Обнаружены изменения в конфигурации")
+            self.config = config
+            self.last_config_mtime = self.get_config_mtime()
+            self.watcher.poll_interval = self.settings.get('config_reload_interval_seconds', 30)
+            self.rebalance()
+
+    def check_discovery(self, force: bool = False) -> None:
+        """Периодический поиск рынков; при изменении набора - перераспределение"""
+        if not self.settings.get('discovery_enabled', False):
+            self.discovery = None
+            return
+
+        now = time.monotonic()
+        if not force and now - self.last_discovery < self.settings.get('discovery_interval_seconds', 300):
+            return
+        self.last_discovery = now
+
+        if self.discovery is None:
+            configure_client(self.settings)
+        self.discovery = MarketDiscovery.from_settings(self.settings)
+        found = self.discovery.discover()
+        if found is None:
+            print("[Supervisor] Не удалось получить список рынков, набор рынков не изменен")
+            return
+
+        if found.keys() != self.discovered.keys():
+            print(f"[Supervisor] Найдено рынков: {len(found)}")
+            self.discovered = found
+            if not force:
+                self.rebalance()
+
+    def status(self) -> Dict[int, Dict[str, Any]]:
+        return {index: {'pid': w.process.pid if w.process else None, 'markets': w.market_count(),
+                        'restarts': w.restarts}
+                for index, w in self.workers.items()}
+
+    def install_signal_handlers(self) -> None:
+        """SIGTERM завершает цикл супервизора, после чего воркеры останавливаются в shutdown()"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        def on_sigterm(signum, frame):
+            print("\n\n[Supervisor] Получен SIGTERM, остановка...")
+            self.stop()
+
+        signal.signal(signal.SIGTERM, on_sigterm)
+
+    def run(self) -> None:
+        self.install_signal_handlers()
+        config = self.load_config()
+        if not config:
+            print("Ошибка: не удалось загрузить конфигурацию")
+            return
+        self.config = config
+        self.last_config_mtime = self.get_config_mtime()
+        self.watcher = ConfigWatcher.from_settings(str(self.config_file), self.settings)
+        self.shards_dir.mkdir(parents=True, exist_ok=True)
+        self.check_discovery(force=True)
+
+        if self.settings.get('storage_recovery', True):
+            for result in recover_logs(self.settings.get('output_directory', 'logs')):
+                print(f"[Supervisor] {format_recovery(result)}")
+
+        print("=" * 60)
+        print("Polymarket Price Monitor Service - Supervisor")
+        print("=" * 60)
+
+        self.rebalance()
+        for worker in self.workers.values():
+            self.start_worker(worker)
+
+        print(f"Воркеров: {len(self.workers)} (движок {self.engine}), файлы воркеров: {self.shards_dir}")
+        print("Для остановки нажмите Ctrl+C")
+        print("=" * 60)
+
+        try:
+            while not self.should_stop:
+                self.check_config()
+                self.check_discovery()
+                self.apply_pending()
+                self.check_workers()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\n\n[Supervisor] Остановка...")
+
+        self.shutdown()
+
+    def stop(self) -> None:
+        self.should_stop = True
+
+    def shutdown(self) -> None:
+        """Остановка всех воркеров"""
+        self.should_stop = True
+        for worker in self.workers.values():
+            self.stop_worker(worker)
+        if self.watcher:
+            self.watcher.close()
+        print(f"[Supervisor] Воркеры остановлены: {self.status()}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Многопроцессный режим Polymarket Price Monitor")
+    parser.add_argument('--config', default="config.json", help="Путь к файлу конфигурации")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Количество воркеров (по умолчанию settings.worker_processes или число ядер)")
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads', help="Движок воркеров")
+    args = parser.parse_args(argv)
+
+    Supervisor(args.config, args.workers, args.engine).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
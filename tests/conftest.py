@@ -0,0 +1,98 @@
+"""
+Общие фикстуры тестов: локальный HTTP стаб API Polymarket.
+
+Запуск из корня репозитория:
+    python -m pytest -q
+"""
+import sys
+import json
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Dict, Any, Callable, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import api_client  # noqa: E402
+
+# Обработчик маршрута: (query, body) -> (status, json)
+Route = Callable[[Dict[str, Any], Any], Tuple[int, Any]]
+
+
+class StubAPI:
+    """Стаб Gamma и CLOB API на ThreadingHTTPServer со счетчиком запросов по (метод, путь)"""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.routes: Dict[Tuple[str, str], Route] = {}
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def handle_request(self, method: str):
+                parsed = urlparse(self.path)
+                query = parse_qs(parsed.query)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                with stub._lock:
+                    stub.calls[(method, parsed.path)] += 1
+                route = stub.routes.get((method, parsed.path))
+                status, payload = route(query, body) if route else (404, {'error': 'not found'})
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.handle_request('GET')
+
+            def do_POST(self):
+                self.handle_request('POST')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def route(self, method: str, path: str, handler: Route) -> None:
+        self.routes[(method, path)] = handler
+
+    def count(self, method: str, path: str) -> int:
+        with self._lock:
+            return self.calls[(method, path)]
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+
+@pytest.fixture
+def stub_api():
+    """Запущенный стаб; общий клиент api_client направлен на него"""
+    stub = StubAPI()
+    stub.thread.start()
+    api_client.configure_client({
+        'gamma_api_base': stub.url,
+        'clob_api_base': stub.url,
+        'http_max_retries': 0,
+        'gamma_rate_limit_per_second': 0,
+        'clob_rate_limit_per_second': 0,
+    })
+    try:
+        yield stub
+    finally:
+        stub.server.shutdown()
+        stub.server.server_close()
+        api_client.configure_client()
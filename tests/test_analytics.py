@@ -0,0 +1,121 @@
+"""Периоды, агрегация и инкрементальная обработка баров аналитики"""
+import json
+
+import pytest
+
+from analytics import parse_period, main, process_slug, records_to_arrays, resample
+from storage import iter_log_files
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize("period, seconds", [("30s", 30), ("1m", 60), ("5min", 300), ("1h", 3600), ("24h", 86400)])
+def test_period_dividing_a_day(period, seconds):
+    assert parse_period(period) == seconds
+
+
+@pytest.mark.parametrize("period", ["7m", "0s", "5h", "48h"])
+def test_period_straddling_midnight_is_rejected(period):
+    with pytest.raises(ValueError):
+        parse_period(period)
+
+
+def test_cli_rejects_period_before_processing(tmp_path):
+    assert main(['bars', str(tmp_path), '--out', str(tmp_path / "bars"), '--periods', "1m,7m"]) == 1
+    assert not (tmp_path / "bars").exists()
+
+
+def arrays(rows):
+    """(секунды от полуночи 2026-01-18, bid, ask, mid) -> массивы records_to_arrays"""
+    return records_to_arrays({'timestamp': str(np.datetime64("2026-01-18T00:00:00") + np.timedelta64(s, 's')),
+                              'bid': bid, 'ask': ask, 'mid': mid} for s, bid, ask, mid in rows)
+
+
+def test_resample_ohlc_and_bucket_boundaries():
+    bars = resample(arrays([
+        (0, 0.40, 0.44, 0.42),
+        (30, 0.45, 0.47, 0.46),
+        (59, 0.39, 0.41, 0.40),
+        # Граница интервала: ровно 60 с - уже следующий бар
+        (60, 0.50, 0.52, 0.51),
+        (15, 0.37, 0.39, 0.38),
+    ]), 60)
+
+    assert list(bars['count']) == [4, 1]
+    assert bars['start'][1] - bars['start'][0] == 60_000_000
+    # Записи сортируются по времени: open - запись в 0 с, close - в 59 с
+    assert (bars['open'][0], bars['high'][0], bars['low'][0], bars['close'][0]) == (0.42, 0.46, 0.38, 0.40)
+    assert bars['open'][1] == bars['close'][1] == 0.51
+    assert bars['spread_avg'][0] == pytest.approx(0.025)
+
+
+def test_resample_handles_missing_prices_and_gaps():
+    bars = resample(arrays([
+        (0, None, None, None),
+        (10, 0.40, None, None),
+        # Между барами нет записей - пустые бары не создаются
+        (600, 0.40, 0.42, 0.41),
+        (610, None, None, None),
+    ]), 60)
+
+    assert list(bars['count']) == [2, 2]
+    assert bars['start'][1] - bars['start'][0] == 600_000_000
+    assert np.isnan([bars['open'][0], bars['high'][0], bars['low'][0], bars['close'][0], bars['spread_avg'][0]]).all()
+    assert list(bars['bid_ratio']) == [0.5, 0.5]
+    assert list(bars['ask_ratio']) == [0.0, 0.5]
+    assert bars['close'][1] == 0.41
+
+
+def write_day(logs, date_str, minutes):
+    with open(logs / f"m_{date_str}.jsonl", 'w', encoding='utf-8') as f:
+        for minute in minutes:
+            f.write(json.dumps({'timestamp': f"{date_str}T{minute // 60:02d}:{minute % 60:02d}:00",
+                                'bid': 0.4, 'ask': 0.6, 'mid': 0.5}) + "\n")
+
+
+def bar_starts(out):
+    return [json.loads(line)['start'][:19] for line in (out / "m_1h.jsonl").read_text(encoding='utf-8').splitlines()]
+
+
+def test_records_without_timestamp_are_skipped():
+    result = records_to_arrays([
+        {'timestamp': "2026-01-18T00:00:00", 'bid': 0.4, 'ask': 0.6, 'mid': 0.5},
+        {'bid': 0.1, 'ask': 0.2, 'mid': 0.15},
+        {'timestamp': "не время", 'mid': 0.3},
+        {'timestamp': None, 'mid': 0.3},
+        {'timestamp': "2026-01-18T03:00:01+03:00", 'bid': 0.41, 'ask': 0.61, 'mid': 0.51},
+    ])
+
+    assert result['ts'].tolist() == [np.datetime64("2026-01-18T00:00:00", 'us').astype(np.int64),
+                                     np.datetime64("2026-01-18T00:00:01", 'us').astype(np.int64)]
+    assert result['mid'].tolist() == [0.5, 0.51]
+
+
+def test_incremental_resume_skips_processed_days(tmp_path):
+    logs, out = tmp_path / "logs", tmp_path / "bars"
+    logs.mkdir()
+    write_day(logs, "2026-01-18", [0, 30, 90])
+    files = lambda: [(d, str(p)) for _, d, p in iter_log_files(logs)]  # noqa: E731
+
+    assert process_slug("m", files(), str(out), ["1h"]) == {'1h': 2}
+    write_day(logs, "2026-01-19", [0, 60])
+    assert process_slug("m", files(), str(out), ["1h"]) == {'1h': 2}
+    assert process_slug("m", files(), str(out), ["1h"]) == {'1h': 0}
+    assert bar_starts(out) == ["2026-01-18T00:00:00", "2026-01-18T01:00:00",
+                               "2026-01-19T00:00:00", "2026-01-19T01:00:00"]
+
+
+def test_resume_after_crash_before_checkpoint_does_not_duplicate(tmp_path):
+    logs, out = tmp_path / "logs", tmp_path / "bars"
+    logs.mkdir()
+    write_day(logs, "2026-01-18", [0, 90])
+    files = [(d, str(p)) for _, d, p in iter_log_files(logs)]
+    process_slug("m", files, str(out), ["1h"])
+
+    # Бары дописаны, позиция не сохранена; последняя строка недописана
+    (out / "m_1h.checkpoint").unlink()
+    with open(out / "m_1h.jsonl", 'a', encoding='utf-8') as f:
+        f.write('{"start": "2026-01-18T02:')
+
+    assert process_slug("m", files, str(out), ["1h"]) == {'1h': 0}
+    assert bar_starts(out) == ["2026-01-18T00:00:00", "2026-01-18T01:00:00"]
@@ -0,0 +1,85 @@
+"""Архивация дневных логов в Parquet"""
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq  # noqa: E402
+
+import archive as archive_module  # noqa: E402
+from archive import compact_logs, partition_path, read_partition_records  # noqa: E402
+
+DAY = "2026-01-18"
+
+
+def record(minute: int) -> dict:
+    return {'timestamp': f"{DAY}T12:{minute:02d}:00", 'market_slug': "m", 'market_name': "M", 'token_id': "t",
+            'bid': 0.4, 'ask': 0.6, 'mid': 0.5}
+
+
+def test_json_and_jsonl_of_one_day_are_merged(tmp_path):
+    logs, archive = tmp_path / "logs", tmp_path / "archive"
+    logs.mkdir()
+    # Утро записано в JSON массив, после смены бэкенда - в JSON Lines (одна запись повторяется)
+    (logs / f"m_{DAY}.json").write_text(json.dumps([record(0), record(1), record(2)]), encoding='utf-8')
+    (logs / f"m_{DAY}.jsonl").write_text("".join(json.dumps(record(m)) + "\n" for m in (2, 3, 4)),
+                                         encoding='utf-8')
+
+    result = compact_logs(logs, archive, delete_source=True)
+
+    target = partition_path(archive, "m", DAY)
+    assert result == {str(target): 5}
+    table = pq.read_table(target)
+    assert [ts.minute for ts in table.column('timestamp').to_pylist()] == [0, 1, 2, 3, 4]
+    assert not list(logs.iterdir())
+
+
+def test_recompaction_keeps_archived_rows(tmp_path):
+    logs, archive = tmp_path / "logs", tmp_path / "archive"
+    logs.mkdir()
+    (logs / f"m_{DAY}.jsonl").write_text("".join(json.dumps(record(m)) + "\n" for m in range(60)),
+                                         encoding='utf-8')
+    compact_logs(logs, archive, delete_source=True)
+
+    # Бэкфилл дописывает тот же день после архивации (одна запись повторяется)
+    (logs / f"m_{DAY}.jsonl").write_text("".join(json.dumps(record(m)) + "\n" for m in (59,)), encoding='utf-8')
+    (logs / f"m_{DAY}.json").write_text(json.dumps([{**record(0), 'timestamp': f"{DAY}T13:00:00"}]),
+                                        encoding='utf-8')
+    result = compact_logs(logs, archive, delete_source=True)
+
+    target = partition_path(archive, "m", DAY)
+    assert result == {str(target): 61}
+    timestamps = pq.read_table(target).column('timestamp').to_pylist()
+    assert timestamps == sorted(timestamps)
+    assert timestamps[-1].hour == 13
+
+
+def test_extra_fields_round_trip(tmp_path):
+    logs, archive = tmp_path / "logs", tmp_path / "archive"
+    logs.mkdir()
+    records = [{**record(0), 'keyframe': True},
+               {'timestamp': f"{DAY}T12:01:00", 'market_slug': "m", 'bid': 0.41, 'ask': 0.6, 'mid': 0.505},
+               {**record(2), 'backfill': True}]
+    (logs / f"m_{DAY}.jsonl").write_text("".join(json.dumps(r) + "\n" for r in records), encoding='utf-8')
+
+    compact_logs(logs, archive, delete_source=True)
+
+    assert read_partition_records(partition_path(archive, "m", DAY)) == records
+
+
+def test_failed_verification_keeps_sources(tmp_path, monkeypatch):
+    logs, archive = tmp_path / "logs", tmp_path / "archive"
+    logs.mkdir()
+    source = logs / f"m_{DAY}.jsonl"
+    source.write_text("".join(json.dumps(record(m)) + "\n" for m in range(5)), encoding='utf-8')
+
+    # Строка, потерянная при записи, подменена повтором: количество строк совпадает, набор timestamp - нет
+    records_to_table = archive_module.records_to_table
+    monkeypatch.setattr(archive_module, "records_to_table",
+                        lambda records, slug: records_to_table(records[:-1] + records[:1], slug))
+    result = compact_logs(logs, archive, delete_source=True)
+
+    assert result == {}
+    assert source.exists()
+    assert not partition_path(archive, "m", DAY).exists()
+    assert not list(partition_path(archive, "m", DAY).parent.glob("*.tmp"))
@@ -0,0 +1,44 @@
+"""Движок asyncio: запись цен не блокирует цикл событий"""
+import asyncio
+import time
+
+from async_engine import AsyncServiceManager
+from price_monitor_service import MarketMonitor
+
+
+class PricesClient:
+    async def get_current_prices(self, token_ids, batch_size=None):
+        return {token_id: {'bid': 0.4, 'ask': 0.6, 'mid': 0.5} for token_id in token_ids}
+
+
+def test_price_handling_runs_off_event_loop(tmp_path):
+    service = AsyncServiceManager(str(tmp_path / "config.json"))
+    service.client = PricesClient()
+    handled = []
+
+    def slow_handle_price(price, deadline=None):
+        # Как синхронная запись в JSON массив с fsync или ожидание места в очереди LogWriter
+        time.sleep(0.3)
+        handled.append(price)
+
+    monitor = MarketMonitor(slug="market", name="Market", output_dir=str(tmp_path))
+    monitor.token_id = "yes-token"
+    monitor.handle_price = slow_handle_price
+    service.monitors["market"] = monitor
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        assert await service.fetch_prices_once_async() == 1
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) >= 10
+    assert handled == [{'bid': 0.4, 'ask': 0.6, 'mid': 0.5}]
@@ -0,0 +1,44 @@
+"""Поиск пропусков для дозаполнения истории"""
+from datetime import datetime, timedelta
+
+from backfill import Backfiller
+from storage import JsonLinesStorage
+
+START = datetime(2026, 1, 18, 12, 0)
+
+
+def write_keyframes(storage, tmp_path, count: int, every: float) -> None:
+    path = storage.log_path(tmp_path, "quiet-market", START.date().isoformat())
+    storage.append_many(path, [
+        {'timestamp': (START + timedelta(seconds=i * every)).isoformat(), 'bid': 0.4, 'ask': 0.6, 'mid': 0.5,
+         'keyframe': True}
+        for i in range(count)
+    ])
+    storage.close()
+
+
+def test_quiet_market_in_change_mode_has_no_gaps(tmp_path):
+    storage = JsonLinesStorage()
+    # Цена не меняется: в режиме изменений пишутся только ключевые кадры раз в 300 секунд
+    write_keyframes(storage, tmp_path, 13, 300)
+    start, end = START.timestamp(), (START + timedelta(hours=1)).timestamp()
+    settings = {'output_directory': str(tmp_path), 'poll_interval_seconds': 60}
+
+    changes = Backfiller.from_settings(dict(settings, record_mode="changes"), storage=storage)
+    assert changes.gap_seconds == 450
+    assert changes.find_gaps("quiet-market", start, end) == []
+
+    # Без режима изменений те же интервалы - пропуски
+    everything = Backfiller.from_settings(settings, storage=storage)
+    assert len(everything.find_gaps("quiet-market", start, end)) == 12
+
+
+def test_missing_keyframe_is_a_gap(tmp_path):
+    storage = JsonLinesStorage()
+    write_keyframes(storage, tmp_path, 2, 900)
+    start, end = START.timestamp(), (START + timedelta(seconds=900)).timestamp()
+
+    backfiller = Backfiller.from_settings({'output_directory': str(tmp_path), 'record_mode': "changes"},
+                                          storage=storage)
+
+    assert backfiller.find_gaps("quiet-market", start, end) == [(start, end)]
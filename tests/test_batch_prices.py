@@ -0,0 +1,64 @@
+"""Пакетный запрос цен: один POST /prices на тик вместо запросов по каждому токену"""
+import api_client
+from price_monitor_service import MarketMonitor, ServiceManager
+from storage import JsonLinesStorage
+
+MONITORS = 25
+TICKS = 3
+
+
+def prices_route(query, body):
+    # Ответ CLOB: token_id -> {"BUY": цена, "SELL": цена}
+    data = {}
+    for item in body:
+        data.setdefault(item['token_id'], {})[item['side']] = "0.40" if item['side'] == "BUY" else "0.60"
+    return 200, data
+
+
+def price_route(query, body):
+    return 200, {'price': "0.40" if query['side'][0] == "buy" else "0.60"}
+
+
+def make_service(tmp_path, count: int) -> ServiceManager:
+    service = ServiceManager(str(tmp_path / "config.json"))
+    service.current_config = {'settings': {'output_directory': str(tmp_path), 'price_batch_size': 500}}
+    storage = JsonLinesStorage()
+    for i in range(count):
+        monitor = MarketMonitor(slug=f"market-{i}", name=f"Market {i}", output_dir=str(tmp_path), storage=storage)
+        monitor.token_id = f"token-{i}"
+        monitor.market_details = {'question': f"Market {i}?"}
+        service.running_monitors[monitor.slug] = (None, monitor)
+    return service
+
+
+def test_batched_tick_makes_one_request(stub_api, tmp_path):
+    stub_api.route('POST', '/prices', prices_route)
+    service = make_service(tmp_path, MONITORS)
+
+    for _ in range(TICKS):
+        assert service.fetch_prices_once() == MONITORS
+
+    assert stub_api.count('POST', '/prices') == TICKS
+    assert stub_api.count('GET', '/price') == 0
+    for _, monitor in service.running_monitors.values():
+        assert monitor.iteration == TICKS
+        assert monitor.last_price == {'bid': 0.40, 'ask': 0.60, 'mid': 0.5}
+
+
+def test_per_token_requests_scale_with_monitors(stub_api):
+    stub_api.route('GET', '/price', price_route)
+
+    for i in range(MONITORS):
+        assert api_client.get_current_price(f"token-{i}")['mid'] == 0.5
+
+    # Два запроса (buy и sell) на каждый токен за один тик
+    assert stub_api.count('GET', '/price') == 2 * MONITORS
+
+
+def test_batches_split_by_batch_size(stub_api):
+    stub_api.route('POST', '/prices', prices_route)
+
+    prices = api_client.get_current_prices([f"token-{i}" for i in range(MONITORS)], batch_size=10)
+
+    assert len(prices) == MONITORS
+    assert stub_api.count('POST', '/prices') == 3
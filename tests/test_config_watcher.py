@@ -0,0 +1,135 @@
+"""Перезагрузка конфигурации: сравнение рынков и настроек, опрос файла, инкрементальное обновление мониторов"""
+import json
+import os
+import sys
+import time
+from threading import Thread
+
+import pytest
+
+from config_watcher import ConfigWatcher, MODE_INOTIFY, MODE_POLLING, diff_markets, diff_settings
+from price_monitor_service import MarketMonitor, ServiceManager
+
+
+def test_diff_markets():
+    old = {'a': {'slug': "a", 'name': "A"}, 'b': {'slug': "b", 'name': "B"}, 'c': {'slug': "c"}}
+    new = {'b': {'slug': "b", 'name': "B2"}, 'c': {'slug': "c"}, 'd': {'slug': "d"}}
+    assert diff_markets(old, new) == (["d"], ["a"], ["b"])
+    assert diff_markets(new, new) == ([], [], [])
+
+
+def test_diff_settings():
+    old = {'poll_interval_seconds': 60, 'storage_backend': "json", 'metrics_enabled': True}
+    new = {'poll_interval_seconds': 30, 'storage_backend': "json", 'price_batch_size': 100}
+    assert diff_settings(old, new) == ['metrics_enabled', 'poll_interval_seconds', 'price_batch_size']
+    assert diff_settings(None, None) == []
+
+
+def write(path, data):
+    # Размер меняется вместе с содержимым, поэтому изменение видно даже при грубом mtime
+    path.write_text(json.dumps(data), encoding='utf-8')
+
+
+def test_polling_fallback_detects_change_once(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, {'markets': []})
+    watcher = ConfigWatcher(str(path), poll_interval=0.05, use_inotify=False)
+    try:
+        assert watcher.mode == MODE_POLLING
+        assert not watcher.wait(0.1)
+
+        write(path, {'markets': [{'slug': "a"}]})
+        assert watcher.wait(0.1)
+        assert not watcher.wait(0.1)
+    finally:
+        watcher.close()
+
+
+def test_polling_detects_atomic_replace(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, {'markets': []})
+    watcher = ConfigWatcher(str(path), poll_interval=0.05, use_inotify=False)
+    try:
+        replacement = tmp_path / "config.json.tmp"
+        write(replacement, {'markets': []})
+        os.replace(replacement, path)
+        assert watcher.wait(0.1)
+    finally:
+        watcher.close()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify есть только в Linux")
+def test_inotify_wakes_before_poll_interval(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, {'markets': []})
+    watcher = ConfigWatcher(str(path), poll_interval=3600, debounce=0.01)
+    try:
+        if watcher.mode != MODE_INOTIFY:
+            pytest.skip("inotify недоступен")
+        # Изменения других файлов каталога не считаются
+        (tmp_path / "other.json").write_text("{}", encoding='utf-8')
+        assert not watcher.wait(0.1)
+
+        write(path, {'markets': [{'slug': "a"}]})
+        started = time.monotonic()
+        assert watcher.wait(5)
+        assert time.monotonic() - started < 5
+    finally:
+        watcher.close()
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    service = ServiceManager(str(tmp_path / "config.json"))
+
+    def start_monitor(market, output_dir, poll_interval, self_poll=True):
+        # Монитор без сетевой инициализации: поток сразу завершается
+        monitor = MarketMonitor(slug=market['slug'], name=market.get('name', market['slug']), output_dir=output_dir)
+        monitor.poll_interval = poll_interval
+        thread = Thread(target=lambda: None, daemon=True)
+        thread.start()
+        return thread, monitor
+
+    monkeypatch.setattr(service, "start_monitor", start_monitor)
+    return service
+
+
+def config(tmp_path, markets, **settings):
+    return {'markets': markets, 'settings': {'output_directory': str(tmp_path / "logs"), **settings}}
+
+
+def test_reload_applies_incremental_diff(tmp_path, service, capsys):
+    write(tmp_path / "config.json", config(tmp_path, [{'slug': "a", 'name': "A"}, {'slug': "b", 'name': "B"},
+                                                      {'slug': "c", 'name': "C"}],
+                                           poll_interval_seconds=60, storage_backend="json"))
+    assert service.reload_config()
+    assert sorted(service.running_monitors) == ["a", "b", "c"]
+    monitor_a = service.running_monitors["a"][1]
+    monitor_c = service.running_monitors["c"][1]
+
+    write(tmp_path / "config.json", config(tmp_path, [{'slug': "b", 'name': "B2"}, {'slug': "c", 'name': "C"},
+                                                      {'slug': "d", 'name': "D"},
+                                                      {'slug': "e", 'name': "E", 'enabled': False}],
+                                           poll_interval_seconds=30, storage_backend="jsonl"))
+    capsys.readouterr()
+    assert service.reload_config()
+    output = capsys.readouterr().out
+
+    assert sorted(service.running_monitors) == ["b", "c", "d"]
+    assert monitor_a.should_stop
+    # Неизменившийся рынок не перезапускается, но получает новый интервал
+    assert service.running_monitors["c"][1] is monitor_c
+    assert monitor_c.poll_interval == 30
+    assert service.running_monitors["b"][1].name == "B2"
+    assert "Настройки применены: poll_interval_seconds" in output
+    assert "Настройки применятся после перезапуска: storage_backend" in output
+
+
+def test_unreadable_config_keeps_previous(tmp_path, service):
+    write(tmp_path / "config.json", config(tmp_path, [{'slug': "a"}]))
+    assert service.reload_config()
+
+    (tmp_path / "config.json").write_text("{ broken", encoding='utf-8')
+    assert not service.reload_config()
+    assert list(service.running_monitors) == ["a"]
+    assert service.current_config['markets'] == [{'slug': "a"}]
@@ -0,0 +1,106 @@
+"""Бинарный формат глубины книги заявок: заголовок, ключевые кадры, дельты, чтение"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from depth import (DepthRecorder, DepthReader, FILE_HEADER, MAGIC, RECORD_HEADER, SLOT,
+                   decode_book, depth_path, encode_book)
+
+TOKENS = ["yes-token", "no-token"]
+START = datetime(2026, 1, 18, 12, 0, 0)
+
+
+def books(bid: float, size: float = 10.0) -> dict:
+    # Цены округлены до шага формата (десятитысячные), чтобы сравнивать без погрешности
+    return {
+        "yes-token": {'bids': [(bid, size), (round(bid - 0.01, 4), 5.0)], 'asks': [(round(bid + 0.02, 4), 7.5)]},
+        "no-token": {'bids': [(round(0.97 - bid, 4), 3.0)], 'asks': [(round(1.0 - bid, 4), 4.25)]},
+    }
+
+
+def test_encode_decode_round_trip():
+    slots = encode_book(books(0.45), TOKENS, levels=3)
+    assert len(slots) == len(TOKENS) * 2 * 3
+    # Пустые уровни дополняются нулями
+    assert slots[2] == (0, 0)
+    assert decode_book(slots, TOKENS, levels=3) == books(0.45)
+
+
+def test_header_keyframes_and_deltas(tmp_path):
+    recorder = DepthRecorder(tmp_path, levels=3, keyframe_every=2)
+    for i, bid in enumerate([0.45, 0.45, 0.46, 0.46]):
+        recorder.record("m", TOKENS, books(bid), START + timedelta(seconds=i))
+    recorder.close()
+
+    path = depth_path(tmp_path, "m", "2026-01-18")
+    data = path.read_bytes()
+    magic, levels, token_count, _ = FILE_HEADER.unpack_from(data, 0)
+    assert (magic, levels, token_count) == (MAGIC, 3, 2)
+
+    with DepthReader(path) as reader:
+        assert reader.token_ids == TOKENS
+        raw = list(reader._iter_raw())
+        # Ключевой кадр, пустая дельта, дельта, ключевой кадр (keyframe_every=2)
+        assert [flags for _, _, flags, _, _ in raw] == [1, 0, 0, 1]
+        assert raw[1][3] == 0
+        assert 0 < raw[2][3] < reader.slot_count
+        assert raw[0][3] == raw[3][3] == reader.slot_count
+        assert reader.valid_end() == len(data)
+
+        snapshots = list(reader.iter_snapshots())
+        assert [b for _, b in snapshots] == [books(0.45), books(0.45), books(0.46), books(0.46)]
+        assert [t.replace(tzinfo=None) for t, _ in snapshots] == [START + timedelta(seconds=i) for i in range(4)]
+
+
+def test_reader_interval_starts_from_preceding_keyframe(tmp_path):
+    recorder = DepthRecorder(tmp_path, levels=2, keyframe_every=3)
+    bids = [0.40, 0.41, 0.42, 0.43, 0.44, 0.45, 0.46]
+    for i, bid in enumerate(bids):
+        recorder.record("m", TOKENS, books(bid), START + timedelta(seconds=i))
+    recorder.close()
+
+    with DepthReader(depth_path(tmp_path, "m", "2026-01-18")) as reader:
+        result = list(reader.iter_snapshots(start=START + timedelta(seconds=2),
+                                            end=START + timedelta(seconds=5)))
+        assert [b["yes-token"]['bids'][0][0] for _, b in result] == pytest.approx([0.42, 0.43, 0.44])
+
+
+def test_truncated_tail_is_dropped_on_reopen(tmp_path):
+    recorder = DepthRecorder(tmp_path, levels=2)
+    recorder.record("m", TOKENS, books(0.45), START)
+    recorder.record("m", TOKENS, books(0.46), START + timedelta(seconds=1))
+    recorder.close()
+
+    path = depth_path(tmp_path, "m", "2026-01-18")
+    complete = path.stat().st_size
+    with open(path, 'ab') as f:
+        f.write(RECORD_HEADER.pack(0, 0, 3) + SLOT.pack(0, 1, 1))
+
+    recorder = DepthRecorder(tmp_path, levels=2)
+    recorder.record("m", TOKENS, books(0.47), START + timedelta(seconds=2))
+    recorder.close()
+
+    with DepthReader(path) as reader:
+        assert reader.keyframes()[0][1] == reader.data_offset
+        assert path.stat().st_size > complete
+        result = [b["yes-token"]['bids'][0][0] for _, b in reader.iter_snapshots()]
+        assert result == pytest.approx([0.45, 0.46, 0.47])
+
+
+def test_torn_header_is_moved_aside(tmp_path):
+    path = depth_path(tmp_path, "m", "2026-01-18")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Сбой сразу после создания файла: записана только часть заголовка
+    path.write_bytes(MAGIC + b"\x02")
+    assert len(path.read_bytes()) == 9 < FILE_HEADER.size
+    with pytest.raises(ValueError):
+        DepthReader(path)
+
+    recorder = DepthRecorder(tmp_path, levels=2)
+    recorder.record("m", TOKENS, books(0.45), START)
+    recorder.close()
+
+    with DepthReader(path) as reader:
+        assert reader.token_ids == TOKENS
+        assert [b["yes-token"]['bids'][0][0] for _, b in reader.iter_snapshots()] == pytest.approx([0.45])
+    assert [p.read_bytes() for p in path.parent.iterdir() if p != path] == [MAGIC + b"\x02"]
@@ -0,0 +1,85 @@
+"""Поиск рынков в Gamma: пагинация, фильтры, объединение с config.json"""
+import json
+
+from discovery import MarketDiscovery, merge_markets
+from market_cache import MarketCache
+
+TOTAL = 950
+
+
+def market(i):
+    # Gamma отдает рынки по убыванию объема; каждый второй рынок - с малой ликвидностью
+    return {'slug': f"market-{i}", 'question': f"Market {i}?", 'clobTokenIds': json.dumps([f"yes-{i}", f"no-{i}"]),
+            'active': True, 'closed': False, 'volumeNum': 1_000_000 - i, 'liquidityNum': 50 if i % 2 else 5000}
+
+
+MARKETS = [market(i) for i in range(TOTAL)]
+
+
+def markets_route(query, body):
+    offset, limit = int(query['offset'][0]), int(query['limit'][0])
+    return 200, MARKETS[offset:offset + limit]
+
+
+def test_pagination_collects_all_pages(stub_api):
+    stub_api.route('GET', '/markets', markets_route)
+    markets = MarketDiscovery(page_size=100, concurrency=4).list_markets()
+
+    assert len(markets) == TOTAL
+    assert markets[0]['slug'] == "market-0"
+    # Волны по 4 страницы до первой неполной (950 -> 10 страниц, вторая волна неполная, третья - последняя)
+    assert stub_api.count('GET', '/markets') == 12
+
+
+def test_max_markets_counts_only_matching(stub_api):
+    stub_api.route('GET', '/markets', markets_route)
+    discovery = MarketDiscovery(page_size=100, concurrency=2, min_liquidity=1000, max_markets=300)
+    markets = discovery.list_markets()
+
+    assert len(markets) == 300
+    assert all(m['liquidityNum'] >= 1000 for m in markets)
+    assert markets[-1]['slug'] == "market-598"
+
+
+def test_client_side_filters():
+    discovery = MarketDiscovery(min_volume=10, min_liquidity=10)
+    assert discovery.matches(market(0))
+    assert not discovery.matches({**market(0), 'closed': True})
+    assert not discovery.matches({**market(0), 'enableOrderBook': False})
+    assert not discovery.matches({**market(0), 'clobTokenIds': None})
+    assert not discovery.matches({**market(0), 'volumeNum': 5})
+    assert MarketDiscovery(closed=True, active=None).matches({**market(0), 'closed': True})
+
+
+def test_failed_page_aborts_discovery(stub_api):
+    def flaky(query, body):
+        if query['offset'][0] == "300":
+            return 500, {'error': "boom"}
+        return markets_route(query, body)
+
+    stub_api.route('GET', '/markets', flaky)
+    assert MarketDiscovery(page_size=100, concurrency=2).discover() is None
+
+
+def test_discover_fills_cache_from_event(stub_api, tmp_path):
+    stub_api.route('GET', '/events', lambda query, body: (200, [{'slug': query['slug'][0], 'markets': MARKETS[:3]}]))
+    cache = MarketCache()
+    found = MarketDiscovery(event_slug="election").discover(cache)
+
+    assert list(found) == ["market-0", "market-1", "market-2"]
+    assert found["market-1"] == {'slug': "market-1", 'name': "Market 1?", 'enabled': True, 'discovered': True}
+    assert cache.get("market-2")['question'] == "Market 2?"
+    assert stub_api.count('GET', '/markets') == 0
+
+
+def test_merge_markets_prefers_config():
+    discovered = {s: {'slug': s, 'name': s, 'enabled': True, 'discovered': True} for s in ("a", "b", "c")}
+    config = {'markets': [{'slug': "b", 'name': "B", 'enabled': False},
+                          {'slug': "c", 'name': "C"},
+                          {'slug': "d", 'name': "D", 'enabled': True}]}
+
+    merged = merge_markets(config, discovered)
+
+    assert set(merged) == {"a", "c", "d"}
+    assert merged["c"] == {'slug': "c", 'name': "C"}
+    assert merged["a"]['discovered'] is True
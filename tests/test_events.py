@@ -0,0 +1,62 @@
+"""Мониторы событий: повтор неудачного запроса исходов и завершенные события"""
+from events import EventMonitor
+
+
+def market(slug: str, token: str, closed: bool = False) -> dict:
+    return {'slug': slug, 'question': slug, 'clobTokenIds': f'["{token}", "{token}-no"]', 'closed': closed}
+
+
+def events_route(events):
+    def route(query, body):
+        return 200, events.get(query['slug'][0], [])
+    return route
+
+
+def test_failed_resolve_backs_off(stub_api, tmp_path):
+    stub_api.route('GET', '/events', events_route({}))
+    monitor = EventMonitor("missing-event", "Missing", str(tmp_path))
+    monitor.retry_min, monitor.retry_max = 10, 40
+    assert monitor.pending
+
+    monitor.refresh(0, 3600)
+    assert not monitor.pending
+    assert stub_api.count('GET', '/events') == 1
+
+    # До истечения задержки Gamma не запрашивается
+    for now in (1, 5, 9):
+        monitor.refresh(now, 3600)
+    assert stub_api.count('GET', '/events') == 1
+
+    monitor.refresh(10, 3600)
+    assert stub_api.count('GET', '/events') == 2
+    # Задержка растет: 20, затем не больше retry_max
+    monitor.refresh(29, 3600)
+    monitor.refresh(30, 3600)
+    assert stub_api.count('GET', '/events') == 3
+    assert monitor.retry_delay() == 40
+
+
+def test_resolve_after_failure_resets_backoff(stub_api, tmp_path):
+    events = {}
+    stub_api.route('GET', '/events', events_route(events))
+    monitor = EventMonitor("late-event", "Late", str(tmp_path))
+
+    monitor.refresh(0, 3600)
+    events["late-event"] = [{'slug': "late-event", 'markets': [market("a", "ta"), market("b", "tb")]}]
+    monitor.refresh(monitor.retry_delay(), 3600)
+
+    assert monitor.token_ids == ["ta", "tb"]
+    assert monitor.failures == 0 and monitor.failed_at is None
+
+
+def test_event_without_open_outcomes_stops(stub_api, tmp_path):
+    stub_api.route('GET', '/events', events_route({
+        "finished": [{'slug': "finished", 'markets': [market("a", "ta", closed=True)]}],
+    }))
+    monitor = EventMonitor("finished", "Finished", str(tmp_path))
+
+    monitor.refresh(0, 3600)
+
+    assert monitor.should_stop
+    assert not monitor.pending
+    assert monitor.token_ids == []
@@ -0,0 +1,88 @@
+"""Кэш рынков: предзагрузка, снятие закрытых рынков, метрики"""
+from threading import Thread
+
+from market_cache import MarketCache
+from metrics import ServiceMetrics
+from price_monitor_service import ServiceManager, MarketMonitor
+from startup import prefetch_details
+
+OPEN = {'slug': "open-market", 'question': "Open?", 'clobTokenIds': '["yes-open", "no-open"]',
+        'active': True, 'closed': False}
+CLOSED = {'slug': "closed-market", 'question': "Closed?", 'clobTokenIds': '["yes-closed", "no-closed"]',
+          'active': True, 'closed': True}
+
+
+def markets_route(markets):
+    def route(query, body):
+        wanted = set(query.get('slug', []))
+        return 200, [m for m in markets if m['slug'] in wanted]
+    return route
+
+
+def test_prefetch_is_counted_separately_from_misses(stub_api):
+    stub_api.route('GET', '/markets', markets_route([OPEN, CLOSED]))
+    cache = MarketCache()
+
+    assert prefetch_details(["open-market", "closed-market"], cache) == 2
+    stats = cache.stats()
+    assert stats['misses'] == 0
+    assert stats['prefetches'] == 1
+    assert stats['entries'] == 1
+
+    assert cache.get("open-market") == OPEN
+    assert cache.stats()['hits'] == 1
+
+
+def test_initialize_retires_closed_market(stub_api):
+    stub_api.route('GET', '/markets', markets_route([CLOSED]))
+    cache = MarketCache()
+    monitor = MarketMonitor(slug="closed-market", name="Closed", output_dir="logs", market_cache=cache)
+
+    assert not monitor.initialize()
+    assert monitor.closed and monitor.should_stop
+    assert not monitor.initialize_with_retry()
+    assert not cache.contains("closed-market")
+
+
+def test_refresh_retires_market_closed_since_snapshot(stub_api, tmp_path):
+    stub_api.route('GET', '/markets', markets_route([OPEN, CLOSED]))
+    service = ServiceManager(str(tmp_path / "config.json"))
+    service.current_config = {
+        'markets': [{'slug': "open-market", 'enabled': True}, {'slug': "closed-market", 'enabled': True}],
+        'settings': {'output_directory': str(tmp_path)},
+    }
+    service.init_ready.set()
+
+    # Оба монитора восстановлены из снимка, где рынки еще были открыты
+    for details in (OPEN, CLOSED):
+        monitor = MarketMonitor(slug=details['slug'], name=details['slug'], output_dir=str(tmp_path),
+                                market_cache=service.market_cache)
+        monitor.market_details = dict(details, closed=False)
+        monitor.token_id = "yes-" + details['slug'].split('-')[0]
+        service.market_cache.put(details['slug'], monitor.market_details)
+        thread = Thread(target=lambda: None)
+        thread.start()
+        service.running_monitors[details['slug']] = (thread, monitor)
+    service.active_markets = service.monitored_markets(service.current_config)
+
+    assert service.refresh_markets() == 1
+    assert service.retire_closed_monitors() == ["closed-market"]
+
+    assert list(service.running_monitors) == ["open-market"]
+    assert service.running_monitors["open-market"][1].market_details == OPEN
+    assert not service.market_cache.contains("closed-market")
+    assert service.update_monitors()['added'] == []
+
+
+def test_cache_counters_are_exported():
+    metrics = ServiceMetrics()
+    cache = MarketCache()
+    cache.put("open-market", OPEN)
+    cache.get("open-market")
+    cache.get("missing")
+    metrics.track_market_cache(cache)
+
+    text = metrics.render()
+    assert 'polymarket_market_cache_total{event="hits"} 1' in text
+    assert 'polymarket_market_cache_total{event="misses"} 1' in text
+    assert 'polymarket_market_cache_entries 1' in text
@@ -0,0 +1,90 @@
+"""Метрики: текстовый формат Prometheus, заглушки при выключенных метриках, HTTP сервер"""
+from urllib.request import urlopen
+from urllib.error import HTTPError
+
+import pytest
+
+import metrics
+from metrics import CONTENT_TYPE, Counter, Gauge, Histogram, MetricsServer, ServiceMetrics
+
+
+def test_counter_and_gauge_render_with_labels():
+    counter = Counter("requests_total", "Запросы", ("endpoint", "status"))
+    counter.labels("/prices", 200).inc()
+    counter.labels("/prices", 200).inc(2)
+    counter.labels('/a"b\\c', "500").inc(0.5)
+    gauge = Gauge("queue_size", "Очередь")
+    gauge.set(7)
+
+    assert counter.render().splitlines() == [
+        "# HELP requests_total Запросы",
+        "# TYPE requests_total counter",
+        'requests_total{endpoint="/prices",status="200"} 3',
+        'requests_total{endpoint="/a\\"b\\\\c",status="500"} 0.5',
+    ]
+    assert gauge.render().splitlines()[-1] == "queue_size 7"
+
+    gauge.set_function(lambda: 1 / 0)
+    assert gauge.render().splitlines()[-1] == "queue_size NaN"
+
+    with pytest.raises(ValueError):
+        counter.labels("/prices")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Задержка", ("loop",), buckets=(1.0, 0.1, 0.5))
+    child = histogram.labels("batch")
+    for value in (0.05, 0.1, 0.3, 2.0):
+        child.observe(value)
+
+    assert histogram.render().splitlines()[2:] == [
+        'latency_seconds_bucket{loop="batch",le="0.1"} 2',
+        'latency_seconds_bucket{loop="batch",le="0.5"} 3',
+        'latency_seconds_bucket{loop="batch",le="1"} 3',
+        'latency_seconds_bucket{loop="batch",le="+Inf"} 4',
+        'latency_seconds_sum{loop="batch"} 2.45',
+        'latency_seconds_count{loop="batch"} 4',
+    ]
+
+
+def test_service_metrics_render_all_families():
+    service = ServiceMetrics(enabled=True)
+    service.market_polls.labels("m", "success").inc()
+    text = service.render()
+
+    assert text.endswith("\n")
+    assert 'polymarket_market_polls_total{market="m",result="success"} 1' in text
+    # Метрики без меток видны сразу с нулевым значением
+    assert "polymarket_writer_dropped_total 0" in text
+    assert "# TYPE polymarket_http_request_duration_seconds histogram" in text
+
+
+def test_disabled_metrics_are_noops():
+    service = ServiceMetrics(enabled=False)
+    service.http_latency.labels("/prices").observe(0.1)
+    service.market_polls.labels("m", "error").inc()
+    service.writer_queue.set_function(lambda: 1)
+    service.track_market_cache(object())
+
+    assert service.render() == "\n"
+    assert service.market_polls is service.http_latency
+
+
+def test_configure_and_server(monkeypatch):
+    monkeypatch.setattr(metrics, "_metrics", metrics.get_metrics())
+    assert metrics.start_metrics_server() is None
+
+    service = metrics.configure_metrics({'metrics_enabled': True})
+    assert metrics.get_metrics() is service
+    service.active_monitors.set(3)
+
+    server = MetricsServer(service, port=0).start()
+    try:
+        with urlopen(server.address, timeout=5) as response:
+            assert response.headers['Content-Type'] == CONTENT_TYPE
+            assert "polymarket_active_monitors 3" in response.read().decode('utf-8')
+        with pytest.raises(HTTPError) as error:
+            urlopen(server.address.replace("/metrics", "/other"), timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.stop()
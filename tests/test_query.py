@@ -0,0 +1,74 @@
+"""Индекс блоков JSON Lines: перестроение после перезаписи файла, запросы при убывающем времени"""
+import json
+from datetime import datetime
+
+from query import BlockIndex, _iter_jsonl_blocks, _ts, ensure_index
+
+
+def write_log(path, day, mids):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, mid in enumerate(mids):
+            f.write(json.dumps({'timestamp': f"{day}T00:{i:02d}:00", 'mid': mid}) + "\n")
+
+
+def test_index_rebuilds_after_same_size_rewrite(tmp_path):
+    path = tmp_path / "market_2026-01-18.jsonl"
+    write_log(path, "2026-01-18", [0.1] * 10)
+    first = ensure_index(path, block_size=4)
+
+    # Тот же размер, тот же inode, другие записи (перезапись на месте)
+    write_log(path, "2026-01-19", [0.2] * 10)
+    assert path.stat().st_size == first.size
+
+    index = ensure_index(path, block_size=4)
+    assert index.blocks != first.blocks
+    assert index.blocks[0][0] == first.blocks[0][0] + 24 * 3600
+
+
+def test_index_rebuilds_after_replace_with_larger_file(tmp_path):
+    path = tmp_path / "market_2026-01-18.jsonl"
+    write_log(path, "2026-01-18", [0.1] * 5)
+    ensure_index(path, block_size=4)
+
+    # Атомарная замена файла другим, большего размера: дописывать индекс нельзя
+    replacement = tmp_path / "replacement.jsonl"
+    write_log(replacement, "2026-01-19", [0.2] * 9)
+    replacement.replace(path)
+
+    index = ensure_index(path, block_size=4)
+    rebuilt = BlockIndex(path, block_size=4)
+    rebuilt.update()
+    assert index.blocks == rebuilt.blocks
+    assert sum(block[3] for block in index.blocks) == 9
+
+
+def test_index_appends_without_rebuild(tmp_path):
+    path = tmp_path / "market_2026-01-18.jsonl"
+    write_log(path, "2026-01-18", [0.1] * 6)
+    first = ensure_index(path, block_size=4)
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'timestamp': "2026-01-18T01:00:00", 'mid': 0.3}) + "\n")
+
+    index = ensure_index(path, block_size=4)
+    assert index.blocks[0] == first.blocks[0]
+    assert sum(block[3] for block in index.blocks) == 7
+
+
+def test_block_range_over_repeated_hour(tmp_path):
+    # Перевод часов назад: локальное время без пояса повторяет интервал 01:00-01:59
+    path = tmp_path / "market_2026-10-25.jsonl"
+    minutes = list(range(0, 60, 5)) * 2
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, minute in enumerate(minutes):
+            f.write(json.dumps({'timestamp': f"2026-10-25T01:{minute:02d}:00", 'i': i}) + "\n")
+
+    index = ensure_index(path, block_size=4)
+    start = datetime(2026, 10, 25, 1, 20).timestamp()
+    end = datetime(2026, 10, 25, 1, 30).timestamp()
+    blocks = index.block_range(start, end)
+
+    # Читаются только блоки, пересекающиеся с интервалом, из обоих проходов часа
+    assert [block[2] for block in blocks] == [index.blocks[1][2], index.blocks[4][2]]
+    records = [r for r in _iter_jsonl_blocks(path, blocks) if start <= _ts(r['timestamp']) < end]
+    assert [r['i'] for r in records] == [4, 5, 16, 17]
@@ -0,0 +1,22 @@
+"""Ограничители частоты запросов"""
+import asyncio
+
+import pytest
+
+from api_client import TokenBucket
+from async_engine import AsyncTokenBucket
+
+
+def test_request_above_capacity_raises():
+    bucket = TokenBucket(rate=2, capacity=2)
+    with pytest.raises(ValueError):
+        bucket.acquire(3)
+    with pytest.raises(ValueError):
+        bucket.try_acquire(3)
+    assert bucket.acquire(2) == 0.0
+
+
+def test_async_request_above_capacity_raises():
+    bucket = AsyncTokenBucket(rate=2, capacity=2)
+    with pytest.raises(ValueError):
+        asyncio.run(asyncio.wait_for(bucket.acquire(3), timeout=1))
@@ -0,0 +1,88 @@
+"""Запись только изменений: фильтр, фиксация состояния после записи, разворачивание в сетку"""
+from datetime import datetime, timedelta
+
+from recording import ChangeRecorder, expand_to_grid
+
+START = datetime(2026, 1, 18, 12, 0, 0)
+
+
+def entry(seconds, mid):
+    return {'timestamp': (START + timedelta(seconds=seconds)).isoformat(), 'market_slug': "m",
+            'market_name': "M", 'token_id': "t", 'bid': mid - 0.01, 'ask': mid + 0.01, 'mid': mid}
+
+
+def record(recorder, path, seconds, mid):
+    row = recorder.filter(path, entry(seconds, mid))
+    if row is not None:
+        recorder.commit()
+    return row
+
+
+def test_filter_writes_keyframes_and_changes(tmp_path):
+    recorder = ChangeRecorder(epsilon=0.001, keyframe_interval=300)
+    path = tmp_path / "m.jsonl"
+
+    first = record(recorder, path, 0, 0.5)
+    assert first['keyframe'] is True and first['market_name'] == "M"
+    assert record(recorder, path, 60, 0.5) is None
+    assert record(recorder, path, 120, 0.5005) is None
+    assert record(recorder, path, 180, 0.52) == {'timestamp': entry(180, 0.52)['timestamp'],
+                                                 'bid': 0.51, 'ask': 0.53, 'mid': 0.52}
+    assert record(recorder, path, 300, 0.52)['keyframe'] is True
+    # Новый файл (смена дня) начинается с ключевого кадра
+    assert record(recorder, tmp_path / "m2.jsonl", 360, 0.52)['keyframe'] is True
+    assert recorder.skipped == 2
+
+
+def test_dropped_row_is_not_used_as_baseline(tmp_path):
+    recorder = ChangeRecorder(keyframe_interval=300)
+    path = tmp_path / "m.jsonl"
+
+    # Ключевой кадр не принят очередью записи - следующая строка снова ключевой кадр
+    assert recorder.filter(path, entry(0, 0.5))['keyframe'] is True
+    assert recorder.filter(path, entry(60, 0.5))['keyframe'] is True
+    recorder.commit()
+
+    # Изменение отброшено - при возврате цены к 0.5 оно не должно потеряться
+    assert recorder.filter(path, entry(120, 0.6)) is not None
+    row = record(recorder, path, 180, 0.6)
+    assert row is not None and row['mid'] == 0.6
+    assert record(recorder, path, 240, 0.6) is None
+
+
+def test_expand_to_grid_fills_and_marks_gaps():
+    rows = [
+        {**entry(0, 0.5), 'keyframe': True},
+        {'timestamp': entry(90, 0.6)['timestamp'], 'bid': 0.59, 'ask': 0.61, 'mid': 0.6},
+        {**entry(300, 0.6), 'keyframe': True},
+        # Простой сервиса: следующий ключевой кадр через 15 минут
+        {**entry(1200, 0.7), 'keyframe': True},
+    ]
+
+    grid = list(expand_to_grid(rows, step_seconds=60))
+
+    assert len(grid) == 21
+    assert [r['mid'] for r in grid[:3]] == [0.5, 0.5, 0.6]
+    assert grid[5]['mid'] == 0.6 and 'gap' not in grid[5]
+    # max_gap по умолчанию - 1.5 интервала ключевых кадров (450 с)
+    assert grid[12]['mid'] == 0.6
+    assert grid[13] == {'timestamp': (START + timedelta(seconds=780)).isoformat(),
+                        'bid': None, 'ask': None, 'mid': None, 'gap': True}
+    assert grid[-1]['mid'] == 0.7 and 'gap' not in grid[-1]
+
+
+def test_expand_to_grid_respects_bounds():
+    rows = [{**entry(60, 0.5), 'keyframe': True}]
+    grid = list(expand_to_grid(rows, 30, start=START, end=START + timedelta(seconds=120), max_gap_seconds=100))
+    assert [r.get('gap', False) for r in grid] == [True, True, False, False, False]
+
+
+def test_restart_keyframe_does_not_shrink_gap_threshold():
+    # Перезапуск через 10 с после первого ключевого кадра дает внеплановый ключевой кадр
+    rows = [{**entry(seconds, 0.5), 'keyframe': True} for seconds in (0, 10, 310, 610)]
+
+    for grid in (list(expand_to_grid(rows, step_seconds=60)),
+                 list(expand_to_grid(rows, step_seconds=60, keyframe_interval=300))):
+        assert len(grid) == 11
+        assert not [r for r in grid if r.get('gap')]
+        assert all(r['mid'] == 0.5 for r in grid)
@@ -0,0 +1,184 @@
+"""Восстановление логов после падения: разбор оборванных файлов и SIGKILL потока записи"""
+import os
+import sys
+import json
+import signal
+import subprocess
+import textwrap
+
+import pytest
+
+from storage import (salvage_json_array, recover_log_file, recover_logs, read_log, convert_to_jsonl,
+                     TMP_SUFFIX, CORRUPT_SUFFIX)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def record(i: int) -> dict:
+    return {'timestamp': f"2026-01-18T12:00:{i:02d}", 'bid': 0.4, 'ask': 0.6, 'mid': 0.5}
+
+
+def test_salvage_json_array_keeps_complete_records():
+    content = json.dumps([record(0), record(1)], indent=2)
+    truncated = content[:content.rindex('"mid"')]
+
+    records, lost = salvage_json_array(truncated)
+
+    assert records == [record(0)]
+    assert lost > 0
+    assert salvage_json_array(content) == ([record(0), record(1)], 0)
+    assert salvage_json_array("garbage") == ([], len("garbage"))
+
+
+def test_recover_jsonl_truncates_partial_line(tmp_path):
+    path = tmp_path / "m_2026-01-18.jsonl"
+    good = "".join(json.dumps(record(i)) + "\n" for i in range(3))
+    path.write_text(good + '{"timestamp": "2026-01-18T12:00:03", "bi', encoding='utf-8')
+
+    result = recover_log_file(path)
+
+    assert result['action'] == 'truncated'
+    assert path.read_text(encoding='utf-8') == good
+    assert recover_log_file(path) is None
+
+
+def test_recover_jsonl_terminates_complete_line(tmp_path):
+    path = tmp_path / "m_2026-01-18.jsonl"
+    path.write_text(json.dumps(record(0)) + "\n" + json.dumps(record(1)), encoding='utf-8')
+
+    assert recover_log_file(path)['action'] == 'terminated'
+    assert read_log(path) == [record(0), record(1)]
+
+
+def test_recover_json_array_keeps_backup(tmp_path):
+    path = tmp_path / "m_2026-01-18.json"
+    content = json.dumps([record(0), record(1), record(2)], indent=2)
+    path.write_text(content[:-20], encoding='utf-8')
+
+    result = recover_log_file(path)
+
+    assert result['action'] == 'salvaged'
+    assert result['records'] == 2
+    assert read_log(path) == [record(0), record(1)]
+    assert (tmp_path / (path.name + CORRUPT_SUFFIX)).read_text(encoding='utf-8') == content[:-20]
+
+
+def test_recover_logs_scans_subdirectories(tmp_path):
+    events = tmp_path / "events"
+    events.mkdir()
+    (tmp_path / "m_2026-01-18.json").write_text(json.dumps([record(0)]), encoding='utf-8')
+    (tmp_path / ("m_2026-01-18.json" + TMP_SUFFIX)).write_text('[{"timest', encoding='utf-8')
+    (events / ("e_2026-01-18.json" + TMP_SUFFIX)).write_text('[', encoding='utf-8')
+    (events / "e_2026-01-18.jsonl").write_text(json.dumps(record(0)) + "\n{", encoding='utf-8')
+    (tmp_path / "notes.txt").write_text("не лог", encoding='utf-8')
+
+    results = recover_logs(tmp_path)
+
+    actions = sorted((os.path.relpath(r['path'], tmp_path), r['action']) for r in results)
+    assert actions == [
+        (os.path.join("events", "e_2026-01-18.json" + TMP_SUFFIX), 'removed'),
+        (os.path.join("events", "e_2026-01-18.jsonl"), 'truncated'),
+        ("m_2026-01-18.json" + TMP_SUFFIX, 'removed'),
+    ]
+    assert not list(tmp_path.rglob("*" + TMP_SUFFIX))
+    assert read_log(events / "e_2026-01-18.jsonl") == [record(0)]
+    assert recover_logs(tmp_path) == []
+
+
+def test_convert_merges_into_existing_jsonl(tmp_path):
+    # Утро записано в массив, после смены бэкенда день продолжен в JSON Lines (одна запись повторяется)
+    source = tmp_path / "m_2026-01-18.json"
+    source.write_text(json.dumps([record(0), record(1), record(2)]), encoding='utf-8')
+    target = tmp_path / "m_2026-01-18.jsonl"
+    target.write_text("".join(json.dumps(record(i)) + "\n" for i in (2, 3)), encoding='utf-8')
+
+    assert convert_to_jsonl(source, remove_source=True) == target
+
+    assert not source.exists()
+    assert read_log(target) == [record(i) for i in range(4)]
+
+
+# Процесс записи с внедренным сбоем: вторая пачка останавливается посреди
+# сброса (jsonl - после половины строк, json - перед rename временного файла),
+# печатает FLUSHING и ждет, пока тест не убьет его SIGKILL.
+WRITER_SCRIPT = textwrap.dedent("""
+    import os, sys, time, threading
+    sys.path.insert(0, {root!r})
+    import storage
+    from storage import create_storage
+    from writer import LogWriter
+
+    backend, path = sys.argv[1], sys.argv[2]
+    fault = threading.Event()
+
+    def hang():
+        print("FLUSHING", flush=True)
+        time.sleep(60)
+
+    if backend == "jsonl":
+        class HalfWrite:
+            def __init__(self, handle):
+                self.handle = handle
+            def write(self, data):
+                if fault.is_set():
+                    self.handle.write(data[:len(data) // 2 + 1])
+                    self.handle.flush()
+                    hang()
+                return self.handle.write(data)
+            def __getattr__(self, name):
+                return getattr(self.handle, name)
+
+        get_handle = storage.JsonLinesStorage._get_handle
+        storage.JsonLinesStorage._get_handle = lambda self, p: HalfWrite(get_handle(self, p))
+    else:
+        replace = os.replace
+        def slow_replace(src, dst):
+            if fault.is_set() and str(src).endswith(storage.TMP_SUFFIX):
+                hang()
+            replace(src, dst)
+        storage.os.replace = slow_replace
+
+    writer = LogWriter(create_storage({{'storage_backend': backend}}), flush_records=10, flush_interval=60).start()
+    for i in range(10):
+        writer.submit(path, {{'timestamp': f"2026-01-18T12:00:{{i:02d}}", 'i': i, 'payload': 'x' * 1000}})
+    while writer.written < 10:
+        time.sleep(0.01)
+    fault.set()
+    for i in range(10, 20):
+        writer.submit(path, {{'timestamp': f"2026-01-18T12:00:{{i:02d}}", 'i': i, 'payload': 'x' * 1000}})
+    time.sleep(60)
+""").format(root=ROOT)
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason="нужен SIGKILL (POSIX)")
+@pytest.mark.parametrize("backend", ["jsonl", "json"])
+def test_sigkill_mid_flush_leaves_parseable_log(tmp_path, backend):
+    path = tmp_path / "events" / f"event_2026-01-18.{backend}"
+    process = subprocess.Popen([sys.executable, "-c", WRITER_SCRIPT, backend, str(path)],
+                               stdout=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().strip() == "FLUSHING"
+    finally:
+        process.send_signal(signal.SIGKILL)
+        process.wait(timeout=10)
+        process.stdout.close()
+
+    if backend == "jsonl":
+        # Последняя строка недописана
+        assert not path.read_text(encoding='utf-8').endswith("\n")
+    else:
+        assert path.with_name(path.name + TMP_SUFFIX).exists()
+
+    results = recover_logs(tmp_path)
+
+    assert results
+    assert not list(tmp_path.rglob("*" + TMP_SUFFIX))
+    if backend == "jsonl":
+        lines = path.read_text(encoding='utf-8').splitlines()
+        records = [json.loads(line) for line in lines]
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    # Первая пачка цела, записи второй - только целиком
+    assert [r['i'] for r in records[:10]] == list(range(10))
+    assert all(r['payload'] == 'x' * 1000 for r in records)
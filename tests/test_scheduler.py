@@ -0,0 +1,93 @@
+"""Адаптивное расписание опроса: сроки, интервалы, бюджет запросов, сохранение состояния"""
+import time
+
+import pytest
+
+from scheduler import AdaptiveScheduler
+
+
+def prices(mid, spread=0.02):
+    return {'bid': mid - spread / 2, 'ask': mid + spread / 2, 'mid': mid}
+
+
+def make(**kwargs):
+    options = dict(min_interval=5, max_interval=80, initial_interval=20, change_threshold=0.005,
+                   tighten_factor=0.5, backoff_factor=2)
+    options.update(kwargs)
+    return AdaptiveScheduler(**options)
+
+
+def test_new_markets_are_due_immediately_and_removed_ones_forgotten():
+    scheduler = make()
+    scheduler.sync(["a", "b"], now=100)
+    assert scheduler.due(now=100) == ["a", "b"]
+
+    scheduler.observe("a", prices(0.5), now=100)
+    assert scheduler.due(now=101) == ["b"]
+    assert scheduler.due(now=120) == ["b", "a"]
+
+    scheduler.sync(["a"], now=120)
+    assert list(scheduler.intervals()) == ["a"]
+    assert scheduler.observe("b", prices(0.5), now=120) == 20
+
+
+def test_due_orders_by_overdue_time():
+    scheduler = make()
+    scheduler.sync(["a", "b", "c"], now=0)
+    scheduler.observe("a", prices(0.5), now=10)
+    scheduler.observe("b", prices(0.5), now=0)
+    scheduler.observe("c", prices(0.5), now=5)
+    assert scheduler.due(now=40) == ["b", "c", "a"]
+
+
+def test_interval_tightens_on_change_and_backs_off_when_quiet():
+    scheduler = make()
+    scheduler.sync(["m"], now=0)
+
+    # Первое наблюдение интервал не меняет
+    assert scheduler.observe("m", prices(0.5), now=0) == 20
+    assert scheduler.observe("m", prices(0.5), now=20) == 40
+    assert scheduler.observe("m", prices(0.5), now=60) == 80
+    assert scheduler.observe("m", prices(0.5), now=140) == 80
+    assert scheduler.observe("m", prices(0.52), now=220) == 40
+    # Изменение спреда тоже считается изменением
+    assert scheduler.observe("m", prices(0.52, spread=0.05), now=260) == 20
+    assert scheduler.observe("m", prices(0.52, spread=0.05), now=280) == 40
+    # Ошибка запроса интервал не меняет, но переносит срок
+    assert scheduler.observe("m", None, now=320) == 40
+    assert scheduler.due(now=359) == []
+    assert scheduler.due(now=360) == ["m"]
+
+    for step in range(5):
+        scheduler.observe("m", prices(0.3 + step / 10), now=400 + step)
+    assert scheduler.intervals()["m"] == 5
+
+
+def test_request_budget_limits_batches_per_tick():
+    scheduler = make(request_budget_per_second=2)
+    scheduler.sync([f"m{i}" for i in range(10)], now=0)
+
+    # Бюджет - 2 запроса по 3 рынка; остальные рынки ждут следующего тика
+    assert len(scheduler.due(batch_size=3, now=0)) == 6
+    assert scheduler.deferred == 4
+
+
+def test_snapshot_and_restore_preserve_state():
+    scheduler = make()
+    now = time.monotonic()
+    scheduler.sync(["quiet", "late"], now=now)
+    scheduler.observe("quiet", prices(0.5), now=now)
+    scheduler.observe("quiet", prices(0.5), now=now)
+    scheduler.observe("late", prices(0.7), now=now - 100)
+
+    snapshot = scheduler.snapshot()
+    assert snapshot["quiet"]['interval'] == 40
+    assert snapshot["quiet"]['last_mid'] == 0.5
+
+    restored = make(max_interval=30)
+    assert restored.restore(snapshot) == 2
+    # Интервал ограничивается новыми настройками, просроченный рынок опрашивается сразу
+    assert restored.intervals() == {"quiet": 30, "late": 20}
+    assert restored.due() == ["late"]
+    assert restored.observe("quiet", prices(0.5)) == 30
+    assert restored.observe("late", prices(0.71)) == pytest.approx(10)
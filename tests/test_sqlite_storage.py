@@ -0,0 +1,106 @@
+"""Бэкенд SQLite: дедупликация, чтение по дням, удаление и прореживание, импорт логов"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlite_storage import SqliteStorage, import_logs
+
+DAY = datetime(2026, 1, 18)
+
+
+def entry(minutes, mid=0.5, **extra):
+    return {'timestamp': (DAY + timedelta(minutes=minutes)).isoformat(), 'market_slug': "m", 'market_name': "M",
+            'token_id': "t", 'bid': mid - 0.01, 'ask': mid + 0.01, 'mid': mid, **extra}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SqliteStorage(tmp_path / "prices.db", root=tmp_path, batch_records=1000, commit_interval=60)
+    try:
+        yield storage
+    finally:
+        storage.close()
+
+
+def test_append_and_merge_deduplicate_by_timestamp(tmp_path, storage):
+    path = storage.log_path(tmp_path, "m", "2026-01-18")
+    storage.append_many(path, [entry(0), entry(1)])
+    storage.append(path, entry(1, mid=0.9))
+    storage.commit()
+
+    assert storage.merge(path, [entry(1), entry(2, backfill=True)]) == 1
+
+    records = list(storage.iter_records(path))
+    assert [r['timestamp'] for r in records] == [entry(m)['timestamp'] for m in range(3)]
+    # Повтор отбрасывается, первая запись сохраняется; лишние поля - из extra
+    assert records[1]['mid'] == 0.5
+    assert records[2] == entry(2, backfill=True)
+    assert storage.stats()['rows'] == 3
+
+
+def test_iter_records_returns_one_day(tmp_path, storage):
+    storage.merge(storage.log_path(tmp_path, "m", "2026-01-18"), [entry(-1), entry(0), entry(24 * 60 - 1), entry(24 * 60)])
+
+    day = list(storage.iter_records(storage.log_path(tmp_path, "m", "2026-01-18")))
+    assert [r['timestamp'] for r in day] == [entry(0)['timestamp'], entry(24 * 60 - 1)['timestamp']]
+    assert len(storage.query("m")) == 4
+    assert len(storage.query("m", start=DAY + timedelta(days=1))) == 1
+    assert list(storage.iter_records(storage.log_path(tmp_path, "other", "2026-01-18"))) == []
+
+
+def test_prune_removes_old_rows(tmp_path, storage):
+    storage.merge(storage.log_path(tmp_path, "m", "2026-01-18"), [entry(m) for m in range(10)])
+    assert storage.prune(DAY + timedelta(minutes=4)) == 4
+    assert [r['timestamp'] for r in storage.query("m")][0] == entry(4)['timestamp']
+
+
+def test_downsample_keeps_last_row_per_bucket(tmp_path, storage):
+    storage.merge(storage.log_path(tmp_path, "m", "2026-01-18"), [entry(m, mid=m / 100) for m in range(20)])
+
+    assert storage.downsample(DAY + timedelta(minutes=10), 300) == 8
+    records = storage.query("m")
+    assert [r['mid'] for r in records[:2]] == [0.04, 0.09]
+    assert len(records) == 12
+    # Прореженная часть повторно не просматривается
+    assert storage.downsample(DAY + timedelta(minutes=10), 300) == 0
+
+
+def test_rows_merged_below_watermark_are_downsampled(tmp_path):
+    storage = SqliteStorage(tmp_path / "prices.db", root=tmp_path, downsample_after_days=1, downsample_seconds=300)
+    try:
+        now = datetime.now().replace(microsecond=0)
+        old = now - timedelta(days=3)
+        path = storage.log_path(tmp_path, "m")
+        storage.merge(path, [{**entry(0), 'timestamp': (old + timedelta(minutes=m)).isoformat()} for m in range(4)])
+        storage.maintain()
+
+        # Бэкфилл дописывает историю раньше уже прореженной
+        backfill = [{**entry(0), 'timestamp': (old - timedelta(hours=10) + timedelta(minutes=m)).isoformat()}
+                    for m in range(100)]
+        assert storage.merge(path, backfill) == 100
+        assert storage.maintain()['downsampled'] > 0
+        assert len(storage.query("m")) <= 2 + 100 // 5 + 1
+    finally:
+        storage.close()
+
+
+def test_import_logs_reads_json_jsonl_and_events(tmp_path):
+    logs = tmp_path / "logs"
+    (logs / "events").mkdir(parents=True)
+    (logs / "m_2026-01-18.json").write_text(json.dumps([entry(0), entry(1)]), encoding='utf-8')
+    (logs / "m_2026-01-18.jsonl").write_text("".join(json.dumps(entry(m)) + "\n" for m in (1, 2)), encoding='utf-8')
+    (logs / "events" / "e_2026-01-18.jsonl").write_text(
+        json.dumps({'timestamp': entry(0)['timestamp'], 'mid': [0.2, 0.8], 'keyframe': True}) + "\n",
+        encoding='utf-8')
+
+    storage = SqliteStorage(logs / "prices.db", root=logs)
+    try:
+        assert import_logs(storage, logs) == {'files': 3, 'added': 4}
+        assert len(storage.query("m")) == 3
+        event = storage.query("events/e")
+        assert event[0]['mid'] == [0.2, 0.8] and event[0]['keyframe'] is True
+        # Повторный импорт ничего не добавляет
+        assert import_logs(storage, logs)['added'] == 0
+    finally:
+        storage.close()
@@ -0,0 +1,103 @@
+"""Потоковый режим: стаб канала market на websockets.sync.server, обрыв и переподключение"""
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("websockets")
+from websockets.exceptions import ConnectionClosed  # noqa: E402
+from websockets.sync.server import serve  # noqa: E402
+
+from streaming import MarketStream, LOG_ON_CHANGE  # noqa: E402
+
+TOKEN = "token-1"
+
+
+def book(bid: str, ask: str) -> str:
+    return json.dumps({'event_type': 'book', 'asset_id': TOKEN,
+                       'bids': [{'price': bid, 'size': '100'}], 'asks': [{'price': ask, 'size': '100'}]})
+
+
+def price_change(side: str, price: str, size: str) -> str:
+    return json.dumps({'event_type': 'price_change',
+                       'price_changes': [{'asset_id': TOKEN, 'side': side, 'price': price, 'size': size}]})
+
+
+# Первая сессия обрывается после снимка и изменения. Во второй изменение
+# приходит раньше нового снимка и не должно примениться к книге до обрыва.
+SESSIONS = [
+    [book('0.40', '0.60'), price_change('BUY', '0.42', '50')],
+    [price_change('SELL', '0.55', '10'), book('0.30', '0.70'), price_change('SELL', '0.65', '10')],
+]
+
+
+class StubMonitor:
+    def __init__(self):
+        self.slug = "market-1"
+        self.name = "Market 1"
+        self.token_id = TOKEN
+        self.should_stop = False
+        self.last_fetch_time = None
+        self.records = []
+
+    def handle_price(self, price_data):
+        self.records.append((price_data['bid'], price_data['ask']))
+
+
+@pytest.fixture
+def ws_server():
+    subscriptions = []
+
+    def handler(ws):
+        subscriptions.append(json.loads(ws.recv()))
+        session = len(subscriptions) - 1
+        for message in SESSIONS[min(session, len(SESSIONS) - 1)]:
+            ws.send(message)
+        if session == 0:
+            ws.close()
+            return
+        try:
+            while True:
+                ws.recv()
+        except ConnectionClosed:
+            pass
+
+    server = serve(handler, "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"ws://127.0.0.1:{server.socket.getsockname()[1]}", subscriptions
+    finally:
+        server.shutdown()
+
+
+def wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_records_and_resync_after_reconnect(ws_server):
+    url, subscriptions = ws_server
+    monitor = StubMonitor()
+    fallback_calls = []
+
+    stream = MarketStream(get_monitors=lambda: [monitor], rest_fallback=lambda: fallback_calls.append(1),
+                          url=url, log_mode=LOG_ON_CHANGE, fallback_interval=0.1)
+    thread = threading.Thread(target=stream.run, daemon=True)
+    thread.start()
+    try:
+        assert wait_for(lambda: len(monitor.records) >= 4)
+    finally:
+        stream.stop()
+        thread.join(timeout=5)
+
+    assert monitor.records == [(0.40, 0.60), (0.42, 0.60), (0.30, 0.70), (0.30, 0.65)]
+    assert len(subscriptions) == 2
+    assert all(s == {'assets_ids': [TOKEN], 'type': 'market'} for s in subscriptions)
+    # На время обрыва цены запрашивались через REST
+    assert fallback_calls
@@ -0,0 +1,135 @@
+"""Супервизор: кольцо хеширования, перераспределение рынков с двухфазной передачей, SIGTERM"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
+
+from supervisor import HashRing, Supervisor, event_key
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLUGS = [f"market-{i}" for i in range(200)]
+
+
+def test_hash_ring_is_stable_and_balanced():
+    ring = HashRing(4)
+    assert [ring.shard_for(s) for s in SLUGS] == [HashRing(4).shard_for(s) for s in SLUGS]
+    counts = [sum(1 for s in SLUGS if ring.shard_for(s) == shard) for shard in range(4)]
+    assert all(20 <= count <= 80 for count in counts)
+
+
+def test_adding_shard_moves_only_its_share():
+    before, after = HashRing(4), HashRing(5)
+    moved = [s for s in SLUGS if before.shard_for(s) != after.shard_for(s)]
+    # Переезжают только рынки нового воркера, примерно 1/5
+    assert all(after.shard_for(s) == 4 for s in moved)
+    assert 10 <= len(moved) <= 80
+
+
+def make_supervisor(tmp_path, workers, slugs, events=()):
+    config = {'markets': [{'slug': s, 'name': s} for s in slugs],
+              'events': [{'slug': e} for e in events],
+              'settings': {'output_directory': str(tmp_path / "logs"), 'shard_reload_interval_seconds': 1}}
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config), encoding='utf-8')
+    supervisor = Supervisor(str(config_file), workers=workers)
+    supervisor.config = config
+    supervisor.shards_dir.mkdir(parents=True, exist_ok=True)
+    return supervisor
+
+
+def shard_slugs(worker):
+    shard = json.loads(worker.config_file.read_text(encoding='utf-8'))
+    return {m['slug'] for m in shard['markets']} | {event_key(e['slug']) for e in shard.get('events', [])}
+
+
+def test_rebalance_hands_off_moved_markets_in_two_phases(tmp_path):
+    supervisor = make_supervisor(tmp_path, 2, SLUGS[:40], events=["election"])
+    supervisor.rebalance()
+
+    assert set(supervisor.owner) == set(SLUGS[:40]) | {event_key("election")}
+    for worker in supervisor.workers.values():
+        assert shard_slugs(worker) == worker.slugs
+    assert not supervisor.pending
+
+    # Третий воркер: переезжающие рынки сначала только снимаются с прежних воркеров
+    supervisor.workers_override = 3
+    supervisor.rebalance()
+    moving = set(supervisor.pending)
+    assert moving and all(index == 2 for index, _ in supervisor.pending.values())
+    assert not supervisor.workers[2].slugs & moving
+    assert not any(worker.slugs & moving for worker in supervisor.workers.values())
+
+    # До истечения handoff_delay рынки не передаются
+    supervisor.apply_pending()
+    assert set(supervisor.pending) == moving
+
+    supervisor.pending = {slug: (index, 0.0) for slug, (index, _) in supervisor.pending.items()}
+    supervisor.apply_pending()
+    assert not supervisor.pending
+    assert supervisor.workers[2].slugs == moving
+    assert shard_slugs(supervisor.workers[2]) == moving
+    assert sum(len(w.slugs) for w in supervisor.workers.values()) == 41
+
+
+def test_removed_markets_are_dropped_and_new_assigned_immediately(tmp_path):
+    supervisor = make_supervisor(tmp_path, 2, SLUGS[:10])
+    supervisor.rebalance()
+
+    supervisor.config['markets'] = [{'slug': s, 'name': s} for s in SLUGS[5:15]]
+    supervisor.rebalance()
+    assert set(supervisor.owner) == set(SLUGS[5:15])
+    assert not supervisor.pending
+    assert set().union(*(shard_slugs(w) for w in supervisor.workers.values())) == set(SLUGS[5:15])
+
+
+WORKER_SCRIPT = textwrap.dedent("""
+    import signal, sys, time
+    from pathlib import Path
+    marker = Path(sys.argv[sys.argv.index('--config') + 1]).with_suffix('.running')
+    def on_sigint(signum, frame):
+        marker.with_suffix('.stopped').write_text('ok')
+        sys.exit(0)
+    signal.signal(signal.SIGINT, on_sigint)
+    marker.write_text('ok')
+    while True:
+        time.sleep(0.1)
+""")
+
+SUPERVISOR_SCRIPT = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, {root!r})
+    import supervisor
+    supervisor.SERVICE_SCRIPT = sys.argv[2]
+    supervisor.Supervisor(sys.argv[1], workers=2).run()
+""")
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason="нужны сигналы POSIX")
+def test_sigterm_stops_all_workers(tmp_path):
+    make_supervisor(tmp_path, 2, SLUGS[:10])
+    worker_script = tmp_path / "worker.py"
+    worker_script.write_text(WORKER_SCRIPT, encoding='utf-8')
+
+    process = subprocess.Popen([sys.executable, "-c", SUPERVISOR_SCRIPT.format(root=ROOT),
+                                str(tmp_path / "config.json"), str(worker_script)],
+                               stdout=subprocess.DEVNULL)
+    shards = tmp_path / ".shards"
+    try:
+        deadline = time.monotonic() + 20
+        while len(list(shards.glob("*.running"))) < 2:
+            assert time.monotonic() < deadline, "воркеры не запустились"
+            time.sleep(0.05)
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=20) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+    assert len(list(shards.glob("*.stopped"))) == 2
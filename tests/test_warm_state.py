@@ -0,0 +1,29 @@
+"""Снимок состояния для быстрого перезапуска"""
+import asyncio
+
+from async_engine import AsyncServiceManager
+from market_cache import MarketCache
+from price_monitor_service import MarketMonitor
+from startup import WarmState
+
+DETAILS = {'question': "Market?", 'clobTokenIds': '["yes-token", "no-token"]'}
+
+
+def test_async_engine_snapshot_keeps_all_token_ids(tmp_path):
+    service = AsyncServiceManager(str(tmp_path / "config.json"))
+    service.market_cache = MarketCache()
+    service.market_cache.put("market", DETAILS)
+    monitor = MarketMonitor(slug="market", name="Market", output_dir=str(tmp_path))
+
+    assert asyncio.run(service.initialize_monitor(monitor))
+    assert monitor.token_ids == ["yes-token", "no-token"]
+
+    state = WarmState(str(tmp_path / "warm.json"))
+    assert state.save([monitor]) == 1
+
+    restored = WarmState(str(tmp_path / "warm.json"))
+    assert restored.load()
+    fresh = MarketMonitor(slug="market", name="Market", output_dir=str(tmp_path))
+    assert restored.restore_monitor(fresh)
+    assert fresh.token_id == "yes-token"
+    assert fresh.token_ids == ["yes-token", "no-token"]
@@ -0,0 +1,97 @@
+"""Поток записи логов: отбрасывание при переполнении, сброс пачками, дозапись при остановке"""
+import time
+from threading import Event
+
+from writer import LogWriter
+
+
+class MemoryStorage:
+    """Хранилище в памяти: append_many может ждать события `release`"""
+
+    def __init__(self):
+        self.records = {}
+        self.commits = 0
+        self.release = Event()
+        self.release.set()
+
+    def append_many(self, path, entries):
+        self.release.wait(10)
+        self.records.setdefault(path, []).extend(entries)
+
+    def commit(self):
+        self.commits += 1
+
+
+def entry(i):
+    return {'timestamp': f"2026-01-18T12:00:{i:02d}", 'i': i}
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "условие не выполнено"
+        time.sleep(0.01)
+
+
+def test_full_queue_drops_after_block_timeout(tmp_path):
+    # Поток не запущен - очередь никто не разбирает
+    writer = LogWriter(MemoryStorage(), max_queue=1, block_timeout=0.1)
+    assert writer.submit(tmp_path / "m.jsonl", entry(0))
+
+    started = time.monotonic()
+    assert not writer.submit(tmp_path / "m.jsonl", entry(1))
+    assert 0.1 <= time.monotonic() - started < 1.0
+    assert writer.stats() == {'submitted': 1, 'written': 0, 'dropped': 1, 'errors': 0, 'queued': 1}
+
+
+def test_tick_deadline_bounds_wait_for_all_markets(tmp_path):
+    writer = LogWriter(MemoryStorage(), max_queue=1, block_timeout=0.2)
+    assert writer.submit(tmp_path / "m.jsonl", entry(0))
+
+    # Десять рынков одного тика ждут места в очереди суммарно не дольше block_timeout
+    started = time.monotonic()
+    deadline = writer.tick_deadline()
+    results = [writer.submit(tmp_path / f"m{i}.jsonl", entry(i), deadline) for i in range(10)]
+    assert not any(results)
+    assert time.monotonic() - started < 0.6
+    assert writer.dropped == 10
+
+
+def test_flush_after_flush_records(tmp_path):
+    storage = MemoryStorage()
+    writer = LogWriter(storage, flush_records=3, flush_interval=60).start()
+    try:
+        for i in range(3):
+            assert writer.submit(tmp_path / "a.jsonl", entry(i))
+        wait_for(lambda: writer.written == 3)
+        assert [r['i'] for r in storage.records[tmp_path / "a.jsonl"]] == [0, 1, 2]
+        assert storage.commits == 1
+    finally:
+        writer.close()
+
+
+def test_flush_after_flush_interval(tmp_path):
+    storage = MemoryStorage()
+    writer = LogWriter(storage, flush_records=1000, flush_interval=0.1).start()
+    try:
+        writer.submit(tmp_path / "a.jsonl", entry(0))
+        wait_for(lambda: writer.written == 1, timeout=2.0)
+    finally:
+        writer.close()
+
+
+def test_close_drains_queue(tmp_path):
+    storage = MemoryStorage()
+    storage.release.clear()
+    writer = LogWriter(storage, flush_records=2, flush_interval=60).start()
+
+    # Первая пачка застряла в append_many, остальные записи ждут в очереди
+    for i in range(7):
+        assert writer.submit(tmp_path / ("a.jsonl" if i % 2 else "b.jsonl"), entry(i))
+    storage.release.set()
+    writer.close()
+
+    written = storage.records[tmp_path / "a.jsonl"] + storage.records[tmp_path / "b.jsonl"]
+    assert sorted(r['i'] for r in written) == list(range(7))
+    assert writer.stats()['written'] == 7
+    assert writer.queue_size() == 0
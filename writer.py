@@ -0,0 +1,188 @@
+"""
+Отдельный поток записи логов.
+
+Мониторы только кладут записи в ограниченную очередь, а запись на диск
+выполняет один поток: записи группируются по файлам и сбрасываются пачкой,
+когда накопилось `flush_records` записей или прошло `flush_interval` секунд.
+Так задержка диска не сдвигает моменты опроса цен.
+
+При заполнении очереди submit() ждет не дольше `block_timeout` секунд
+(backpressure), после чего запись отбрасывается и учитывается в `dropped`.
+Пакетные циклы передают всем записям тика общий срок `deadline`
+(см. tick_deadline()), чтобы полная очередь задерживала тик не больше чем
+на `block_timeout`, а не на `block_timeout` для каждого рынка.
+"""
+import queue
+import time
+from pathlib import Path
+from threading import Thread, Lock
+from typing import Dict, Any, Optional, List
+
+from storage import LogStorage, PathLike
+from metrics import get_metrics
+
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Args:
+        storage: Бэкенд хранения
+        max_queue: Максимальный размер очереди записей
+        flush_records: Сброс на диск после стольких записей
+        flush_interval: Сброс на диск не реже, чем раз в столько секунд
+        block_timeout: Сколько ждать места в очереди перед отбрасыванием записи
+    """
+
+    def __init__(self, storage: LogStorage, max_queue: int = 10000, flush_records: int = 500,
+                 flush_interval: float = 1.0, block_timeout: float = 0.5):
+        self.storage = storage
+        self.flush_records = max(1, int(flush_records))
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._thread: Optional[Thread] = None
+        self._stats_lock = Lock()
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.flushes = 0
+
+    @classmethod
+    def from_settings(cls, storage: LogStorage, settings: Optional[Dict[str, Any]] = None) -> "LogWriter":
+        """Создание потока записи по разделу `settings` конфигурации"""
+        settings = settings or {}
+        return cls(
+            storage,
+            max_queue=settings.get('writer_queue_size', 10000),
+            flush_records=settings.get('writer_flush_records', 500),
+            flush_interval=settings.get('writer_flush_interval_seconds', 1.0),
+            block_timeout=settings.get('writer_block_timeout_seconds', 0.5),
+        )
+
+    def start(self) -> "LogWriter":
+        if self._thread is None:
+            get_metrics().writer_queue.set_function(self.queue_size)
+            self._thread = Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def tick_deadline(self) -> float:
+        """Общий срок ожидания места в очереди для всех записей одного тика (time.monotonic)"""
+        return time.monotonic() + self.block_timeout
+
+    def submit(self, path: PathLike, entry: Dict[str, Any], deadline: Optional[float] = None) -> bool:
+        """
+        Постановка записи в очередь. False - очередь заполнена, запись отброшена.
+
+        deadline - момент time.monotonic(), после которого место в очереди не
+        ожидается (по умолчанию - `block_timeout` от вызова).
+        """
+        timeout = self.block_timeout if deadline is None else deadline - time.monotonic()
+        try:
+            if timeout > 0:
+                self._queue.put((Path(path), entry), timeout=timeout)
+            else:
+                self._queue.put_nowait((Path(path), entry))
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            get_metrics().writer_dropped.inc()
+            return False
+
+        with self._stats_lock:
+            self.submitted += 1
+        return True
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    def _flush(self, pending: Dict[Path, List[Dict[str, Any]]]) -> None:
+        started = time.perf_counter()
+        for path, entries in pending.items():
+            try:
+                self.storage.append_many(path, entries)
+                with self._stats_lock:
+                    self.written += len(entries)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += len(entries)
+                print(f"[Writer] Ошибка записи в {path}: {e}")
+        try:
+            # Бэкенды с транзакциями (sqlite) записывают всю пачку одним пакетом
+            self.storage.commit()
+        except Exception as e:
+            print(f"[Writer] Ошибка фиксации пачки: {e}")
+        pending.clear()
+        self.flushes += 1
+        get_metrics().writer_flush.observe(time.perf_counter() - started)
+
+    def _run(self) -> None:
+        pending: Dict[Path, List[Dict[str, Any]]] = {}
+        pending_count = 0
+        last_flush = time.monotonic()
+        stopping = False
+
+        while not stopping:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            # Забираем все, что уже есть в очереди, без ожидания
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    path, entry = item
+                    pending.setdefault(path, []).append(entry)
+                    pending_count += 1
+                if stopping or pending_count >= self.flush_records:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if pending_count and (stopping or pending_count >= self.flush_records
+                                  or time.monotonic() - last_flush >= self.flush_interval):
+                self._flush(pending)
+                pending_count = 0
+                last_flush = time.monotonic()
+            elif not pending_count:
+                last_flush = time.monotonic()
+
+        # Остаток очереди после сигнала остановки
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                pending.setdefault(item[0], []).append(item[1])
+        if pending:
+            self._flush(pending)
+
+    def close(self, timeout: float = 30) -> None:
+        """Запись всех накопленных данных и остановка потока"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            print(f"[Writer] Не удалось дождаться записи (в очереди: {self.queue_size()})")
+        self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'queued': self.queue_size(),
+            }